@@ -0,0 +1,71 @@
+"""Import time of the package in fresh interpreters.
+
+Every case is imported in a new process, as a headless worker started for a
+short task would, and the best wall time of several runs is reported next to
+the time of an interpreter which imports nothing. The "eager" case imports
+the GUI and plotting modules as well, which is what importing any module of
+the package cost while `utils/__init__.py` imported them all.
+
+Run from the repository root:
+
+    python benchmarks/bench_import.py
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("PySimpleGUI", "tkinter", "matplotlib", "scipy")
+
+CASES = [
+    ("interpreter only", "pass"),
+    ("utils.mathematics", "import utils.mathematics"),
+    ("utils.sweep", "import utils.sweep"),
+    (
+        "eager (core, GUI and plots)",
+        "import utils.mathematics, utils.gui, utils.drawing, utils.plots",
+    ),
+]
+
+
+def run(statement):
+    """Runs `statement` in a new interpreter.
+
+    Returns:
+        tuple: The wall time in seconds and the heavy modules it loaded.
+    """
+    code = (
+        f"{statement}\n"
+        "import sys\n"
+        f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))\n"
+    )
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return time.perf_counter() - start, out.strip()
+
+
+def main(repeat=10):
+    print(f"{'case':32} {'best ms':>8} {'median ms':>10}  heavy modules")
+    for name, statement in CASES:
+        try:
+            runs = [run(statement) for _ in range(repeat)]
+        except subprocess.CalledProcessError as e:
+            print(f"{name:32} failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        times = sorted(t for t, _ in runs)
+        print(
+            f"{name:32} {times[0] * 1e3:8.1f} {times[len(times) // 2] * 1e3:10.1f}"
+            f"  {runs[0][1] or '-'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
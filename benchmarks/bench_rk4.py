@@ -0,0 +1,156 @@
+"""Per-step timing of the fused scalar RK4 kernel against the previous loop.
+
+The cases run without the multiwave term, whose delayed value the previous
+loop looked up by step index instead of by time, so both loops must give
+bit-identical results.
+
+Run from the repository root:
+
+    python benchmarks/bench_rk4.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.models  # noqa: E402
+from utils.mathematics import solve_SIR, solve_SIR_with_vaccination  # noqa: E402
+
+
+def legacy_solve_SIR(time_range, y0, with_multiwave, t_3, **args):
+    """The array-per-stage loop `solve_SIR` used before the fused kernel."""
+    f = utils.models.SIR
+    dt = 1
+    time_points = np.arange(time_range[0], time_range[1], dt)
+    S, I, R = (np.zeros(shape=(len(time_points))) for _ in range(3))
+    S[0] = y0[0]
+    I[0] = y0[1]
+    R[0] = y0[2]
+
+    args["R_prev"] = 0
+    for t in range(len(time_points) - 1):
+        dt2 = dt / 2
+        prev_y = np.array([S[t], I[t], R[t]])
+        if with_multiwave is True and t >= t_3:
+            args["R_prev"] = R[t - t_3]
+        k1 = np.array(f(t, prev_y, **args))
+        k2 = np.array(f(t + dt2, prev_y + dt2 * k1, **args))
+        k3 = np.array(f(t + dt2, prev_y + dt2 * k2, **args))
+        k4 = np.array(f(t + dt, prev_y + dt * k3, **args))
+        new_y = np.maximum(prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0)
+        S[t + 1] = new_y[0]
+        I[t + 1] = new_y[1]
+        R[t + 1] = new_y[2]
+
+    return np.array([S, I, R])
+
+
+def legacy_solve_SIR_with_vaccination(
+    time_range, y0, t_1, t_2, with_multiwave, t_3, **args
+):
+    """The array-per-stage loop `solve_SIR_with_vaccination` used before."""
+    f = utils.models.SIR_with_vaccination
+    dt = 0.05
+    time_points = np.arange(time_range[0], time_range[1], dt)
+    S, I, R = (np.zeros(shape=(len(time_points))) for _ in range(3))
+    S[0] = y0[0]
+    I[0] = y0[1]
+    R[0] = y0[2]
+
+    population = np.sum(y0)
+
+    args["R_prev"] = 0
+    args["population"] = population
+    vac_rate = args["vac_rate"]
+    for t in range(len(time_points) - 1):
+        curr_t = time_points[t]
+        dt2 = dt / 2
+        prev_y = np.array([S[t], I[t], R[t]])
+        if t_1 <= curr_t < t_2 + 1:
+            args["vac_rate"] = vac_rate
+        else:
+            args["vac_rate"] = 0
+        if with_multiwave and curr_t >= t_3:
+            args["R_prev"] = R[t - t_3]
+        k1 = np.array(f(curr_t, prev_y, **args))
+        k2 = np.array(f(curr_t + dt2, prev_y + dt2 * k1, **args))
+        k3 = np.array(f(curr_t + dt2, prev_y + dt2 * k2, **args))
+        k4 = np.array(f(curr_t + dt, prev_y + dt * k3, **args))
+        S[t + 1], I[t + 1], R[t + 1] = np.maximum(
+            prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0
+        )
+        if S[t + 1] >= population:
+            S[t + 1] = population
+        elif I[t + 1] >= population:
+            I[t + 1] = population
+        elif R[t + 1] >= population:
+            R[t + 1] = population
+
+    return np.array([S, I, R])
+
+
+def per_step(func, n_steps, repeat=5):
+    """Returns the best per-step wall time of `func` in microseconds."""
+    number = 1
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return best / number / n_steps * 1e6
+
+
+def main():
+    y0 = [1e6, 1, 0]
+    cases = [
+        (
+            "solve_SIR, 365 days",
+            364,
+            lambda: legacy_solve_SIR(
+                (0, 365), y0, False, 30, beta=4e-7, gamma=0.2, a=0.01
+            ),
+            lambda: solve_SIR((0, 365), y0, False, 30, beta=4e-7, gamma=0.2, a=0.01),
+        ),
+        (
+            "solve_SIR_with_vaccination, 365 days",
+            7299,
+            lambda: legacy_solve_SIR_with_vaccination(
+                (0, 365),
+                y0,
+                50,
+                70,
+                False,
+                30,
+                beta=4e-7,
+                gamma=0.2,
+                eff=0.9,
+                vac_rate=2e4,
+                a=0.01,
+            ),
+            lambda: solve_SIR_with_vaccination(
+                (0, 365),
+                y0,
+                50,
+                70,
+                False,
+                30,
+                beta=4e-7,
+                gamma=0.2,
+                eff=0.9,
+                vac_rate=2e4,
+                a=0.01,
+            ),
+        ),
+    ]
+    print(f"{'case':40} {'legacy us/step':>15} {'fused us/step':>15} {'speedup':>8}")
+    for name, n_steps, legacy, fused in cases:
+        assert np.array_equal(legacy(), fused().y), name
+        legacy_us = per_step(legacy, n_steps)
+        fused_us = per_step(fused, n_steps)
+        print(
+            f"{name:40} {legacy_us:15.2f} {fused_us:15.2f} {legacy_us / fused_us:7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
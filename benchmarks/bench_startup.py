@@ -0,0 +1,117 @@
+"""Time from launching model.pyw to a usable window and to the figure.
+
+model.pyw is started with ``SIR_MODEL_STARTUP_PROBE`` set, which makes it
+print a line when its window is shown and another when the interactive
+figure is drawn, and then exit. The first launch uses an empty cache
+directory, so it builds the figure before showing the window and renders the
+startup snapshot. The following launches show the snapshot right away and
+build the figure in the background. Needs a display.
+
+With ``--headless`` the same path runs without PySimpleGUI or a display: a
+script solves the default scenario and draws its figure with the Agg
+backend, and looks up or renders the snapshot as model.pyw does. The window
+stage then excludes creating the window and showing the snapshot on it.
+`suite.py` records the headless startup with the other benchmarks.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --headless
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The startup of model.pyw up to its window, without the window
+HEADLESS = """
+from utils.snapshot import load_snapshot, save_snapshot
+
+params = {
+    "time_range": [0, 150],
+    "y0": [1e6, 1, 0],
+    "beta": 4e-7,
+    "gamma": 0.2,
+    "with_multiwave": False,
+    "a": 0,
+    "t_3": 30,
+}
+
+
+def build():
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from utils.mathematics import solve_SIR
+    import utils.plots
+
+    sol = solve_SIR((0, 150), params["y0"], False, 30, beta=4e-7, gamma=0.2, a=0)
+    overlay = utils.plots.OverlayFigure()
+    overlay.add(sol, sol.t, 4e-7, 0.2)
+    FigureCanvasAgg(overlay.fig).draw()
+    return overlay
+
+
+if load_snapshot(params) is None:
+    overlay = build()
+    print("window", flush=True)
+    print("figure", flush=True)
+    save_snapshot(overlay.fig, params)
+else:
+    print("window", flush=True)
+    build()
+    print("figure", flush=True)
+"""
+
+
+def launch(cache_dir, headless=False):
+    """Starts model.pyw and times the lines it prints.
+
+    Args:
+        cache_dir (str): The cache directory of the snapshot
+        headless (bool): Runs `HEADLESS` instead of model.pyw
+
+    Returns:
+        dict: Seconds from launch to each reported stage.
+    """
+    env = dict(os.environ, SIR_MODEL_STARTUP_PROBE="1", SIR_MODEL_CACHE_DIR=cache_dir)
+    if headless:
+        command, env["MPLBACKEND"] = [sys.executable, "-c", HEADLESS], "Agg"
+    else:
+        command = [sys.executable, "model.pyw"]
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    stages = {}
+    for line in process.stdout:
+        stages[line.split()[0]] = time.perf_counter() - start
+    if process.wait():
+        raise RuntimeError(f"{command[1]} exited with {process.returncode}")
+    return stages
+
+
+def main(repeat=5, headless=False):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        runs = [("cold", launch(cache_dir, headless))]
+        runs += [("warm", launch(cache_dir, headless)) for _ in range(repeat)]
+    print(f"{'run':6} {'window ms':>10} {'figure ms':>10}")
+    for name, stages in runs:
+        print(f"{name:6} {stages['window'] * 1e3:10.1f} {stages['figure'] * 1e3:10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the startup of model.pyw.")
+    parser.add_argument(
+        "--headless", action="store_true", help="time the startup without a window"
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="number of warm runs")
+    args = parser.parse_args()
+    main(args.repeat, args.headless)
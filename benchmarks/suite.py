@@ -0,0 +1,373 @@
+"""Benchmark suite of the solver, plotting and GUI redraw hot paths.
+
+Every case is timed several times after a warm-up run, and run once more
+under tracemalloc for the peak of the memory it allocates. The results are
+appended as one JSON line per run to a history file, together with the
+commit, the versions and the machine, and compared with the last run of the
+same machine so regressions between commits stand out.
+
+The cases cover:
+
+- ``solve_SIR`` (fixed step of 1 day) and ``solve_SIR_with_vaccination``
+  with its fixed step of 0.05 days ("rk4") and its adaptive integrator
+  ("RK45"), over several horizons with and without multiwave
+- ``find_max_and_argmax`` on trajectories of those lengths
+- ``plot_SIR`` on a fresh figure and on an overlay of four runs
+- ``draw_fig`` rebuilding the canvas and redrawing it, on the display in
+  ``DISPLAY`` or on a virtual one started with Xvfb; skipped without either
+- the startup of model.pyw up to its window and its figure, with and without
+  the cached snapshot, in the headless run of `bench_startup`
+
+Run from the repository root:
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --filter solve_SIR --check
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matplotlib  # noqa: E402
+import numpy as np  # noqa: E402
+
+import utils.mathematics as mat  # noqa: E402
+
+HISTORY = os.path.join(ROOT, "benchmarks", "history.jsonl")
+HORIZONS = (150, 365, 1825)
+Y0 = [1e6, 1, 0]
+SIR = dict(beta=4e-7, gamma=0.2, a=0.01)
+VACCINATION = dict(SIR, eff=0.9, vac_rate=2e4)
+
+
+def solver_cases():
+    """Yields the solver cases as (name, params, setup) triples."""
+    for days in HORIZONS:
+        for multiwave in (False, True):
+            yield (
+                f"solve_SIR/{days}d/multiwave={multiwave}",
+                {"days": days, "multiwave": multiwave, "dt": 1},
+                lambda days=days, multiwave=multiwave: lambda: mat.solve_SIR(
+                    (0, days), Y0, multiwave, 30, **SIR
+                ),
+            )
+            for method in ("rk4", "RK45"):
+                yield (
+                    f"solve_SIR_with_vaccination/{days}d/{method}"
+                    f"/multiwave={multiwave}",
+                    {
+                        "days": days,
+                        "multiwave": multiwave,
+                        "method": method,
+                        "dt": 0.05 if method == "rk4" else None,
+                    },
+                    lambda days=days, multiwave=multiwave, method=method: (
+                        lambda: mat.solve_SIR_with_vaccination(
+                            (0, days),
+                            Y0,
+                            50,
+                            70,
+                            multiwave,
+                            30,
+                            method=method,
+                            **VACCINATION,
+                        )
+                    ),
+                )
+
+
+def peak_cases():
+    """Yields the `find_max_and_argmax` cases."""
+    for days in HORIZONS:
+
+        def setup(days=days):
+            sol = mat.solve_SIR_with_vaccination(
+                (0, days), Y0, 50, 70, True, 30, **VACCINATION
+            )
+            return lambda: mat.find_max_and_argmax(sol.t, sol.y[1])
+
+        yield (
+            f"find_max_and_argmax/{days}d",
+            {"days": days, "points": int(days / 0.05)},
+            setup,
+        )
+
+
+def plot_cases():
+    """Yields the `plot_SIR` cases, on a fresh figure and on an overlay."""
+    import utils.plots as plots
+
+    sol = mat.solve_SIR_with_vaccination((0, 365), Y0, 50, 70, True, 30, **VACCINATION)
+
+    def fresh():
+        return lambda: plots.plot_SIR(sol, sol.t, 4e-7, 0.2)
+
+    def overlay():
+        plots.plot_SIR(sol, sol.t, 4e-7, 0.2)
+        for _ in range(3):
+            plots.plot_SIR(sol, sol.t, 4e-7, 0.2, already_plotted=True)
+        return lambda: plots.plot_SIR(sol, sol.t, 4e-7, 0.2, already_plotted=True)
+
+    yield "plot_SIR/fresh", {"days": 365}, fresh
+    yield "plot_SIR/overlay", {"days": 365, "runs": 4}, overlay
+
+
+def start_display():
+    """Makes sure a display is available for Tk.
+
+    Returns:
+        tuple: Whether a display is available and the Xvfb process started
+            for it, if any.
+    """
+    if os.environ.get("DISPLAY"):
+        return True, None
+    if not shutil.which("Xvfb"):
+        return False, None
+    display = f":{100 + os.getpid() % 400}"
+    process = subprocess.Popen(
+        ["Xvfb", display, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    os.environ["DISPLAY"] = display
+    # Xvfb accepts connections shortly after it starts.
+    import tkinter as tk
+
+    for _ in range(50):
+        try:
+            tk.Tk().destroy()
+            return True, process
+        except tk.TclError:
+            time.sleep(0.1)
+    process.terminate()
+    return False, None
+
+
+def draw_cases():
+    """Yields the `draw_fig` cases, which draw on a Tk canvas."""
+    import tkinter as tk
+
+    import utils.drawing as drawing
+    import utils.plots as plots
+
+    sol = mat.solve_SIR_with_vaccination((0, 365), Y0, 50, 70, True, 30, **VACCINATION)
+    fig = plots.plot_SIR(sol, sol.t, 4e-7, 0.2)
+    root = tk.Tk()
+    canvas = tk.Canvas(root, width=1000, height=800)
+    canvas.pack()
+    toolbar = tk.Frame(root)
+    toolbar.pack()
+
+    def new():
+        def run():
+            drawing.draw_fig(canvas, fig, toolbar)
+            root.update()
+
+        return run
+
+    def redraw():
+        figure_canvas_agg = drawing.draw_fig(canvas, fig, toolbar)
+        root.update()
+
+        def run():
+            drawing.draw_fig(canvas, fig, toolbar, figure_canvas_agg)
+            root.update()
+
+        return run
+
+    yield "draw_fig/new", {"days": 365}, new
+    yield "draw_fig/redraw", {"days": 365}, redraw
+
+
+def reports_time(run):
+    """Marks the function of a case which returns its own time in seconds,
+    such as the time a subprocess took to reach a stage. That time is
+    recorded instead of the wall time of the call, and the allocations of
+    the case, made in another process, are not measured."""
+    run.reports_time = True
+    return run
+
+
+def startup_cases():
+    """Yields the startup cases, which launch the headless startup of
+    `bench_startup` in new interpreters."""
+    from benchmarks import bench_startup
+
+    def cold():
+        @reports_time
+        def run():
+            with tempfile.TemporaryDirectory() as cache_dir:
+                return bench_startup.launch(cache_dir, headless=True)["window"]
+
+        return run
+
+    def warm(stage):
+        cache_dir = tempfile.TemporaryDirectory()
+        # Renders the snapshot the following launches show
+        bench_startup.launch(cache_dir.name, headless=True)
+
+        @reports_time
+        def run():
+            return bench_startup.launch(cache_dir.name, headless=True)[stage]
+
+        # Keeps the directory until the case is done
+        run.cache_dir = cache_dir
+        return run
+
+    yield "startup/cold/window", {"snapshot": False}, cold
+    yield "startup/warm/window", {"snapshot": True}, lambda: warm("window")
+    yield "startup/warm/figure", {"snapshot": True}, lambda: warm("figure")
+
+
+def measure(setup, repeat, min_time=0.2):
+    """Times a case and measures the peak of the memory it allocates.
+
+    Args:
+        setup (function): Prepares the case and returns the function to time
+        repeat (int): Least number of timed runs
+        min_time (float): Least total time of the timed runs in seconds
+
+    Returns:
+        dict: The best and median wall times in seconds, the number of timed
+            runs and the peak of the traced allocations in bytes, None for a
+            case which reports its own time (see `reports_time`).
+    """
+    run = setup()
+    own_time = getattr(run, "reports_time", False)
+    run()
+    times = []
+    while len(times) < repeat or (sum(times) < min_time and len(times) < 100):
+        start = time.perf_counter()
+        reported = run()
+        times.append(reported if own_time else time.perf_counter() - start)
+    peak = None
+    if not own_time:
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {
+        "wall_min": min(times),
+        "wall_median": statistics.median(times),
+        "repeat": len(times),
+        "peak_bytes": peak,
+    }
+
+
+def environment():
+    """Describes the commit, the versions and the machine of a run."""
+
+    def git(*args):
+        try:
+            return subprocess.run(
+                ["git", *args], cwd=ROOT, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "machine": f"{platform.node()} {platform.machine()} {os.cpu_count()} cpus",
+    }
+
+
+def last_run(path, machine):
+    """Returns the last run of a machine recorded in a history file, if any."""
+    last = None
+    try:
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record["environment"]["machine"] == machine:
+                    last = record
+    except OSError:
+        pass
+    return last
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the benchmark suite.")
+    parser.add_argument("--filter", default="", help="run the cases containing this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--history", default=HISTORY, help="JSON lines history file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.1,
+        help="slowdown against the last run reported as a regression",
+    )
+    parser.add_argument(
+        "--check", action="store_true", help="exit with 1 if a case regressed"
+    )
+    parser.add_argument("--no-save", action="store_true", help="do not record the run")
+    args = parser.parse_args(argv)
+
+    env = environment()
+    previous = last_run(args.history, env["machine"])
+    previous = previous["results"] if previous else {}
+
+    groups = [solver_cases, peak_cases, plot_cases, startup_cases]
+    display, xvfb = start_display()
+    if display:
+        groups.append(draw_cases)
+    else:
+        print("draw_fig cases skipped: no DISPLAY and no Xvfb", file=sys.stderr)
+
+    results, regressions = {}, []
+    print(f"{'case':58} {'min ms':>9} {'median ms':>10} {'peak KiB':>9} {'vs last':>8}")
+    try:
+        for group in groups:
+            for name, params, setup in group():
+                if args.filter not in name:
+                    continue
+                result = {"params": params, **measure(setup, args.repeat)}
+                results[name] = result
+                change = ""
+                if name in previous:
+                    ratio = result["wall_min"] / previous[name]["wall_min"]
+                    change = f"{ratio:7.2f}x"
+                    if ratio > args.threshold:
+                        regressions.append(name)
+                        change += " !"
+                peak = result["peak_bytes"]
+                peak = "-" if peak is None else f"{peak / 1024:.0f}"
+                print(
+                    f"{name:58} {result['wall_min'] * 1e3:9.2f} "
+                    f"{result['wall_median'] * 1e3:10.2f} {peak:>9} {change:>8}"
+                )
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+
+    if not args.no_save:
+        with open(args.history, "a") as f:
+            f.write(json.dumps({"environment": env, "results": results}) + "\n")
+    if regressions:
+        print(f"{len(regressions)} cases slower than the last run:", file=sys.stderr)
+        for name in regressions:
+            print(f"  {name}", file=sys.stderr)
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
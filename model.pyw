@@ -1,19 +1,20 @@
+import time
+
+launched = time.time()
+
 import platform
 import PySimpleGUI as sg
-import numpy as np
 import os
 import importlib
+import pickle as pkl
 
-from utils.drawing import (
-    create_updated_fig_SIR,
-    create_updated_fig_SIR_with_vaccination,
-    delete_figure_agg,
-    draw_fig,
-)
+import utils
+from utils import instrument
 from utils.icon import icon
-from utils.gui import layout
-from utils.mathematics import solve_SIR
-from utils.plots import plot_SIR
+from utils.gui import create_main_layout
+from utils.mathematics import solve_SIR, vaccinations_finished_day
+from utils.snapshot import load_snapshot, save_snapshot, show_snapshot
+from utils.worker import Worker
 from utils.validation import (
     validate_positive_float_input,
     validate_positive_int_input,
@@ -39,35 +40,63 @@ else:
     icon = "icon.ico"
 
 
-def set_scale(scale):
-    root = sg.tk.Tk()
-    root.tk.call("tk", "scaling", scale)
-    root.destroy()
+# With SIR_MODEL_STARTUP_PROBE set, the times from launch to the window and
+# to the interactive figure are printed and the program exits (see
+# benchmarks/bench_startup.py).
+probe = bool(os.environ.get("SIR_MODEL_STARTUP_PROBE"))
+
+
+def report_startup(stage):
+    if probe:
+        print(f"{stage} {time.time() - launched:.4f}", flush=True)
 
 
 # Default values and initial plot
 beta = 4e-7
 gamma = 0.2
 y0 = [1e6, 1, 0]
+defaults = {
+    "time_range": [0, 150],
+    "y0": y0,
+    "beta": beta,
+    "gamma": gamma,
+    "with_multiwave": False,
+    "a": 0,
+    "t_3": 30,
+}
+
 
-# Solve the ODEs
-sol = solve_SIR((0, 150), y0, beta=beta, gamma=gamma, with_multiwave=False, a=0, t_3=30)
+def create_initial_figure(job=None):
+    """Solves the default scenario and plots it on a new overlay."""
+    sol = solve_SIR(
+        (0, 150), y0, beta=beta, gamma=gamma, with_multiwave=False, a=0, t_3=30
+    )
+    overlay = utils.plots.OverlayFigure()
+    overlay.add(sol, sol.t, beta, gamma)
+    # Imports the Tk backend off the Tk thread when run in the background.
+    utils.drawing
+    return overlay
 
-# Plot the solution
-fig = plot_SIR(sol, sol.t, beta, gamma)
-del plot_SIR
-set_scale(fig.dpi / 75)
+
+# The cached snapshot of the default scenario is shown while the figure is
+# built in the background; without one, the figure is built right away.
+snapshot = load_snapshot(defaults)
+if snapshot is None:
+    overlay = create_initial_figure()
+    sg.set_options(scaling=overlay.fig.dpi / 75)
+else:
+    overlay = None
+    sg.set_options(scaling=snapshot["dpi"] / 75)
 
 # GUI
 sg.theme("DarkGrey5")
 with_vaccinations = False
 with_multiwave = False
-already_plotted = True
 
 
 window = sg.Window(
     title="SIR model",
-    layout=layout,
+    layout=create_main_layout(),
     element_justification="c",
     icon=icon,
     resizable=True,
@@ -75,19 +104,70 @@ window = sg.Window(
 )
 
 # Insert initial figure into canvas
-fig_agg = draw_fig(window["-CANVAS-"].TKCanvas, fig, window["-TOOLBAR-"].TKCanvas)
+startup = Worker(window, key="-STARTUP-")
+if overlay is None:
+    fig_agg = None
+    show_snapshot(window["-CANVAS-"].TKCanvas, snapshot["path"])
+    startup.submit(create_initial_figure)
+    window.refresh()
+    report_startup("window")
+else:
+    fig_agg = utils.drawing.draw_fig(
+        window["-CANVAS-"].TKCanvas, overlay.fig, window["-TOOLBAR-"].TKCanvas
+    )
+    window.refresh()
+    report_startup("window")
+    report_startup("figure")
+    save_snapshot(overlay.fig, defaults)
+
+# Solves run on a background worker; `request` holds the parameters of the
+# latest one, which are needed to plot its solution, and `live` draws its
+# chunks while it runs.
+worker = Worker(window)
+request = None
+live = None
+live_generation = None
+
+
+def show_progress(visible):
+    window["-PROGRESS-"].update(current_count=0)
+    window["progress_row"].update(visible=visible)
+    window.visibility_changed()
+
+
+def stop_live_plot():
+    global live
+    if live is not None:
+        live.close()
+        live = None
 
 
 # Main loop
 while True:
+    if probe and fig_agg is not None:
+        window.close()
+        break
     event, values = window.read()
     if event in (None, "Exit"):
-        try:
-            os.remove(".fig.pkl")
-        except (FileNotFoundError, OSError):
-            pass
+        worker.cancel()
         window.close()
         break
+    if event == startup.key:
+        generation, kind, payload = values[event]
+        if kind == "error":
+            sg.popup_error(
+                "The simulation failed:\n" + str(payload), title="Error", icon=icon
+            )
+        elif overlay is None:
+            overlay = payload
+            fig_agg = utils.drawing.draw_fig(
+                window["-CANVAS-"].TKCanvas,
+                overlay.fig,
+                window["-TOOLBAR-"].TKCanvas,
+                fig_agg,
+            )
+            window.refresh()
+            report_startup("figure")
     if event == "with_vaccinations":
         with_vaccinations = not with_vaccinations
         window["vaccination_rate_row"].update(visible=with_vaccinations)
@@ -103,32 +183,77 @@ while True:
         window.visibility_changed()
         window.refresh()
     if event == "-CLEAR-":
-        delete_figure_agg(fig_agg)
-        try:
-            os.remove(".fig.pkl")
-        except (FileNotFoundError, OSError):
-            pass
-        already_plotted = False
+        worker.cancel()
+        show_progress(False)
+        stop_live_plot()
+        if overlay is not None:
+            overlay.clear()
+        if fig_agg is not None:
+            fig_agg.draw_idle()
+    if event == "-SAVE-":
+        path = sg.popup_get_file(
+            "Save the plots to",
+            save_as=True,
+            default_extension=".pkl",
+            file_types=(("Plots", "*.pkl"),),
+            icon=icon,
+        )
+        if path and overlay is not None:
+            overlay.save(path)
+    if event == "-LOAD-":
+        path = sg.popup_get_file(
+            "Load the plots from", file_types=(("Plots", "*.pkl"),), icon=icon
+        )
+        if path:
+            try:
+                restored = utils.plots.OverlayFigure.restore(path)
+            except (OSError, EOFError, AttributeError, pkl.UnpicklingError) as e:
+                sg.popup_error(
+                    "Could not load the plots:\n" + str(e), title="Error", icon=icon
+                )
+            else:
+                worker.cancel()
+                show_progress(False)
+                stop_live_plot()
+                overlay = restored
+                fig_agg = utils.drawing.draw_fig(
+                    window["-CANVAS-"].TKCanvas,
+                    overlay.fig,
+                    window["-TOOLBAR-"].TKCanvas,
+                    fig_agg,
+                )
+
+    if event in ("-PROFILE-", "-PROFILE_ALLOC-"):
+        if values["-PROFILE-"]:
+            instrument.enable(
+                alloc=values["-PROFILE_ALLOC-"], path=instrument.trace_path()
+            )
+        else:
+            instrument.disable()
 
     if event == "-DRAW-" and with_vaccinations:
-        delete_figure_agg(fig_agg)
         try:
-            validate_positive_float_input(values["susceptible"], "susceptible")
-            validate_positive_float_input(values["infectious"], "infectious")
-            validate_positive_float_input(values["recovered"], "recovered")
-            validate_positive_float_input(values["beta"], "beta")
-            validate_positive_int_input(values["recovery_time"], "recovery time")
-            validate_positive_int_input(values["duration"], "duration")
-            validate_pos_float_under_one(values["sw_a"], "a")
-            validate_positive_int_input(values["sw_start"], "immunity loss start")
-            validate_positive_float_input(
-                values["vaccination_rate"], "vaccination rate"
-            )
-            validate_pos_float_under_one(values["vaccination_eff"], "vaccination eff")
-            validate_positive_int_input(
-                values["vaccination_start"], "vaccination start"
-            )
-            validate_positive_int_input(values["vaccination_end"], "vaccination end")
+            with instrument.span("validate"):
+                validate_positive_float_input(values["susceptible"], "susceptible")
+                validate_positive_float_input(values["infectious"], "infectious")
+                validate_positive_float_input(values["recovered"], "recovered")
+                validate_positive_float_input(values["beta"], "beta")
+                validate_positive_int_input(values["recovery_time"], "recovery time")
+                validate_positive_int_input(values["duration"], "duration")
+                validate_pos_float_under_one(values["sw_a"], "a")
+                validate_positive_int_input(values["sw_start"], "immunity loss start")
+                validate_positive_float_input(
+                    values["vaccination_rate"], "vaccination rate"
+                )
+                validate_pos_float_under_one(
+                    values["vaccination_eff"], "vaccination eff"
+                )
+                validate_positive_int_input(
+                    values["vaccination_start"], "vaccination start"
+                )
+                validate_positive_int_input(
+                    values["vaccination_end"], "vaccination end"
+                )
 
             S = int(float(values["susceptible"]))
             I = int(float(values["infectious"]))
@@ -146,79 +271,46 @@ while True:
             vac_start = int(values["vaccination_start"])
             vac_end = int(values["vaccination_end"])
 
-            if already_plotted:
-                figure, sol = create_updated_fig_SIR_with_vaccination(
-                    S,
-                    I,
-                    R,
-                    t_1,
-                    beta,
-                    gamma,
-                    vac_eff,
-                    vac_rate,
-                    vac_start,
-                    vac_end,
-                    with_multiwave,
-                    sw_a,
-                    sw_start,
-                    already_plotted,
-                )
-                fig_agg = draw_fig(
-                    window["-CANVAS-"].TKCanvas, figure, window["-TOOLBAR-"].TKCanvas
-                )
-            else:
-                figure, sol = create_updated_fig_SIR_with_vaccination(
-                    S,
-                    I,
-                    R,
-                    t_1,
-                    beta,
-                    gamma,
-                    vac_eff,
-                    vac_rate,
-                    vac_start,
-                    vac_end,
-                    with_multiwave,
-                    sw_a,
-                    sw_start,
-                )
-                fig_agg = draw_fig(
-                    window["-CANVAS-"].TKCanvas, figure, window["-TOOLBAR-"].TKCanvas
-                )
-                already_plotted = True
-            msg = ""
-            if not with_multiwave and vac_rate:
-                indexes = np.where(
-                    sol.y[
-                        0,
-                        np.searchsorted(sol.t, vac_start) : np.searchsorted(
-                            sol.t, vac_end
-                        ),
-                    ]
-                    < vac_rate * vac_eff
-                )
-                if indexes[0].size:
-                    first_zero = sol.t[indexes[0][0]]
-                    msg += (
-                        f"Vaccinations finished on day: {int(first_zero+vac_start)}\n"
-                    )
-                    sg.popup_ok(msg, title="Vaccinations", icon=icon)
-
+            request = {
+                "beta": beta,
+                "gamma": gamma,
+                "t_1": t_1,
+                "with_multiwave": with_multiwave,
+                "population": S + I + R,
+                "vaccinations": (vac_rate, vac_eff, vac_start, vac_end),
+            }
+            worker.submit(
+                utils.drawing.solve_updated_SIR_with_vaccination,
+                S,
+                I,
+                R,
+                t_1,
+                beta,
+                gamma,
+                vac_eff,
+                vac_rate,
+                vac_start,
+                vac_end,
+                with_multiwave,
+                sw_a,
+                sw_start,
+            )
+            show_progress(True)
         except ValueError as e:
             sg.popup_error(
                 "Invalid input:\n" + str(e), title="Invalid parameters", icon=icon
             )
     elif event == "-DRAW-":
-        delete_figure_agg(fig_agg)
         try:
-            validate_positive_float_input(values["susceptible"], "susceptible")
-            validate_positive_float_input(values["infectious"], "infectious")
-            validate_positive_float_input(values["recovered"], "recovered")
-            validate_positive_float_input(values["beta"], "beta")
-            validate_positive_int_input(values["recovery_time"], "recovery time")
-            validate_positive_int_input(values["duration"], "duration")
-            validate_pos_float_under_one(values["sw_a"], "a")
-            validate_positive_int_input(values["sw_start"], "immunity loss start")
+            with instrument.span("validate"):
+                validate_positive_float_input(values["susceptible"], "susceptible")
+                validate_positive_float_input(values["infectious"], "infectious")
+                validate_positive_float_input(values["recovered"], "recovered")
+                validate_positive_float_input(values["beta"], "beta")
+                validate_positive_int_input(values["recovery_time"], "recovery time")
+                validate_positive_int_input(values["duration"], "duration")
+                validate_pos_float_under_one(values["sw_a"], "a")
+                validate_positive_int_input(values["sw_start"], "immunity loss start")
 
             susceptible = int(float(values["susceptible"]))
             infectious = int(float(values["infectious"]))
@@ -231,39 +323,69 @@ while True:
             sw_a = float(values["sw_a"])
             sw_start = int(values["sw_start"])
 
-            if already_plotted:
-                figure = create_updated_fig_SIR(
-                    susceptible,
-                    infectious,
-                    recovered,
-                    t_1,
-                    beta,
-                    gamma,
-                    with_multiwave,
-                    sw_a,
-                    sw_start,
-                    already_plotted,
-                )
-                fig_agg = draw_fig(
-                    window["-CANVAS-"].TKCanvas, figure, window["-TOOLBAR-"].TKCanvas
-                )
-            else:
-                figure = create_updated_fig_SIR(
-                    susceptible,
-                    infectious,
-                    recovered,
-                    t_1,
-                    beta,
-                    gamma,
-                    with_multiwave,
-                    sw_a,
-                    sw_start,
-                )
-                fig_agg = draw_fig(
-                    window["-CANVAS-"].TKCanvas, figure, window["-TOOLBAR-"].TKCanvas
-                )
-                already_plotted = True
+            request = {
+                "beta": beta,
+                "gamma": gamma,
+                "t_1": t_1,
+                "with_multiwave": with_multiwave,
+                "population": susceptible + infectious + recovered,
+                "vaccinations": None,
+            }
+            worker.submit(
+                utils.drawing.solve_updated_SIR,
+                susceptible,
+                infectious,
+                recovered,
+                t_1,
+                beta,
+                gamma,
+                with_multiwave,
+                sw_a,
+                sw_start,
+            )
+            show_progress(True)
         except ValueError as e:
             sg.popup_error(
                 "Invalid input:\n" + str(e), title="Invalid parameters", icon=icon
             )
+
+    if event == worker.key:
+        generation, kind, payload = values[event]
+        if not worker.is_current(generation):
+            continue
+        if kind == "progress":
+            fraction, part = payload
+            window["-PROGRESS-"].update(current_count=int(fraction * 1000))
+            if fig_agg is None:
+                continue
+            if live is None or live_generation != generation:
+                stop_live_plot()
+                lines = overlay.begin_stream((0, request["t_1"]), request["population"])
+                live = utils.drawing.LivePlot(fig_agg, lines)
+                live_generation = generation
+            live.append(part)
+            continue
+        show_progress(False)
+        stop_live_plot()
+        if kind == "error":
+            sg.popup_error(
+                "The simulation failed:\n" + str(payload), title="Error", icon=icon
+            )
+            continue
+
+        sol = payload
+        if overlay is None:
+            overlay = utils.plots.OverlayFigure()
+        figure = overlay.add(sol, sol.t, request["beta"], request["gamma"])
+        fig_agg = utils.drawing.draw_fig(
+            window["-CANVAS-"].TKCanvas,
+            figure,
+            window["-TOOLBAR-"].TKCanvas,
+            fig_agg,
+        )
+        if request["vaccinations"] and not request["with_multiwave"]:
+            vac_rate, vac_eff, vac_start, vac_end = request["vaccinations"]
+            day = vaccinations_finished_day(sol, vac_rate, vac_eff, vac_start, vac_end)
+            if vac_rate and day is not None:
+                msg = f"Vaccinations finished on day {day} of the simulation\n"
+                sg.popup_ok(msg, title="Vaccinations", icon=icon)
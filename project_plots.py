@@ -1,8 +1,35 @@
+"""Figures of the publication, rendered headless into a configurable directory.
+
+The scenarios are solved and the figures rendered in parallel worker
+processes on the Agg backend. Every figure is keyed on a hash of its
+scenarios, the output settings, this script and the model code; figures
+whose key and files are unchanged since the last run are skipped, together
+with the scenarios only they need.
+
+The output directory, formats and resolution come from the command line or
+from a JSON configuration file with the same keys, e.g.
+``{"output": "figures", "formats": ["tif", "pdf"], "dpi": 300}``.
+
+Example:
+    python project_plots.py --config figures.json
+    python project_plots.py --output figures --formats png,pdf --workers 4
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import matplotlib
+
+matplotlib.use("Agg")
+
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 import numpy as np
 from utils.mathematics import find_max_and_argmax
-import platform
 
 
 colors = [
@@ -19,64 +46,163 @@ colors = [
 ]
 
 
-def prepare_data_for_plots():
-    from utils.mathematics import solve_SIR, solve_SIR_with_vaccination
+SCENARIOS = {
+    "basic": (
+        "solve_SIR",
+        dict(
+            time_range=(0, 150),
+            y0=[1e6, 1, 0],
+            with_multiwave=False,
+            t_3=0,
+            beta=4e-7,
+            gamma=0.2,
+            a=0,
+        ),
+    ),
+    "basic_2": (
+        "solve_SIR",
+        dict(
+            time_range=(0, 150),
+            y0=[1e6, 1, 0],
+            with_multiwave=False,
+            t_3=0,
+            beta=2.8571e-7,
+            gamma=0.1429,
+            a=0,
+        ),
+    ),
+    "vaccination_50_71": (
+        "solve_SIR_with_vaccination",
+        dict(
+            time_range=(0, 150),
+            y0=[1e6, 1, 0],
+            t_1=50,
+            t_2=70,
+            with_multiwave=False,
+            t_3=0,
+            beta=4e-7,
+            gamma=0.2,
+            vac_rate=2e4,
+            eff=0.9,
+            a=0,
+        ),
+    ),
+    "vaccination_50_91": (
+        "solve_SIR_with_vaccination",
+        dict(
+            time_range=(0, 150),
+            y0=[1e6, 1, 0],
+            t_1=50,
+            t_2=91,
+            with_multiwave=False,
+            t_3=0,
+            beta=4e-7,
+            gamma=0.2,
+            vac_rate=1e4,
+            eff=0.9,
+            a=0,
+        ),
+    ),
+    "multiwave_30": (
+        "solve_SIR",
+        dict(
+            time_range=(0, 400),
+            y0=[1e6, 1, 0],
+            with_multiwave=True,
+            t_3=30,
+            beta=4e-7,
+            gamma=0.2,
+            a=0.01,
+        ),
+    ),
+    "multiwave_60": (
+        "solve_SIR",
+        dict(
+            time_range=(0, 400),
+            y0=[1e6, 1, 0],
+            with_multiwave=True,
+            t_3=60,
+            beta=4e-7,
+            gamma=0.2,
+            a=0.01,
+        ),
+    ),
+}
 
-    basic_SIR_data = solve_SIR(
-        (0, 150), [1e6, 1, 0], beta=4e-7, gamma=0.2, with_multiwave=False, a=0, t_3=0
-    )
-    basic_SIR_data_2 = solve_SIR(
-        (0, 150),
-        [1e6, 1, 0],
-        beta=2.8571e-7,
-        gamma=0.1429,
-        with_multiwave=False,
-        a=0,
-        t_3=0,
-    )
-    vaccination_comparison_data_50_71 = solve_SIR_with_vaccination(
-        (0, 150),
-        [1e6, 1, 0],
-        4e-7,
-        0.2,
-        2e4,
-        0.9,
-        50,
-        70,
-        False,
-        0,
-        0,
-        t_values=np.linspace(0, 150, 150),
-    )
+DEFAULTS = {"output": "figures", "formats": ["tif", "pdf"], "dpi": 300}
 
-    vaccination_comparison_data_50_91 = solve_SIR_with_vaccination(
-        (0, 150),
-        [1e6, 1, 0],
-        4e-7,
-        0.2,
-        1e4,
-        0.9,
-        50,
-        91,
-        False,
-        0,
-        0,
-        t_values=np.linspace(0, 150, 150),
-    )
-    multiwave_comparison_data_30 = solve_SIR(
-        (0, 400), [1e6, 1, 0], beta=4e-7, gamma=0.2, with_multiwave=True, a=0.01, t_3=30
-    )
-    multiwave_comparison_data_60 = solve_SIR(
-        (0, 400), [1e6, 1, 0], beta=4e-7, gamma=0.2, with_multiwave=True, a=0.01, t_3=60
-    )
-    return (
-        basic_SIR_data.y,
-        basic_SIR_data_2.y,
-        vaccination_comparison_data_50_71.y,
-        vaccination_comparison_data_50_91.y,
-        multiwave_comparison_data_30.y,
-        multiwave_comparison_data_60.y,
-    )
+
+def local_sources(path="project_plots.py"):
+    """Lists a script of the repository and the local modules it imports,
+    directly or through other local modules.
+
+    Imports are read from the code rather than from `sys.modules`, so the
+    list does not depend on what else was imported. The modules `utils`
+    imports on first use only (the GUI and plotting) are not included.
+
+    Args:
+        path (str): The script, relative to the repository root
+
+    Returns:
+        list: The sorted paths, relative to the repository root.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+
+    def module_path(module):
+        base = os.path.join(*module.split("."))
+        for candidate in (base + ".py", os.path.join(base, "__init__.py")):
+            if os.path.exists(os.path.join(root, candidate)):
+                return candidate
+        return None
+
+    found, pending = set(), [path]
+    while pending:
+        source = pending.pop()
+        if source in found:
+            continue
+        found.add(source)
+        with open(os.path.join(root, source), "rb") as f:
+            tree = ast.parse(f.read(), source)
+        # The package a relative import of this file starts from
+        package = [part for part in os.path.dirname(source).split(os.sep) if part]
+        modules = []
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules += [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                parts = package[: len(package) - node.level + 1] if node.level else []
+                base = ".".join(parts + ([node.module] if node.module else []))
+                modules.append(base)
+                modules += [f"{base}.{alias.name}" for alias in node.names]
+        for module in modules:
+            # Importing a module runs the __init__ of its packages first.
+            parts = module.split(".")
+            for n in range(1, len(parts) + 1):
+                candidate = module_path(".".join(parts[:n]))
+                if candidate is not None:
+                    pending.append(candidate)
+    return sorted(found)
+
+
+# Files whose changes invalidate every figure: this script and the model code
+# it runs.
+SOURCES = local_sources()
+
+
+def solve_scenario(name):
+    """Solves a scenario of `SCENARIOS`.
+
+    Args:
+        name (str): The scenario
+
+    Returns:
+        solution: The solution, without its dense output.
+    """
+    import utils.mathematics as mat
+
+    solver, kwargs = SCENARIOS[name]
+    sol = getattr(mat, solver)(**kwargs)
+    return mat.solution(sol.t, sol.y)
 
 
 def plot_basic_SIR(basic_SIR_data):
@@ -84,8 +210,8 @@ def plot_basic_SIR(basic_SIR_data):
     plt.rcParams.update({"font.size": 16})
 
     np.set_printoptions(suppress=True)
-    S, I, R = basic_SIR_data[0, :], basic_SIR_data[1, :], basic_SIR_data[2, :]
-    t = np.linspace(0, 150, 150)
+    S, I, R = basic_SIR_data.y
+    t = basic_SIR_data.t
     beta = 4e-7
     gamma = 0.2
     max_x, max_y = find_max_and_argmax(t, I)
@@ -128,15 +254,7 @@ def plot_basic_SIR(basic_SIR_data):
         handles.append(mpatches.Patch(color="none", label=text))
     plt.legend(handles=handles, framealpha=1, loc="center left")
     plt.tight_layout()
-    plt.savefig(
-        "C:/Users/work/Desktop/optymalizacja-figures/fig_1.tif",
-        facecolor="white",
-        dpi=300,
-    )
-    plt.savefig(
-        "C:/Users/work/Desktop/optymalizacja-figures/fig_1.pdf", facecolor="white"
-    )
-    plt.show()
+    return figure
 
 
 def plot_SIR_with_vaccination_comparison(y_v_1, y_v_2):
@@ -144,9 +262,9 @@ def plot_SIR_with_vaccination_comparison(y_v_1, y_v_2):
     plt.rcParams.update({"font.size": 16})
 
     np.set_printoptions(suppress=True)
-    S_v_1, I_v_1, R_v_1 = y_v_1[0, :], y_v_1[1, :], y_v_1[2, :]
-    S_v_2, I_v_2, R_v_2 = y_v_2[0, :], y_v_2[1, :], y_v_2[2, :]
-    t = np.linspace(0, 150, 150)
+    S_v_1, I_v_1, R_v_1 = y_v_1.y
+    S_v_2, I_v_2, R_v_2 = y_v_2.y
+    t = y_v_1.t
     beta = 4e-7
     gamma = 0.2
     max_x_v_1, max_y_v_1 = find_max_and_argmax(t, I_v_1)
@@ -207,15 +325,7 @@ def plot_SIR_with_vaccination_comparison(y_v_1, y_v_2):
     handles.append(mpatches.Patch(color="none", label=r_tmax_v_2_text))
     plt.legend(handles=handles, handlelength=3, framealpha=1, numpoints=3)
     plt.tight_layout()
-    plt.savefig(
-        "C:/Users/work/Desktop/optymalizacja-figures/fig_2.tif",
-        facecolor="white",
-        dpi=300,
-    )
-    plt.savefig(
-        "C:/Users/work/Desktop/optymalizacja-figures/fig_2.pdf", facecolor="white"
-    )
-    plt.show()
+    return figure
 
 
 def plot_SIR_with_multiwave_comparison(y1, y2):
@@ -223,9 +333,9 @@ def plot_SIR_with_multiwave_comparison(y1, y2):
     plt.rcParams.update({"font.size": 16})
 
     np.set_printoptions(suppress=True)
-    S_1, I_1, R_1 = y1[0, :], y1[1, :], y1[2, :]
-    S_2, I_2, R_2 = y2[0, :], y2[1, :], y2[2, :]
-    t = np.linspace(0, 400, 400)
+    S_1, I_1, R_1 = y1.y
+    S_2, I_2, R_2 = y2.y
+    t = y1.t
     beta = 4e-7
     gamma = 0.2
     max_x_1, max_y_1 = find_max_and_argmax(t, I_1)
@@ -281,15 +391,7 @@ def plot_SIR_with_multiwave_comparison(y1, y2):
         handles=handles, handlelength=3, framealpha=1, numpoints=3, loc="center left"
     )
     plt.tight_layout()
-    plt.savefig(
-        "C:/Users/work/Desktop/optymalizacja-figures/fig_3.tif",
-        facecolor="white",
-        dpi=300,
-    )
-    plt.savefig(
-        "C:/Users/work/Desktop/optymalizacja-figures/fig_3.pdf", facecolor="white"
-    )
-    plt.show()
+    return figure
 
 
 def plot_basic_SIR_param_comp(basic_SIR_data_1, basic_SIR_data_2):
@@ -297,17 +399,9 @@ def plot_basic_SIR_param_comp(basic_SIR_data_1, basic_SIR_data_2):
     plt.rcParams.update({"font.size": 16})
 
     np.set_printoptions(suppress=True)
-    S_1, I_1, R_1 = (
-        basic_SIR_data_1[0, :],
-        basic_SIR_data_1[1, :],
-        basic_SIR_data_1[2, :],
-    )
-    S_2, I_2, R_2 = (
-        basic_SIR_data_2[0, :],
-        basic_SIR_data_2[1, :],
-        basic_SIR_data_2[2, :],
-    )
-    t = np.linspace(0, 150, 150)
+    S_1, I_1, R_1 = basic_SIR_data_1.y
+    S_2, I_2, R_2 = basic_SIR_data_2.y
+    t = basic_SIR_data_1.t
     max_x, max_y = find_max_and_argmax(t, I_1)
     max_x_2, max_y_2 = find_max_and_argmax(t, I_2)
     figure = plt.figure(facecolor="white")
@@ -368,37 +462,193 @@ def plot_basic_SIR_param_comp(basic_SIR_data_1, basic_SIR_data_2):
 
     plt.legend(handles=handles, framealpha=1, loc="center left")
     plt.tight_layout()
-    plt.savefig(
-        "C:/Users/work/Desktop/optymalizacja-figures/fig_4.tif",
-        facecolor="white",
-        dpi=300,
-    )
-    plt.savefig(
-        "C:/Users/work/Desktop/optymalizacja-figures/fig_4.pdf", facecolor="white"
-    )
-    plt.show()
+    return figure
+
+
+FIGURES = {
+    "fig_1": (plot_basic_SIR, ["basic"]),
+    "fig_2": (
+        plot_SIR_with_vaccination_comparison,
+        ["vaccination_50_71", "vaccination_50_91"],
+    ),
+    "fig_3": (plot_SIR_with_multiwave_comparison, ["multiwave_30", "multiwave_60"]),
+    "fig_4": (plot_basic_SIR_param_comp, ["basic", "basic_2"]),
+}
+
+
+def figure_key(name, config):
+    """Hashes everything a figure is rendered from.
+
+    Args:
+        name (str): The figure
+        config (dict): The output settings
+
+    Returns:
+        str: The key.
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    sources = hashlib.sha256()
+    for path in SOURCES:
+        with open(os.path.join(root, path), "rb") as f:
+            sources.update(f.read())
+    _, scenarios = FIGURES[name]
+    record = json.dumps(
+        [
+            name,
+            [SCENARIOS[scenario] for scenario in scenarios],
+            config["formats"],
+            config["dpi"],
+            matplotlib.__version__,
+            np.__version__,
+            sources.hexdigest(),
+        ],
+        sort_keys=True,
+    )
+    return hashlib.sha256(record.encode()).hexdigest()
+
+
+def render_figure(name, solutions, config):
+    """Renders a figure of `FIGURES` into every configured format.
+
+    Args:
+        name (str): The figure
+        solutions (list): The solutions of the scenarios of the figure
+        config (dict): The output settings
+
+    Returns:
+        list: The written files.
+    """
+    function, _ = FIGURES[name]
+    figure = function(*solutions)
+    paths = []
+    try:
+        for fmt in config["formats"]:
+            path = os.path.join(config["output"], f"{name}.{fmt}")
+            # Written under a temporary name, so an interrupted run never
+            # leaves a partial figure behind a valid manifest entry.
+            tmp = os.path.join(config["output"], f".{name}.tmp.{fmt}")
+            figure.savefig(tmp, facecolor="white", dpi=config["dpi"], format=fmt)
+            os.replace(tmp, path)
+            paths.append(path)
+    finally:
+        plt.close(figure)
+    return paths
+
+
+def save_manifest(path, manifest):
+    """Writes the keys of the rendered figures atomically."""
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def build_figures(config, workers=None, force=False):
+    """Renders the figures whose inputs changed since the last run.
+
+    Solves run in parallel, and every figure is rendered as soon as the
+    scenarios it needs are solved. Each figure is recorded in the manifest
+    as soon as it is written; if a solve or a render fails, the work in
+    flight still finishes and is recorded before the first error is raised.
+
+    Args:
+        config (dict): The output settings
+        workers (int): Number of worker processes, all cores by default
+        force (bool): whether to render every figure
+
+    Returns:
+        dict: The written files keyed by figure, empty for skipped figures.
+    """
+    os.makedirs(config["output"], exist_ok=True)
+    manifest_path = os.path.join(config["output"], ".manifest.json")
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    keys = {name: figure_key(name, config) for name in FIGURES}
+    stale = [
+        name
+        for name in FIGURES
+        if force
+        or manifest.get(name) != keys[name]
+        or not all(
+            os.path.exists(os.path.join(config["output"], f"{name}.{fmt}"))
+            for fmt in config["formats"]
+        )
+    ]
+    written = {name: [] for name in FIGURES}
+    needed = {scenario for name in stale for scenario in FIGURES[name][1]}
+    if not stale:
+        return written
+
+    solutions = {}
+    with ProcessPoolExecutor(workers) as pool:
+        pending = {
+            pool.submit(solve_scenario, name): ("scenario", name) for name in needed
+        }
+        waiting = list(stale)
+        errors = []
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, name = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The work in flight still finishes and is recorded; the
+                    # figures which need a failed scenario are not rendered
+                    errors.append(e)
+                    continue
+                if kind == "figure":
+                    written[name] = result
+                    manifest[name] = keys[name]
+                    # Saved per figure, so the figures already written are
+                    # not rendered again after a later one fails
+                    save_manifest(manifest_path, manifest)
+                else:
+                    solutions[name] = result
+            for figure in [f for f in waiting if set(FIGURES[f][1]) <= set(solutions)]:
+                waiting.remove(figure)
+                data = [solutions[scenario] for scenario in FIGURES[figure][1]]
+                future = pool.submit(render_figure, figure, data, config)
+                pending[future] = ("figure", figure)
+    if errors:
+        raise errors[0]
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Render the figures of the publication."
+    )
+    parser.add_argument("--config", help="JSON file with the output settings")
+    parser.add_argument("--output", help="output directory")
+    parser.add_argument("--formats", help="comma separated formats, e.g. tif,pdf")
+    parser.add_argument("--dpi", type=int)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--force", action="store_true", help="render unchanged figures too"
+    )
+    args = parser.parse_args(argv)
+
+    config = dict(DEFAULTS)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    if args.output:
+        config["output"] = args.output
+    if args.formats:
+        config["formats"] = args.formats.split(",")
+    if args.dpi:
+        config["dpi"] = args.dpi
+    if isinstance(config["formats"], str):
+        config["formats"] = config["formats"].split(",")
+
+    written = build_figures(config, args.workers, args.force)
+    for name, paths in written.items():
+        print(f"{name}: {', '.join(paths) if paths else 'unchanged'}")
 
 
 if __name__ == "__main__":
-    if platform.system() == "Windows":
-        import ctypes
-
-        if platform.release() == "7":
-            ctypes.windll.user32.SetProcessDPIAware()
-        elif float(platform.release()) >= 8:
-            ctypes.windll.shcore.SetProcessDpiAwareness(1)
-    (
-        basic_SIR_data,
-        basic_SIR_data_2,
-        vaccination_comparison_data_50_71,
-        vaccination_comparison_data_50_91,
-        multiwave_SIR_data,
-        multiwave_SIR_data_2,
-    ) = prepare_data_for_plots()
-
-    plot_basic_SIR(basic_SIR_data)
-    plot_SIR_with_vaccination_comparison(
-        vaccination_comparison_data_50_71, vaccination_comparison_data_50_91
-    )
-    plot_SIR_with_multiwave_comparison(multiwave_SIR_data, multiwave_SIR_data_2)
-    plot_basic_SIR_param_comp(basic_SIR_data, basic_SIR_data_2)
+    main()
@@ -0,0 +1,37 @@
+import os
+
+import utils.cache as cache
+import utils.mathematics as mat
+
+ARGS = ((1e6, 1, 0), False, 30)
+
+
+def solve(cached, beta=4e-7):
+    return cached((0, 50), *ARGS, beta=beta, gamma=0.2, a=0)
+
+
+def test_disk_hits_are_read_only(tmp_path):
+    solve(cache.cached(mat.solve_SIR, cache.SolutionCache(directory=tmp_path)))
+
+    store = cache.SolutionCache(directory=tmp_path)
+    sol = solve(cache.cached(mat.solve_SIR, store))
+
+    assert store.disk_hits == 1
+    assert not sol.t.flags.writeable and not sol.y.flags.writeable
+
+
+def test_disk_tier_removes_the_least_recently_used_files(tmp_path):
+    (tmp_path / "trace.jsonl").write_text("{}\n")
+    store = cache.SolutionCache(directory=tmp_path)
+    cached = cache.cached(mat.solve_SIR, store)
+    solve(cached, 1e-7)
+    (oldest,) = tmp_path.glob("*.pkl")
+    os.utime(oldest, (0, 0))
+    store.max_disk_bytes = 2.5 * oldest.stat().st_size
+
+    for beta in (2e-7, 3e-7, 4e-7):
+        solve(cached, beta)
+
+    assert len(list(tmp_path.glob("*.pkl"))) == 2
+    assert not oldest.exists()
+    assert (tmp_path / "trace.jsonl").exists()
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+import utils.mathematics as mat
+
+Y0 = (1e6, 1, 0)
+
+
+@pytest.mark.parametrize("with_multiwave", [False, True])
+def test_methods_agree_when_the_susceptibles_run_out(with_multiwave):
+    # The daily supply of 18000 effective vaccinations outlasts the
+    # susceptibles long before the end of the vaccinations.
+    params = dict(beta=4e-7, gamma=0.2, a=0.01, vac_rate=20000, eff=0.9)
+    rk4, rk45 = (
+        mat.solve_SIR_with_vaccination(
+            (0, 150), Y0, 20, 120, with_multiwave, 30, method=method, **params
+        )
+        for method in ("rk4", "RK45")
+    )
+
+    assert rk4.checkpoint.exhausted and rk45.checkpoint.exhausted
+    for sol in (rk4, rk45):
+        np.testing.assert_allclose(sol.y.sum(axis=0), sum(Y0), rtol=1e-12)
+    daily = rk4.y[:, np.isin(rk4.t, rk45.t)]
+    np.testing.assert_allclose(daily, rk45.y, atol=1)
@@ -0,0 +1,39 @@
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+import pytest
+
+from utils.aggregate import percentile_bands
+from utils.plots import OverlayFigure
+
+
+def make_bands(percentiles):
+    t = np.arange(30.0)
+    values = np.stack(
+        [np.tile([1e6 - 10 * p, 10 * p, 0], (len(t), 1)).T for p in percentiles]
+    )
+    return percentile_bands(t, percentiles, values, values.mean(axis=0), 100, 0, 0.01)
+
+
+@pytest.mark.parametrize("percentiles", [(5, 25, 75, 95), (10, 90), (10, 50, 80)])
+def test_add_bands_rejects_percentiles_without_a_symmetric_median(percentiles):
+    overlay = OverlayFigure()
+    with pytest.raises(ValueError):
+        overlay.add_bands(make_bands(percentiles), 4e-7, 0.2)
+    assert overlay.count == 0
+
+
+def test_add_bands_plots_the_median_and_pairs_the_bands():
+    overlay = OverlayFigure()
+    overlay.add_bands(make_bands((2.5, 10, 50, 90, 97.5)), 4e-7, 0.2)
+
+    np.testing.assert_array_equal(overlay.decimator.data[overlay.runs[0][1]][1], 500)
+    infectious = overlay.fills[0][1::3]
+    bounds = [
+        (path.vertices[:, 1].min(), path.vertices[:, 1].max())
+        for fill in infectious
+        for path in fill.get_paths()
+    ]
+    assert bounds == [(25, 975), (100, 900)]
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import utils.compartments as cm
+import utils.mathematics as mat
+from utils.storage import open_columnar, save
+
+
+def round_trip(tmp_path, sol, **kwargs):
+    path = tmp_path / "sol.sir"
+    save(path, sol, **kwargs)
+    return open_columnar(path)
+
+
+def test_save_names_the_compartments_of_the_solution(tmp_path):
+    sol = mat.solve_SIR_age_structured(
+        (0, 20),
+        [[5e5, 1, 0, 0], [5e5, 0, 0, 0]],
+        [[10, 2], [2, 5]],
+        beta=0.05,
+        gamma=0.2,
+        sigma=0.3,
+    )
+
+    f = round_trip(tmp_path, sol)
+
+    assert f.compartments == ["S", "E", "I", "R"]
+    np.testing.assert_array_equal(f.compartment("E"), sol.y[:, 1])
+    np.testing.assert_array_equal(f.member(1).y, sol.y[1])
+    assert f.member(1).compartments == ("S", "E", "I", "R")
+
+
+def test_save_round_trips_a_compartment_model(tmp_path):
+    sol = cm.solve(
+        cm.SIRV,
+        (0, 30),
+        (1e6, 1, 0, 0),
+        beta=4e-7,
+        gamma=0.2,
+        eff=0.9,
+        vac_rate=1e4,
+        t_1=5,
+        t_2=20,
+    )
+
+    f = round_trip(tmp_path, sol)
+
+    assert f.compartments == ["S", "I", "R", "V"]
+    np.testing.assert_array_equal(f.member(0).y, sol.y)
+
+
+def test_save_names_unnamed_solutions_by_their_shape(tmp_path):
+    sir = mat.solution(np.arange(3.0), np.ones((3, 3)))
+    other = mat.solution(np.arange(3.0), np.ones((5, 3)))
+
+    assert round_trip(tmp_path, sir).compartments == ["S", "I", "R"]
+    assert round_trip(tmp_path, other).compartments == [f"C{k}" for k in range(5)]
+    with pytest.raises(ValueError):
+        save(tmp_path / "bad.sir", other, compartments=("S", "I", "R"))
@@ -0,0 +1,34 @@
+import numpy as np
+
+import utils.cache as cache
+import utils.mathematics as mat
+from utils.worker import solve_in_chunks
+
+
+class RecordingJob:
+    def __init__(self):
+        self.fractions = []
+
+    def report(self, fraction, part=None):
+        self.fractions.append(fraction)
+
+
+def test_solve_in_chunks_solves_once_with_a_zero_byte_cache():
+    calls = []
+
+    def solver(time_range, *args, **kwargs):
+        calls.append(tuple(time_range))
+        return mat.solve_SIR(time_range, *args, **kwargs)
+
+    cached = cache.cached(solver, cache.SolutionCache(max_bytes=0))
+    args = ((1e6, 1, 0), True, 30)
+    kwargs = dict(beta=4e-7, gamma=0.2, a=0.01)
+    job = RecordingJob()
+
+    sol = solve_in_chunks(job, cached, (0, 45), *args, **kwargs)
+
+    assert calls == [(0, 10), (0, 20), (0, 30), (0, 40), (0, 45)]
+    assert len(job.fractions) == 5
+    direct = mat.solve_SIR((0, 45), *args, **kwargs)
+    np.testing.assert_array_equal(sol.t, direct.t)
+    np.testing.assert_allclose(sol.y, direct.y)
@@ -1,6 +1,25 @@
+"""The SIR model package.
+
+The numerical core (`models`, `mathematics`, `validation`) needs only NumPy
+and is imported with the package. The GUI and plotting modules pull in
+PySimpleGUI, Tk and matplotlib, so they are imported on first use, which
+keeps headless workers from loading them.
+"""
+
+import importlib
+
 from . import mathematics
-from . import drawing
-from . import gui
 from . import models
-from . import plots
 from . import validation
+
+_lazy = ("drawing", "gui", "plots")
+
+
+def __getattr__(name):
+    if name in _lazy:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *_lazy])
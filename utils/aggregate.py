@@ -0,0 +1,195 @@
+"""Constant-memory summaries of large ensembles.
+
+`StreamingSummary` consumes the trajectories of an ensemble chunk by chunk,
+as the ensemble solvers or `utils.stochastic.simulate` produce them, and
+keeps for every compartment and time point:
+
+- the number of runs, the running mean and variance (Chan's parallel update
+  of Welford's algorithm) and the exact minimum and maximum
+- a histogram over bins spaced evenly in log(1 + x), which resolves single
+  people near zero and has a relative width of log1p(upper) / bins above
+
+Quantiles are interpolated within the histogram bins, so their error is at
+most one bin, about 1.4% of the value for a population of a million and the
+default 1024 bins. The memory is 3 * T * bins counts whatever the number of
+runs, and summaries of separate shards merge exactly, so shards can be
+summarised in worker processes.
+
+Example:
+    >>> summary = StreamingSummary(sol.t, upper=1e6)
+    >>> for chunk in chunks:
+    ...     summary.update(chunk)
+    >>> overlay.add_bands(summary.bands(), beta, gamma)
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils.mathematics import solution
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+@dataclass
+class percentile_bands:
+    """Percentiles of an ensemble of stochastic realisations.
+
+    Attributes:
+        t (np.ndarray): The days, of shape (T,)
+        percentiles (tuple): The percentiles, in ascending order
+        values (np.ndarray): The percentiles of the susceptible, infectious
+            and recovered populations, of shape (P, 3, T)
+        mean (np.ndarray): The mean populations, of shape (3, T)
+        n_runs (int): The number of realisations
+        fade_out (float): The fraction of realisations in which the infection
+            died out before infecting `minor` of the population
+        minor (float): The fraction of the population separating minor from
+            major outbreaks
+        trajectories (np.ndarray): Every realisation, of shape (n_runs, 3, T),
+            if they were kept
+    """
+
+    t: np.ndarray
+    percentiles: tuple
+    values: np.ndarray
+    mean: np.ndarray
+    n_runs: int
+    fade_out: float
+    minor: float
+    trajectories: np.ndarray = None
+
+    def percentile(self, p):
+        """Returns a percentile of the realisations as a solution.
+
+        Args:
+            p (float): One of `percentiles`
+
+        Returns:
+            solution: The percentile of the populations, day by day.
+        """
+        return solution(self.t, self.values[self.percentiles.index(p)])
+
+
+class StreamingSummary:
+    """Running moments and histograms of the trajectories of an ensemble.
+
+    Args:
+        t (np.ndarray): The time points of the trajectories, of shape (T,)
+        upper (float): The largest value expected, usually the population;
+            larger values are counted in the last bin
+        bins (int): The number of histogram bins per time point
+        compartments (int): The number of compartments
+    """
+
+    def __init__(self, t, upper, bins=1024, compartments=3):
+        self.t = np.asarray(t)
+        self.upper = float(upper)
+        self.bins = bins
+        shape = (compartments, len(self.t))
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+        self.counts = np.zeros((*shape, bins), dtype=np.int64)
+        self.scale = bins / np.log1p(self.upper)
+
+    @property
+    def edges(self):
+        """The edges of the histogram bins, of shape (bins + 1,)."""
+        return np.expm1(np.arange(self.bins + 1) / self.scale)
+
+    def update(self, y):
+        """Adds the trajectories of a chunk of runs.
+
+        Args:
+            y (np.ndarray): The trajectories, of shape (n, compartments, T)
+        """
+        y = np.asarray(y, dtype=float)
+        if y.ndim == 2:
+            y = y[np.newaxis]
+        n = len(y)
+        if not n:
+            return
+        mean = y.mean(axis=0)
+        m2 = ((y - mean) ** 2).sum(axis=0)
+        self._combine(n, mean, m2)
+        np.minimum(self.min, y.min(axis=0), out=self.min)
+        np.maximum(self.max, y.max(axis=0), out=self.max)
+
+        index = np.log1p(np.maximum(y, 0)) * self.scale
+        index = np.minimum(index.astype(np.int64), self.bins - 1)
+        cells = np.arange(self.mean.size).reshape(self.mean.shape) * self.bins
+        self.counts += np.bincount(
+            (index + cells).ravel(), minlength=self.counts.size
+        ).reshape(self.counts.shape)
+
+    def _combine(self, n, mean, m2):
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * (n / total)
+        self.m2 += m2 + delta**2 * (self.n * n / total)
+        self.n = total
+
+    def merge(self, other):
+        """Adds the runs summarised by another summary of the same shape.
+
+        Args:
+            other (StreamingSummary): The summary of other runs
+        """
+        if other.counts.shape != self.counts.shape or other.upper != self.upper:
+            raise ValueError("Only summaries of the same shape and bins merge")
+        if not other.n:
+            return
+        self._combine(other.n, other.mean, other.m2)
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.counts += other.counts
+
+    @property
+    def variance(self):
+        """The sample variance of every compartment and time point."""
+        return self.m2 / max(self.n - 1, 1)
+
+    def quantile(self, q):
+        """Estimates a quantile of every compartment and time point.
+
+        Args:
+            q (float): The quantile, between 0 and 1
+
+        Returns:
+            np.ndarray: The quantile, of shape (compartments, T).
+        """
+        cdf = np.cumsum(self.counts, axis=-1)
+        target = q * self.n
+        index = np.argmax(cdf >= max(target, 1e-9), axis=-1)[..., np.newaxis]
+        count = np.take_along_axis(self.counts, index, axis=-1)[..., 0]
+        below = np.take_along_axis(cdf, index, axis=-1)[..., 0] - count
+        edges = self.edges
+        index = index[..., 0]
+        fraction = np.clip((target - below) / np.maximum(count, 1), 0, 1)
+        value = edges[index] + fraction * (edges[index + 1] - edges[index])
+        return np.clip(value, self.min, self.max)
+
+    def bands(self, percentiles=PERCENTILES, fade_out=None, minor=None):
+        """Summarises the runs as percentile bands.
+
+        Args:
+            percentiles (tuple): The percentiles
+            fade_out (float): The fade-out probability, if known
+            minor (float): The threshold of the fade-out probability
+
+        Returns:
+            percentile_bands: The bands, which `OverlayFigure.add_bands` draws.
+        """
+        percentiles = tuple(sorted(percentiles))
+        return percentile_bands(
+            self.t,
+            percentiles,
+            np.stack([self.quantile(p / 100) for p in percentiles]),
+            self.mean.copy(),
+            self.n,
+            fade_out,
+            minor,
+        )
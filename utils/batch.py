@@ -0,0 +1,238 @@
+"""Headless batch runs of scenarios read from a CSV or JSON lines file.
+
+Every row or line is a scenario with the fields of the GUI (see
+`utils.validation.validate_scenario`); missing fields take the GUI defaults.
+The scenarios are validated, solved on a process pool and written out as
+soon as each one completes, so the output is in completion order and every
+row carries the index of its scenario. Only a bounded number of scenarios is
+read ahead of the pool, which keeps the memory use constant however many
+scenarios the file holds.
+
+The output is JSON lines, or CSV when the output file ends with ".csv".
+Scenarios which fail validation or solving produce a row with an "error".
+Set ``SIR_MODEL_TRACE`` to record the time spent in each stage (see
+`utils.instrument`).
+
+Example:
+    python -m utils.batch scenarios.csv --output results.jsonl --workers 4
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+import utils.mathematics as mat
+from utils import instrument
+from utils.events import infectious_peak, vaccine_supply_exhausted
+from utils.validation import validate_scenario
+
+FIELDS = [
+    "index",
+    "id",
+    "error",
+    "peak_infectious",
+    "peak_day",
+    "final_susceptible",
+    "final_infectious",
+    "final_recovered",
+    "vaccinations_finished_day",
+]
+
+
+def read_scenarios(path):
+    """Reads the scenarios of a file one at a time.
+
+    Args:
+        path (str): A CSV file with a header row, or a JSON lines file
+
+    Yields:
+        dict: The fields of each scenario.
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(f)
+            return
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}, line {number}: {e}") from None
+
+
+def solve_scenario(scenario, trajectory=False):
+    """Solves a validated scenario and summarizes the solution.
+
+    Args:
+        scenario (dict): The scenario returned by `validate_scenario`
+        trajectory (bool): whether to include the daily trajectory
+
+    Returns:
+        dict: The peak of the infectious population and its day, the final
+            populations, the day the vaccinations finished and, optionally,
+            the daily susceptible, infectious and recovered populations.
+    """
+    y0 = [scenario["susceptible"], scenario["infectious"], scenario["recovered"]]
+    beta = scenario["beta"]
+    gamma = 1 / scenario["recovery_time"]
+    events = [infectious_peak(beta, gamma)]
+    if scenario["with_vaccinations"]:
+        rate, eff = scenario["vaccination_rate"], scenario["vaccination_eff"]
+        events.append(vaccine_supply_exhausted(rate, eff))
+        sol = mat.solve_SIR_with_vaccination(
+            (0, scenario["duration"]),
+            y0,
+            scenario["vaccination_start"],
+            scenario["vaccination_end"],
+            scenario["with_multiwave"],
+            scenario["sw_start"],
+            events=events,
+            beta=beta,
+            gamma=gamma,
+            eff=eff,
+            vac_rate=rate,
+            a=scenario["sw_a"],
+        )
+    else:
+        sol = mat.solve_SIR(
+            (0, scenario["duration"]),
+            y0,
+            scenario["with_multiwave"],
+            scenario["sw_start"],
+            events=events,
+            beta=beta,
+            gamma=gamma,
+            a=scenario["sw_a"],
+        )
+
+    peak_day, peak = mat.find_infectious_peak(sol, sol.t, sol.y[1])
+    result = {
+        "peak_infectious": float(peak),
+        "peak_day": float(peak_day),
+        "final_susceptible": float(sol.y[0, -1]),
+        "final_infectious": float(sol.y[1, -1]),
+        "final_recovered": float(sol.y[2, -1]),
+        "vaccinations_finished_day": None,
+    }
+    if scenario["with_vaccinations"] and scenario["vaccination_rate"]:
+        result["vaccinations_finished_day"] = mat.vaccinations_finished_day(
+            sol,
+            scenario["vaccination_rate"],
+            scenario["vaccination_eff"],
+            scenario["vaccination_start"],
+            scenario["vaccination_end"],
+        )
+    if trajectory:
+        days = np.searchsorted(sol.t, np.arange(scenario["duration"]))
+        days = days[days < len(sol.t)]
+        result["t"] = sol.t[days].tolist()
+        result["S"], result["I"], result["R"] = sol.y[:, days].tolist()
+    return result
+
+
+def _run(task):
+    """Validates and solves one scenario in a worker process."""
+    index, values, trajectory = task
+    if not isinstance(values, dict):
+        return {"index": index, "id": None, "error": "A scenario must be an object."}
+    row = {"index": index, "id": values.get("id")}
+    try:
+        with instrument.span("validate", index=index):
+            scenario = validate_scenario(values)
+        with instrument.span("scenario", index=index):
+            row.update(solve_scenario(scenario, trajectory))
+    except Exception as e:
+        # One bad scenario must not take down the batch and the results
+        # still in flight; anything it raises becomes its error row
+        row["error"] = str(e) or type(e).__name__
+    instrument.flush(index=index)
+    return row
+
+
+def run_batch(scenarios, write, workers=None, trajectory=False, window=None):
+    """Solves scenarios on a process pool and writes each result as soon as
+    it completes.
+
+    Args:
+        scenarios (iterable): The fields of the scenarios
+        write (function): Called with the result row of every scenario
+        workers (int): Number of worker processes, all cores by default
+        trajectory (bool): whether to include the daily trajectories
+        window (int): Largest number of scenarios in flight, four per worker
+            by default
+
+    Returns:
+        int: The number of scenarios which failed.
+    """
+    failed = 0
+    with ProcessPoolExecutor(workers) as pool:
+        window = window or 4 * (workers or os.cpu_count() or 1)
+        pending = set()
+        for index, values in enumerate(scenarios):
+            pending.add(pool.submit(_run, (index, values, trajectory)))
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    row = future.result()
+                    failed += "error" in row
+                    write(row)
+        for future in wait(pending).done:
+            row = future.result()
+            failed += "error" in row
+            write(row)
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Solve the scenarios of a CSV or JSON lines file."
+    )
+    parser.add_argument("scenarios", help="CSV or JSON lines file of scenarios")
+    parser.add_argument("--output", default="-", help="result file, - for stdout")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--window", type=int, default=None)
+    parser.add_argument(
+        "--trajectory", action="store_true", help="include daily trajectories"
+    )
+    args = parser.parse_args(argv)
+
+    if args.trajectory and args.output.endswith(".csv"):
+        parser.error("--trajectory needs JSON lines output")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        if args.output.endswith(".csv"):
+            writer = csv.DictWriter(out, FIELDS)
+            writer.writeheader()
+
+            def write(row):
+                writer.writerow(row)
+                out.flush()
+
+        else:
+
+            def write(row):
+                out.write(json.dumps(row) + "\n")
+                out.flush()
+
+        failed = run_batch(
+            read_scenarios(args.scenarios),
+            write,
+            args.workers,
+            args.trajectory,
+            args.window,
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if failed:
+        print(f"{failed} scenarios failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
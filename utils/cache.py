@@ -0,0 +1,326 @@
+"""Memoization of the solvers keyed on their full parameter set.
+
+``cached_solve_SIR`` and ``cached_solve_SIR_with_vaccination`` behave like the
+solvers in `utils.mathematics` but return the stored solution when the same
+parameters were solved before. The default cache keeps up to
+``SIR_MODEL_CACHE_BYTES`` bytes of solutions in memory (64 MiB unless set),
+evicts the least recently used ones first and, when ``SIR_MODEL_CACHE_DIR``
+is set, also keeps them on disk, up to ``SIR_MODEL_CACHE_DISK_BYTES`` bytes
+(1 GiB unless set) of which the least recently used files are removed first.
+Cached solutions are shared, so their arrays are read-only.
+
+Fixed step solutions are cached per start of the time range: a shorter run
+is sliced out of a longer cached one, and a longer run continues the cached
+one from its checkpoint instead of starting again from the beginning. The
+``stream`` attribute of the cached solvers yields such solutions in chunks
+(see `utils.mathematics.stream`).
+"""
+
+import contextlib
+import hashlib
+import os
+import pickle as pkl
+import re
+import sys
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+
+import utils.mathematics as mat
+
+# The files of the on-disk tier, named after the hash of their key
+_CACHE_FILE = re.compile(r"[0-9a-f]{64}\.pkl")
+
+
+def _canonical(value):
+    """Converts a parameter to a hashable value equal for equal parameters."""
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return float(value)
+    if isinstance(value, str) or value is None:
+        return value
+    if isinstance(value, dict):
+        return tuple(sorted((k, _canonical(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(_canonical(v) for v in value)
+    if hasattr(value, "key"):
+        return value.key
+    return value
+
+
+def make_key(solver, *args, **kwargs):
+    """Creates the canonical, hashable record of a solver call.
+
+    Numbers are compared by value regardless of their type, keyword arguments
+    regardless of their order and events by their `key`.
+
+    Args:
+        solver (function): The solver
+        *args: Positional arguments of the call
+        **kwargs: Keyword arguments of the call
+
+    Returns:
+        tuple: The key.
+    """
+    return (solver.__name__, _canonical(args), _canonical(kwargs))
+
+
+def _freeze(sol):
+    """Makes the arrays of a cached solution read-only."""
+    for array in (sol.t, sol.y):
+        array.flags.writeable = False
+
+
+def _deep_nbytes(value, seen):
+    """Estimates the memory held by the arrays and numbers reachable from
+    `value`, counting every object once."""
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_deep_nbytes(v, seen) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_deep_nbytes(v, seen) for v in value.values())
+    if hasattr(value, "__dict__") and not isinstance(value, type):
+        return sum(_deep_nbytes(v, seen) for v in vars(value).values())
+    return sys.getsizeof(value)
+
+
+def _nbytes(entry):
+    """Estimates the memory held by an (end, solution) entry.
+
+    Besides the trajectory and the events this counts the checkpoint, whose
+    delay history spans the whole immunity lag, and the dense output of an
+    adaptive solution.
+    """
+    _, sol = entry
+    seen = set()
+    size = _deep_nbytes(sol.t, seen) + _deep_nbytes(sol.y, seen)
+    for events in (sol.t_events, sol.y_events):
+        size += sum(_deep_nbytes(value, seen) for value in (events or {}).values())
+    size += _deep_nbytes(sol.checkpoint, seen)
+    return size + _deep_nbytes(sol.dense_output, seen)
+
+
+class SolutionCache:
+    """LRU cache of solutions with an optional on-disk tier.
+
+    Args:
+        max_bytes (int): Memory budget of the in-memory tier
+        directory (str): Directory of the on-disk tier, None to disable it
+        max_disk_bytes (int): Budget of the on-disk tier
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, directory=None, max_disk_bytes=2**30):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, digest + ".pkl")
+
+    def get(self, key):
+        """Returns the (end, solution) entry stored under `key` or None."""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    stored_key, entry = pkl.load(f)
+            except (FileNotFoundError, OSError, pkl.UnpicklingError, EOFError):
+                stored_key = None
+            if stored_key == key:
+                self.disk_hits += 1
+                _freeze(entry[1])
+                with contextlib.suppress(OSError):
+                    # The modification time orders the files for `_prune`
+                    os.utime(path)
+                self._remember(key, entry)
+                return entry
+        self.misses += 1
+        return None
+
+    def put(self, key, end, sol):
+        """Stores the solution of a run ending at `end` under `key` and makes
+        its arrays read-only."""
+        _freeze(sol)
+        self._remember(key, (end, sol))
+        if self.directory:
+            stored = mat.solution(
+                sol.t,
+                sol.y,
+                sol.n_steps,
+                None,
+                sol.t_events,
+                sol.y_events,
+                sol.checkpoint,
+            )
+            with open(self._path(key), "wb") as f:
+                pkl.dump((key, (end, stored)), f, protocol=pkl.HIGHEST_PROTOCOL)
+            self._prune()
+
+    def _prune(self):
+        """Removes the least recently used files of the on-disk tier until it
+        fits `max_disk_bytes`.
+
+        Other files in the directory are left alone, and so are files which
+        another process removed first.
+        """
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if _CACHE_FILE.fullmatch(entry.name):
+                    with contextlib.suppress(OSError):
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+        size = sum(file_size for _, file_size, _ in files)
+        for _, file_size, path in sorted(files):
+            if size <= self.max_disk_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            size -= file_size
+
+    def _remember(self, key, entry):
+        size = _nbytes(entry)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= _nbytes(self.entries.pop(key))
+        self.entries[key] = entry
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= _nbytes(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        """Empties the in-memory tier and resets the statistics."""
+        self.entries.clear()
+        self.size = 0
+        self.hits = self.disk_hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns the hit/miss statistics of the cache.
+
+        Returns:
+            dict: Memory and disk hits, misses, evictions, the number of
+                entries and the bytes they hold.
+        """
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.size,
+        }
+
+
+default_cache = SolutionCache(
+    int(os.environ.get("SIR_MODEL_CACHE_BYTES", 64 * 2**20)),
+    os.environ.get("SIR_MODEL_CACHE_DIR") or None,
+    int(os.environ.get("SIR_MODEL_CACHE_DISK_BYTES", 2**30)),
+)
+
+
+def _resumable(kwargs):
+    """Whether a solver call can be sliced from or continued to another
+    horizon: fixed step runs storing the whole trajectory which no terminal
+    event can cut short."""
+    return (
+        kwargs.get("method", "rk4") == "rk4"
+        and kwargs.get("save_trajectory", True)
+        and kwargs.get("checkpoint") is None
+        and not any(getattr(e, "terminal", False) for e in kwargs.get("events") or [])
+    )
+
+
+def cached(solver, cache=None):
+    """Wraps a solver so its solutions are memoized in `cache`.
+
+    Args:
+        solver (function): The solver
+        cache (SolutionCache): The cache, `default_cache` by default
+
+    Returns:
+        function: The memoized solver, whose `stream` attribute yields the
+            solution in chunks.
+    """
+
+    @wraps(solver)
+    def cached_solver(time_range, *args, **kwargs):
+        store = default_cache if cache is None else cache
+        end = float(time_range[1])
+        if not _resumable(kwargs):
+            key = make_key(solver, time_range, *args, **kwargs)
+            entry = store.get(key)
+            if entry is None:
+                entry = end, solver(time_range, *args, **kwargs)
+                store.put(key, *entry)
+            return entry[1]
+
+        key = make_key(solver, time_range[0], *args, **kwargs)
+        entry = store.get(key)
+        if entry is None:
+            sol = solver(time_range, *args, **kwargs)
+        else:
+            stored_end, sol = entry
+            if end == stored_end:
+                return sol
+            if end < stored_end:
+                return mat.truncate(sol, end)
+            rest = solver(time_range, *args, checkpoint=sol.checkpoint, **kwargs)
+            sol = mat.join(sol, rest)
+        store.put(key, end, sol)
+        return sol
+
+    def stream(time_range, *args, chunk_days=10, **kwargs):
+        """Yields the solution in chunks like `utils.mathematics.stream`.
+
+        The cached part of the solution comes first, in one chunk, and the
+        joined solution is cached once the stream is exhausted.
+        """
+        if not _resumable(kwargs):
+            yield cached_solver(time_range, *args, **kwargs)
+            return
+        store = default_cache if cache is None else cache
+        end = float(time_range[1])
+        key = make_key(solver, time_range[0], *args, **kwargs)
+        entry = store.get(key)
+        parts, cp = [], None
+        if entry is not None:
+            stored_end, sol = entry
+            if end <= stored_end:
+                yield sol if end == stored_end else mat.truncate(sol, end)
+                return
+            parts.append(sol)
+            cp = sol.checkpoint
+            yield sol
+        for part in mat.stream(
+            solver, time_range, *args, chunk_days=chunk_days, checkpoint=cp, **kwargs
+        ):
+            parts.append(part)
+            yield part
+        if parts:
+            store.put(key, end, mat.join(*parts))
+
+    cached_solver.stream = stream
+    return cached_solver
+
+
+cached_solve_SIR = cached(mat.solve_SIR)
+cached_solve_SIR_with_vaccination = cached(mat.solve_SIR_with_vaccination)
@@ -0,0 +1,454 @@
+"""Compartment models declared as data and compiled to vectorized functions.
+
+A `compartment_model` lists its compartments, its parameters and its
+transitions, each a (source, target, rate) triple where the rate is an
+expression of the compartments, the parameters, the time ``t`` and the
+whole population ``N``:
+
+    SEIR = compartment_model(
+        "SEIR",
+        ("S", "E", "I", "R"),
+        (
+            ("S", "E", "beta * S * I"),
+            ("E", "I", "sigma * E"),
+            ("I", "R", "gamma * I"),
+        ),
+        ("beta", "sigma", "gamma"),
+    )
+
+A source or target of None makes people enter or leave the model. The
+expressions are arithmetic (``+ - * / **``) and the functions ``exp``,
+``log``, ``sqrt``, ``positive(x)`` (1 where x > 0, else 0) and
+``window(t, start, end)`` (1 where start <= t < end, else 0), which switch
+rates on and off like the vaccinations of `utils.models`. As in the solvers
+of `utils.mathematics`, the fixed step solver holds the windows at their
+value at the start of every step.
+
+`compile_model` turns a definition into the Python source of a right-hand
+side and of its Jacobian, differentiated symbolically, and compiles them.
+Each rate is evaluated once per call and every operation is an array
+operation, so the same functions integrate one run, with states of shape
+(C,), or a whole ensemble, with states of shape (C, N) and parameters of
+shape (N,). Compiled models are cached per definition. `solve` integrates
+a definition with the fixed step RK4 of `utils.mathematics` or, for single
+runs, with a `scipy.integrate.solve_ivp` method, to which the Jacobian is
+passed for the implicit methods.
+
+Example:
+    >>> sol = solve(SEIR, (0, 150), [1e6, 0, 1, 0], beta=4e-7, sigma=0.2,
+    ...             gamma=0.2)
+"""
+
+import ast
+import functools
+from dataclasses import dataclass
+
+import numpy as np
+
+from utils import instrument
+from utils.mathematics import _time_grid, solution
+
+_FUNCTIONS = ("exp", "log", "sqrt", "positive", "window")
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow)
+
+
+@dataclass(frozen=True)
+class compartment_model:
+    """The definition of a compartment model.
+
+    Attributes:
+        name (str): The name of the model
+        compartments (tuple): The names of the compartments, in the order of
+            the states
+        transitions (tuple): (source, target, rate) triples; the rate is an
+            expression giving the number of people moving per day
+        parameters (tuple): The names of the parameters
+    """
+
+    name: str
+    compartments: tuple
+    transitions: tuple
+    parameters: tuple = ()
+
+    def __post_init__(self):
+        object.__setattr__(self, "compartments", tuple(self.compartments))
+        object.__setattr__(
+            self, "transitions", tuple(tuple(tr) for tr in self.transitions)
+        )
+        object.__setattr__(self, "parameters", tuple(self.parameters))
+
+
+@dataclass
+class compiled_model:
+    """A compartment model compiled by `compile_model`.
+
+    Attributes:
+        definition (compartment_model): The definition
+        rhs (function): ``rhs(t, y, **params)``, the derivatives of the
+            states `y`, of shape (C,) or (C, N)
+        jacobian (function): ``jacobian(t, y, **params)``, the derivatives
+            of `rhs` with respect to the states, of shape (C, C) or (C, C, N)
+        source (str): The generated source of both functions
+    """
+
+    definition: compartment_model
+    rhs: object
+    jacobian: object
+    source: str
+
+
+def _parse(expression, names):
+    """Parses a rate expression and checks that it uses known names only."""
+    try:
+        tree = ast.parse(expression, mode="eval").body
+    except SyntaxError as e:
+        raise ValueError(f"Invalid rate expression {expression!r}") from e
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if node.id not in names and node.id not in _FUNCTIONS:
+                raise ValueError(f"Unknown name {node.id!r} in {expression!r}")
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS:
+                raise ValueError(f"Unknown function in {expression!r}")
+            if node.keywords:
+                raise ValueError(f"Keyword arguments in {expression!r}")
+        elif isinstance(node, ast.BinOp):
+            if not isinstance(node.op, _OPERATORS):
+                raise ValueError(f"Unsupported operator in {expression!r}")
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.USub, ast.UAdd)):
+                raise ValueError(f"Unsupported operator in {expression!r}")
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)):
+                raise ValueError(f"Unsupported constant in {expression!r}")
+        elif not isinstance(node, (ast.expr_context, ast.operator, ast.unaryop)):
+            raise ValueError(f"Unsupported expression {expression!r}")
+    return tree
+
+
+def _number(node):
+    return node.value if isinstance(node, ast.Constant) else None
+
+
+def _add(a, b):
+    if _number(a) is not None and _number(b) is not None:
+        return ast.Constant(a.value + b.value)
+    if _number(a) == 0:
+        return b
+    if _number(b) == 0:
+        return a
+    return ast.BinOp(a, ast.Add(), b)
+
+
+def _sub(a, b):
+    if _number(a) is not None and _number(b) is not None:
+        return ast.Constant(a.value - b.value)
+    if _number(b) == 0:
+        return a
+    if _number(a) == 0:
+        return _neg(b)
+    return ast.BinOp(a, ast.Sub(), b)
+
+
+def _mul(a, b):
+    if _number(a) is not None and _number(b) is not None:
+        return ast.Constant(a.value * b.value)
+    if _number(a) == 0 or _number(b) == 0:
+        return ast.Constant(0)
+    if _number(a) == 1:
+        return b
+    if _number(b) == 1:
+        return a
+    return ast.BinOp(a, ast.Mult(), b)
+
+
+def _div(a, b):
+    if _number(a) == 0:
+        return ast.Constant(0)
+    if _number(b) == 1:
+        return a
+    return ast.BinOp(a, ast.Div(), b)
+
+
+def _neg(a):
+    if _number(a) is not None:
+        return ast.Constant(-a.value)
+    if isinstance(a, ast.UnaryOp) and isinstance(a.op, ast.USub):
+        return a.operand
+    return ast.UnaryOp(ast.USub(), a)
+
+
+def _call(name, *args):
+    return ast.Call(ast.Name(name, ast.Load()), list(args), [])
+
+
+def _derivative(node, var):
+    """Differentiates an expression with respect to a compartment."""
+    d = functools.partial(_derivative, var=var)
+    if isinstance(node, ast.Constant):
+        return ast.Constant(0)
+    if isinstance(node, ast.Name):
+        return ast.Constant(int(node.id == var or node.id == "N"))
+    if isinstance(node, ast.UnaryOp):
+        du = d(node.operand)
+        return du if isinstance(node.op, ast.UAdd) else _neg(du)
+    if isinstance(node, ast.BinOp):
+        u, v = node.left, node.right
+        du, dv = d(u), d(v)
+        if isinstance(node.op, ast.Add):
+            return _add(du, dv)
+        if isinstance(node.op, ast.Sub):
+            return _sub(du, dv)
+        if isinstance(node.op, ast.Mult):
+            return _add(_mul(du, v), _mul(u, dv))
+        if isinstance(node.op, ast.Div):
+            return _sub(
+                _div(du, v), _div(_mul(u, dv), ast.BinOp(v, ast.Pow(), ast.Constant(2)))
+            )
+        # u ** v
+        if _number(dv) == 0:
+            power = ast.BinOp(u, ast.Pow(), _sub(v, ast.Constant(1)))
+            return _mul(_mul(v, power), du)
+        return _mul(node, _add(_mul(dv, _call("log", u)), _div(_mul(v, du), u)))
+    if isinstance(node, ast.Call):
+        name = node.func.id
+        if name in ("positive", "window"):
+            # Piecewise constant, switched at isolated points
+            return ast.Constant(0)
+        du = d(node.args[0])
+        if name == "exp":
+            return _mul(node, du)
+        if name == "log":
+            return _div(du, node.args[0])
+        if name == "sqrt":
+            return _div(du, _mul(ast.Constant(2), node))
+    raise ValueError(f"Cannot differentiate {ast.unparse(node)}")
+
+
+class _HoldSwitches(ast.NodeTransformer):
+    """Makes `window` read the time in ``t_hold``, at which the solvers hold
+    switched rates for a whole step."""
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        if node.func.id == "window" and node.args:
+            time = node.args[0]
+            if isinstance(time, ast.Name) and time.id == "t":
+                node.args[0] = ast.Name("t_hold", ast.Load())
+        return node
+
+
+def _source(definition):
+    """Generates the source of the right-hand side and of its Jacobian."""
+    compartments = definition.compartments
+    names = [*compartments, *definition.parameters]
+    if len(set(names)) != len(names):
+        raise ValueError("The compartment and parameter names must be unique")
+    reserved = set(names) & {"t", "t_hold", "N", "y", "np", *_FUNCTIONS}
+    if reserved:
+        raise ValueError(f"Reserved names: {', '.join(sorted(reserved))}")
+    names = {*names, "t", "N"}
+    index = {name: i for i, name in enumerate(compartments)}
+    rates = []
+    for source, target, rate in definition.transitions:
+        for end in (source, target):
+            if end is not None and end not in index:
+                raise ValueError(f"Unknown compartment {end!r}")
+        rates.append(_HoldSwitches().visit(_parse(rate, names)))
+
+    n = len(compartments)
+    parameters = "".join(f", {p}" for p in definition.parameters)
+    head = [
+        "    t_hold = t if t_hold is None else t_hold",
+        f"    {', '.join(compartments)}{',' if n == 1 else ''} = y",
+        f"    N = {' + '.join(compartments)}",
+    ]
+    rhs = [f"def rhs(t, y{parameters}, *, t_hold=None):", *head]
+    rhs += [f"    f{k} = {ast.unparse(rate)}" for k, rate in enumerate(rates)]
+    rhs.append("    dydt = np.zeros(np.shape(y))")
+    for i, name in enumerate(compartments):
+        total = ast.Constant(0)
+        for k, (source, target, _) in enumerate(definition.transitions):
+            if target == name:
+                total = _add(total, ast.Name(f"f{k}", ast.Load()))
+            if source == name:
+                total = _sub(total, ast.Name(f"f{k}", ast.Load()))
+        if _number(total) != 0:
+            rhs.append(f"    dydt[{i}] = {ast.unparse(total)}")
+    rhs.append("    return dydt")
+
+    jac = [f"def jacobian(t, y{parameters}, *, t_hold=None):", *head]
+    jac.append(f"    J = np.zeros(({n}, {n}) + np.shape(y)[1:])")
+    for i, name in enumerate(compartments):
+        for j, var in enumerate(compartments):
+            total = ast.Constant(0)
+            for (source, target, _), rate in zip(definition.transitions, rates):
+                if target == name:
+                    total = _add(total, _derivative(rate, var))
+                if source == name:
+                    total = _sub(total, _derivative(rate, var))
+            if _number(total) != 0:
+                jac.append(f"    J[{i}, {j}] = {ast.unparse(total)}")
+    jac.append("    return J")
+    return "\n".join(rhs) + "\n\n\n" + "\n".join(jac) + "\n"
+
+
+def _positive(x):
+    return np.where(x > 0, 1.0, 0.0)
+
+
+def _window(t, start, end):
+    return np.where((start <= t) & (t < end), 1.0, 0.0)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_model(definition):
+    """Compiles a compartment model, once per definition.
+
+    Args:
+        definition (compartment_model): The model
+
+    Returns:
+        compiled_model: The right-hand side and its Jacobian.
+    """
+    source = _source(definition)
+    namespace = {
+        "np": np,
+        "exp": np.exp,
+        "log": np.log,
+        "sqrt": np.sqrt,
+        "positive": _positive,
+        "window": _window,
+    }
+    exec(compile(source, f"<compartment model {definition.name}>", "exec"), namespace)
+    return compiled_model(definition, namespace["rhs"], namespace["jacobian"], source)
+
+
+SIR = compartment_model(
+    "SIR",
+    ("S", "I", "R"),
+    (("S", "I", "beta * S * I"), ("I", "R", "gamma * I")),
+    ("beta", "gamma"),
+)
+
+SEIR = compartment_model(
+    "SEIR",
+    ("S", "E", "I", "R"),
+    (("S", "E", "beta * S * I"), ("E", "I", "sigma * E"), ("I", "R", "gamma * I")),
+    ("beta", "sigma", "gamma"),
+)
+
+SEIRS = compartment_model(
+    "SEIRS",
+    ("S", "E", "I", "R"),
+    (
+        ("S", "E", "beta * S * I"),
+        ("E", "I", "sigma * E"),
+        ("I", "R", "gamma * I"),
+        ("R", "S", "xi * R"),
+    ),
+    ("beta", "sigma", "gamma", "xi"),
+)
+
+SIRV = compartment_model(
+    "SIRV",
+    ("S", "I", "R", "V"),
+    (
+        ("S", "I", "beta * S * I"),
+        ("I", "R", "gamma * I"),
+        ("S", "V", "eff * vac_rate * window(t, t_1, t_2 + 1) * positive(S)"),
+    ),
+    ("beta", "gamma", "eff", "vac_rate", "t_1", "t_2"),
+)
+
+
+@instrument.traced("compartments.solve")
+def solve(
+    definition,
+    time_range,
+    y0,
+    dt=0.05,
+    method="rk4",
+    rtol=1e-9,
+    atol=1e-9,
+    t_eval=None,
+    **params,
+):
+    """Solves a compartment model.
+
+    Args:
+        definition (compartment_model or compiled_model): The model
+        time_range (tuple): Start and end of the simulation.
+        y0 (array_like): Initial values of shape (C,), or (N, C) for an
+            ensemble whose parameters are scalars or arrays of shape (N,)
+        dt (float): The step of the "rk4" method
+        method (str): "rk4" integrates with a fixed step and clamps the
+            states at zero like the solvers of `utils.mathematics`; the
+            methods of `scipy.integrate.solve_ivp` ("RK45", "LSODA", "BDF",
+            ...) integrate single runs adaptively
+        rtol (float): Relative tolerance of the adaptive methods.
+        atol (float): Absolute tolerance of the adaptive methods.
+        t_eval (array_like): Times at which the adaptive solution is
+            sampled, a daily grid by default.
+        **params: The parameters of the model
+
+    Returns:
+        solution: Solution with `y` of shape (C, T), or (N, C, T) for an
+            ensemble.
+    """
+    model = definition
+    if isinstance(definition, compartment_model):
+        model = compile_model(definition)
+    missing = set(model.definition.parameters) - set(params)
+    if missing:
+        raise ValueError(f"Missing parameters: {', '.join(sorted(missing))}")
+    y0 = np.asarray(y0, dtype=float)
+    members = np.broadcast_shapes(*(np.shape(p) for p in params.values()))
+    if y0.ndim == 1 and members:
+        y0 = np.broadcast_to(y0, (*members, len(y0)))
+    ensemble = y0.ndim == 2
+
+    if method != "rk4":
+        if ensemble:
+            raise ValueError(f"The {method} method solves single runs only")
+        from scipy.integrate import solve_ivp
+
+        if t_eval is None:
+            t_eval = np.arange(time_range[0], time_range[1], 1.0)
+        sol = solve_ivp(
+            lambda t, y: model.rhs(t, y, **params),
+            time_range,
+            y0,
+            method=method,
+            t_eval=t_eval,
+            jac=lambda t, y: model.jacobian(t, y, **params),
+            rtol=rtol,
+            atol=atol,
+        )
+        if not sol.success:
+            raise RuntimeError(sol.message)
+        return solution(sol.t, sol.y, compartments=model.definition.compartments)
+
+    f = model.rhs
+    time_points = _time_grid(time_range, dt)
+    prev_y = y0.T.copy() if ensemble else y0.copy()
+    Y = np.zeros(shape=(len(time_points), *prev_y.shape))
+    Y[0] = prev_y
+    dt2 = dt / 2
+    for t in range(len(time_points) - 1):
+        curr_t = time_points[t]
+        prev_y = Y[t]
+        k1 = f(curr_t, prev_y, t_hold=curr_t, **params)
+        k2 = f(curr_t + dt2, prev_y + dt2 * k1, t_hold=curr_t, **params)
+        k3 = f(curr_t + dt2, prev_y + dt2 * k2, t_hold=curr_t, **params)
+        k4 = f(curr_t + dt, prev_y + dt * k3, t_hold=curr_t, **params)
+        Y[t + 1] = np.maximum(prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0)
+    instrument.count("rk4_steps", len(time_points) - 1)
+
+    y = Y.transpose(2, 1, 0) if ensemble else Y.T
+    return solution(
+        np.array(time_points),
+        y,
+        n_steps=len(time_points) - 1,
+        compartments=model.definition.compartments,
+    )
@@ -0,0 +1,147 @@
+"""Decimation of trajectories to the resolution they are shown at.
+
+`minmax` keeps, for every pixel column of the view, the first, last,
+smallest and largest point that falls into it (the M4 scheme). The polyline
+through these points covers the same pixels as the polyline through all
+points, so the decimation cannot be seen, while the number of vertices is
+bounded by four per pixel column whatever the length of the trajectory.
+
+`ViewDecimator` keeps the full data of the lines of an axes and decimates it
+again whenever the x limits or the size of the canvas change, so zooming in
+with the toolbar reaches the full resolution and enlarging the window does
+not leave the lines too coarse.
+"""
+
+import weakref
+
+import numpy as np
+
+# The decimators of every figure, for `follow_canvas`; both are held weakly,
+# as the decimators refer to their figure
+_decimators = weakref.WeakKeyDictionary()
+
+
+def minmax(x, y, x0, x1, width):
+    """Decimates a line to the points that matter on a view.
+
+    Points outside the view are dropped except for one on each side, which
+    keeps the segments that cross the edges of the view.
+
+    Args:
+        x (np.ndarray): The sorted x coordinates
+        y (np.ndarray): The y coordinates
+        x0 (float): The left edge of the view
+        x1 (float): The right edge of the view
+        width (int): The width of the view in pixels
+
+    Returns:
+        tuple: The x and y coordinates of the kept points.
+    """
+    lo = max(np.searchsorted(x, x0, "left") - 1, 0)
+    hi = min(np.searchsorted(x, x1, "right") + 1, len(x))
+    x, y = x[lo:hi], y[lo:hi]
+    width = max(int(width), 1)
+    if len(x) <= 4 * width or x1 <= x0:
+        return x, y
+
+    # The points left and right of the view fall into buckets of their own.
+    buckets = np.floor((x - x0) * (width / (x1 - x0))).clip(-1, width)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(x)])
+    owner = np.repeat(np.arange(len(starts)), counts)
+
+    def first_where(mask):
+        candidates = np.flatnonzero(mask)
+        return candidates[np.r_[True, owner[candidates][1:] != owner[candidates][:-1]]]
+
+    smallest = first_where(y == np.repeat(np.minimum.reduceat(y, starts), counts))
+    largest = first_where(y == np.repeat(np.maximum.reduceat(y, starts), counts))
+    keep = np.unique(np.concatenate([starts, starts + counts - 1, smallest, largest]))
+    return x[keep], y[keep]
+
+
+class ViewDecimator:
+    """Shows decimated data on the lines of an axes.
+
+    Args:
+        ax (matplotlib.axes.Axes): The axes
+    """
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.data = {}
+        self.connect()
+
+    def connect(self):
+        """Decimates the lines again whenever the x limits or the size of the
+        canvas change.
+
+        Callbacks are not pickled, so an unpickled decimator must be
+        connected again.
+        """
+        self.ax.callbacks.connect("xlim_changed", lambda ax: self.refresh())
+        self._callbacks = None
+        _decimators.setdefault(self.ax.figure, weakref.WeakSet()).add(self)
+        self.follow_canvas()
+
+    def follow_canvas(self):
+        """Decimates the lines again whenever the canvas of the figure is
+        resized.
+
+        Matplotlib before 3.6 keeps the callbacks on the canvas rather than
+        on the figure, so this is called again when the figure is given a new
+        canvas (see `follow_canvas` of the module).
+        """
+        canvas = self.ax.figure.canvas
+        if canvas.callbacks is not self._callbacks:
+            self._callbacks = canvas.callbacks
+            canvas.mpl_connect("resize_event", lambda event: self.refresh())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_callbacks"] = None
+        return state
+
+    def set_data(self, line, x, y):
+        """Sets the full data of a line and shows it decimated.
+
+        Until the x limits change the line is decimated over the whole range
+        of `x`, which keeps the extent of the data for autoscaling.
+
+        Args:
+            line (matplotlib.lines.Line2D): The line
+            x (np.ndarray): The sorted x coordinates
+            y (np.ndarray): The y coordinates
+        """
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        self.data[line] = (x, y)
+        if len(x):
+            line.set_data(*minmax(x, y, x[0], x[-1], self._width()))
+        else:
+            line.set_data(x, y)
+
+    def discard(self, line):
+        """Stops decimating a line, whose data is then set directly."""
+        self.data.pop(line, None)
+
+    def refresh(self):
+        """Decimates every visible line to the current view."""
+        x0, x1 = sorted(self.ax.get_xlim())
+        width = self._width()
+        for line, (x, y) in self.data.items():
+            if line.get_visible():
+                line.set_data(*minmax(x, y, x0, x1, width))
+
+    def _width(self):
+        return self.ax.bbox.width
+
+
+def follow_canvas(fig):
+    """Keeps the decimators of a figure following the size of its canvas
+    after the figure is given a new canvas.
+
+    Args:
+        fig (matplotlib.figure.Figure): The figure
+    """
+    for decimator in _decimators.get(fig, ()):
+        decimator.follow_canvas()
@@ -1,9 +1,15 @@
+import time
+
+import numpy as np
 from matplotlib.backends.backend_tkagg import (
     FigureCanvasTkAgg,
     NavigationToolbar2Tk,
 )
-import utils.plots as plot
-import utils.mathematics as mat
+import utils.cache as cache
+import utils.decimate as decimate
+import utils.worker as worker
+from utils import instrument
+from utils.events import infectious_peak, vaccine_supply_exhausted
 
 
 class Toolbar(NavigationToolbar2Tk):
@@ -11,43 +17,132 @@ class Toolbar(NavigationToolbar2Tk):
         super(Toolbar, self).__init__(*args, **kwargs)
 
 
-def draw_fig(canvas, fig, canvas_toolbar):
+class FigureCanvas(FigureCanvasTkAgg):
+    """Figure canvas whose renders, often deferred until Tk is idle, are
+    instrumented."""
+
+    def draw(self):
+        with instrument.span("draw_fig.render"):
+            super().draw()
+
+
+def draw_fig(canvas, fig, canvas_toolbar, figure_canvas_agg=None):
     """Draws the figure on the figure_canvas_agg
 
+    When `figure_canvas_agg` already shows `fig`, the canvas and toolbar are
+    kept and the figure is only redrawn once Tk is idle. Otherwise they are
+    rebuilt for the new figure.
+
     Args:
         canvas (tk.Canvas): The canvas on which the figure is drawn
         fig (matplotlib.figure): The figure to be drawn
         canvas_toolbar (Toolbar): The toolbar of the canvas
+        figure_canvas_agg (FigureCanvasTkAgg): The figure canvas in use, if any
 
     Returns:
         figure_canvas_agg (FigureCanvasTkAgg): The figure canvas
     """
+    if figure_canvas_agg is not None and figure_canvas_agg.figure is fig:
+        with instrument.span("draw_fig", rebuild=False):
+            figure_canvas_agg.draw_idle()
+        return figure_canvas_agg
+    with instrument.span("draw_fig", rebuild=True):
+        return _rebuild_canvas(canvas, fig, canvas_toolbar)
+
+
+def _rebuild_canvas(canvas, fig, canvas_toolbar):
+    """Replaces the figure canvas and toolbar with new ones showing `fig`."""
+    canvas.delete("all")
     if canvas.children:
         for child in canvas.winfo_children():
             child.destroy()
     if canvas_toolbar.children:
         for child in canvas_toolbar.winfo_children():
             child.destroy()
-    figure_canvas_agg = FigureCanvasTkAgg(fig, canvas)
-    toolbar = Toolbar(figure_canvas_agg, canvas_toolbar)
-    toolbar.update()
+    with instrument.span("draw_fig.canvas"):
+        figure_canvas_agg = FigureCanvas(fig, canvas)
+        toolbar = Toolbar(figure_canvas_agg, canvas_toolbar)
+        toolbar.update()
+    decimate.follow_canvas(fig)
     figure_canvas_agg.get_tk_widget().pack(side="top", fill="both", expand=True)
     return figure_canvas_agg
 
 
-def delete_figure_agg(figure_canvas_agg):
-    """Deletes the figure_canvas_agg content
+class LivePlot:
+    """Appends the streamed chunks of a solution to lines of the canvas.
+
+    The lines are blitted onto a background saved without them, at most
+    `fps` times per second; chunks arriving in between are only collected.
+    The background is saved again whenever the canvas is fully redrawn, for
+    example when the window is resized.
 
     Args:
-        figure_canvas_agg (FigureCanvasTkAgg): The figure_canvas_agg from which
-            the content is deleted
+        figure_canvas_agg (FigureCanvasTkAgg): The figure canvas
+        lines (list): The animated susceptible, infectious and recovered lines
+            (see `utils.plots.OverlayFigure.begin_stream`)
+        fps (float): The highest frame rate
     """
-    for item in figure_canvas_agg.get_tk_widget().find_all():
-        figure_canvas_agg.get_tk_widget().delete(item)
-    figure_canvas_agg.get_tk_widget().pack_forget()
 
-
-def create_updated_fig_SIR(
+    def __init__(self, figure_canvas_agg, lines, fps=30):
+        self.canvas = figure_canvas_agg
+        self.lines = lines
+        self.ax = lines[0].axes
+        self.interval = 1 / fps
+        self.last_frame = -np.inf
+        self.t, self.y = [], []
+        self.background = None
+        self.cid = self.canvas.mpl_connect("draw_event", self._on_draw)
+        self.canvas.draw()
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._blit()
+
+    def _blit(self):
+        if self.background is None:
+            return
+        self.canvas.restore_region(self.background)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+        self.canvas.blit(self.ax.bbox)
+
+    def append(self, part):
+        """Appends a chunk and draws the lines if a frame is due.
+
+        Args:
+            part (solution): The chunk, which may repeat the last point of the
+                previous one
+        """
+        skip = 1 if self.t and len(part.t) and part.t[0] == self.t[-1][-1] else 0
+        self.t.append(part.t[skip:])
+        self.y.append(part.y[:, skip:])
+        now = time.perf_counter()
+        if now - self.last_frame >= self.interval:
+            self.last_frame = now
+            self.draw()
+
+    def draw(self):
+        """Draws the lines with every chunk appended so far."""
+        if len(self.t) > 1:
+            self.t = [np.concatenate(self.t)]
+            self.y = [np.concatenate(self.y, axis=1)]
+        if self.t:
+            for line, values in zip(self.lines, self.y[0]):
+                line.set_data(self.t[0], values)
+        self._blit()
+
+    def close(self):
+        """Stops following full redraws of the canvas."""
+        self.canvas.mpl_disconnect(self.cid)
+
+
+def _solve(solver, job, *args, **kwargs):
+    if job is None:
+        return solver(*args, **kwargs)
+    return worker.solve_in_chunks(job, solver, *args, **kwargs)
+
+
+def solve_updated_SIR(
     susceptible,
     infectious,
     recovered,
@@ -57,9 +152,9 @@ def create_updated_fig_SIR(
     with_multiwave,
     a,
     t_3,
-    already_plotted=False,
+    job=None,
 ):
-    """Creates a new figure with the updated SIR values
+    """Solves the SIR model for the values entered in the GUI
 
     Args:
         susceptible (int): The susceptible population
@@ -71,24 +166,26 @@ def create_updated_fig_SIR(
         with_multiwave (bool): indicates if recovered people lose immunity
         a (float): proportion of recovered people who lose immunity
         t_3 (int): time of the start of immunity loss
+        job (utils.worker.Job): The background job running the solve, if any
 
     Returns:
-        fig (matplotlib.figure): The figure with the updated SIR values
+        sol (solution): The solution
     """
-    sol = mat.solve_SIR(
+    return _solve(
+        cache.cached_solve_SIR,
+        job,
         (0, t_1),
         [susceptible, infectious, recovered],
         with_multiwave,
         t_3,
+        events=[infectious_peak(beta, gamma)],
         beta=beta,
         gamma=gamma,
         a=a,
     )
-    fig = plot.plot_SIR(sol, sol.t, beta, gamma, already_plotted)
-    return fig
 
 
-def create_updated_fig_SIR_with_vaccination(
+def solve_updated_SIR_with_vaccination(
     susceptible,
     infectious,
     recovered,
@@ -102,22 +199,45 @@ def create_updated_fig_SIR_with_vaccination(
     with_multiwave,
     a,
     t_3,
-    already_plotted=False,
+    job=None,
 ):
-    y0 = [susceptible, infectious, recovered]
+    """Solves the SIR model with vaccination for the values entered in the GUI
+
+    Args:
+        susceptible (int): The susceptible population
+        infectious (int): The infectious population
+        recovered (int): The recovered population
+        t_1 (float): The time of the simulation
+        beta (float): The infection rate
+        gamma (float): The recovery rate
+        eff (float): The vaccination efficiency
+        vac_rate (int): The number of vaccinations per day
+        t_start (int): The start of the vaccinations
+        t_end (int): The end of the vaccinations
+        with_multiwave (bool): indicates if recovered people lose immunity
+        a (float): proportion of recovered people who lose immunity
+        t_3 (int): time of the start of immunity loss
+        job (utils.worker.Job): The background job running the solve, if any
 
-    sol_v = mat.solve_SIR_with_vaccination(
+    Returns:
+        sol (solution): The solution
+    """
+    return _solve(
+        cache.cached_solve_SIR_with_vaccination,
+        job,
         [0, t_1],
-        y0,
+        [susceptible, infectious, recovered],
         t_start,
         t_end,
         with_multiwave,
         t_3,
+        events=[
+            infectious_peak(beta, gamma),
+            vaccine_supply_exhausted(vac_rate, eff),
+        ],
         beta=beta,
         gamma=gamma,
         eff=eff,
         vac_rate=vac_rate,
         a=a,
     )
-    fig = plot.plot_SIR(sol_v, sol_v.t, beta, gamma, already_plotted)
-    return fig, sol_v
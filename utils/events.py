@@ -0,0 +1,77 @@
+"""Event functions located by the solvers during integration.
+
+An event is a function ``event(t, y)`` of the time and the state
+``y = (S, I, R)`` whose zero crossings are located by the solvers. As in
+``scipy.integrate.solve_ivp``, the ``direction`` attribute restricts the
+crossings to falling (-1) or rising (1) ones, and a ``terminal`` event stops
+the integration. The solvers report the located crossings under the
+function's ``__name__`` in ``solution.t_events`` and ``solution.y_events``.
+The ``key`` attribute identifies the events created here when solutions are
+cached (see `utils.cache`).
+"""
+
+
+def infectious_peak(beta, gamma, terminal=False):
+    """Creates an event for the maximum of the infectious population.
+
+    Args:
+        beta (float): The infection rate
+        gamma (float): The recovery rate
+        terminal (bool): whether the integration stops at the peak
+
+    Returns:
+        function: Event crossing zero when dI/dt changes sign from + to -.
+    """
+
+    def infectious_peak(t, y):
+        S, I, R = y
+        return beta * S * I - gamma * I
+
+    infectious_peak.direction = -1
+    infectious_peak.terminal = terminal
+    infectious_peak.key = ("infectious_peak", beta, gamma, terminal)
+    return infectious_peak
+
+
+def vaccine_supply_exhausted(vac_rate, eff, terminal=False):
+    """Creates an event for the susceptible population falling below the
+    daily vaccine supply.
+
+    Args:
+        vac_rate (float): The number of vaccinations per day
+        eff (float): The vaccination efficiency
+        terminal (bool): whether the integration stops at the event
+
+    Returns:
+        function: Event crossing zero when S falls below vac_rate * eff.
+    """
+
+    def vaccine_supply_exhausted(t, y):
+        return y[0] - vac_rate * eff
+
+    vaccine_supply_exhausted.direction = -1
+    vaccine_supply_exhausted.terminal = terminal
+    vaccine_supply_exhausted.key = ("vaccine_supply_exhausted", vac_rate, eff, terminal)
+    return vaccine_supply_exhausted
+
+
+def herd_immunity(beta, gamma, terminal=False):
+    """Creates an event for the effective reproduction number crossing 1.
+
+    Args:
+        beta (float): The infection rate
+        gamma (float): The recovery rate
+        terminal (bool): whether the integration stops at the crossing
+
+    Returns:
+        function: Event crossing zero when R_eff = beta * S / gamma crosses 1
+            in either direction.
+    """
+
+    def herd_immunity(t, y):
+        return beta * y[0] / gamma - 1
+
+    herd_immunity.direction = 0
+    herd_immunity.terminal = terminal
+    herd_immunity.key = ("herd_immunity", beta, gamma, terminal)
+    return herd_immunity
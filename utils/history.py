@@ -0,0 +1,71 @@
+import numpy as np
+
+
+class DelayBuffer:
+    """Ring buffer of past values of a fixed step integration.
+
+    Serves the delayed term of a delay differential equation: it keeps only
+    the samples inside the lag window and interpolates linearly between them,
+    so the memory is bounded by the lag rather than by the length of the
+    simulation.
+
+    Args:
+        lag (float or np.ndarray): The delay in time units, per member for
+            ensembles.
+        dt (float): The step of the integration.
+        t0 (float): The time of the first sample.
+        n_members (int): The size of an ensemble, or None for scalar values.
+    """
+
+    def __init__(self, lag, dt, t0, n_members=None):
+        self.dt = dt
+        self.t0 = t0
+        self.capacity = int(np.ceil(np.max(lag) / dt)) + 2
+        self.count = 0
+        if n_members is None:
+            self.values = [0.0] * self.capacity
+        else:
+            self.values = np.zeros((self.capacity, n_members))
+            self.members = np.arange(n_members)
+
+    def push(self, value):
+        """Appends the sample of the next step."""
+        self.values[self.count % self.capacity] = value
+        self.count += 1
+
+    def at(self, t):
+        """Returns the value at time t.
+
+        Times before the first sample give 0 and times after the newest
+        sample give the newest sample, which happens when the lag is shorter
+        than one step.
+
+        Args:
+            t (float or np.ndarray): The time, per member for ensembles.
+
+        Returns:
+            float or np.ndarray: The interpolated value.
+        """
+        if isinstance(self.values, list):
+            x = (t - self.t0) / self.dt
+            if x < 0:
+                return 0
+            n = int(x)
+            if n >= self.count - 1:
+                return self.values[(self.count - 1) % self.capacity]
+            if n < self.count - self.capacity:
+                raise ValueError(f"Time {t} is no longer held by the buffer")
+            v0 = self.values[n % self.capacity]
+            v1 = self.values[(n + 1) % self.capacity]
+            return v0 + (x - n) * (v1 - v0)
+
+        x = (t - self.t0) / self.dt
+        n = np.floor(np.maximum(x, 0)).astype(int)
+        n = np.minimum(n, self.count - 1)
+        if np.any(n < self.count - self.capacity):
+            raise ValueError("Some times are no longer held by the buffer")
+        v0 = self.values[n % self.capacity, self.members]
+        v1 = self.values[
+            np.minimum(n + 1, self.count - 1) % self.capacity, self.members
+        ]
+        return np.where(x < 0, 0, v0 + (x - n) * (v1 - v0))
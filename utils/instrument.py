@@ -0,0 +1,225 @@
+"""Named spans and counters along validate, solve, plot and draw.
+
+Instrumentation is off by default, and a disabled `span` or `count` costs
+one flag check. Once enabled, every span writes a JSON line with its name,
+its duration, the process and thread it ran on and its fields. In the
+"alloc" mode the allocations traced by tracemalloc are recorded as well:
+the net change over the span and the peak above its start. tracemalloc
+counts the allocations of every thread together, so spans which ran while a
+span of another thread was open, such as the GUI and the worker thread, are
+marked with ``alloc_overlap`` and their numbers include both. Counters are
+written by `flush`, when instrumentation is disabled and at exit; pool
+workers, which exit without running atexit handlers, flush after each task.
+
+``SIR_MODEL_TRACE`` enables instrumentation at import, "1" for timings and
+"alloc" for allocations too, so batch runs and their worker processes are
+traced. The records go to ``SIR_MODEL_TRACE_FILE``, or to stderr when it is
+unset. The GUI has a toggle which writes them to `trace_path`.
+
+Example:
+    with instrument.span("solve", days=150):
+        sol = solve_SIR(...)
+    instrument.count("rk4_steps", sol.n_steps)
+"""
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+enabled = False
+mode = None
+counters = Counter()
+
+_NULL = contextlib.nullcontext()
+_lock = threading.Lock()
+_out = None
+_local = threading.local()
+_running = set()
+_tracing = False
+
+
+def trace_path():
+    """Returns ``SIR_MODEL_TRACE_FILE``, or trace.jsonl in the cache directory."""
+    return os.environ.get("SIR_MODEL_TRACE_FILE") or os.path.join(
+        os.environ.get("SIR_MODEL_CACHE_DIR")
+        or os.path.join(os.path.expanduser("~"), ".cache", "sir_model"),
+        "trace.jsonl",
+    )
+
+
+def enable(alloc=False, path=None):
+    """Starts writing records.
+
+    Args:
+        alloc (bool): whether to trace allocations too, which slows down
+            every allocation while enabled
+        path (str): File the records are appended to, stderr if None
+    """
+    global enabled, mode, _out, _tracing
+    disable()
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        out = open(path, "a", buffering=1)
+    else:
+        out = sys.stderr
+    with _lock:
+        _out = out
+        if alloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing = True
+        mode = "alloc" if alloc else "time"
+        enabled = True
+
+
+def disable():
+    """Writes the counters and stops writing records."""
+    global enabled, mode, _out, _tracing
+    # Spans of other threads may write at the same time, so the output is
+    # closed under the lock the writers take.
+    with _lock:
+        if not enabled:
+            return
+        enabled = False
+        mode = None
+        if counters:
+            _out.write(_line({"name": "counters", "counters": dict(counters)}))
+            counters.clear()
+        if _tracing:
+            tracemalloc.stop()
+            _tracing = False
+        if _out is not sys.stderr:
+            _out.close()
+        _out = None
+
+
+def flush(**fields):
+    """Writes the counters as a record and resets them.
+
+    Args:
+        **fields: Values written with the record
+    """
+    if enabled and counters:
+        record = {"name": "counters", "counters": dict(counters), **fields}
+        counters.clear()
+        _write(record)
+
+
+def _line(record):
+    record.update(pid=os.getpid(), thread=threading.current_thread().name)
+    return json.dumps(record, default=str) + "\n"
+
+
+def _write(record):
+    line = _line(record)
+    with _lock:
+        if _out is None:
+            return
+        _out.write(line)
+
+
+def _open_spans():
+    """Returns the open allocation spans of the current thread, innermost last."""
+    if not hasattr(_local, "open"):
+        _local.open = []
+    return _local.open
+
+
+class _Span:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.open = None
+
+    def __enter__(self):
+        if mode == "alloc":
+            # tracemalloc has a single peak, which the open spans of this
+            # thread share: it is folded into them before being reset for
+            # this one. It is not reset while a span of another thread is
+            # open, which would lose the peak of that span.
+            self.open = _open_spans()
+            with _lock:
+                size, peak = tracemalloc.get_traced_memory()
+                self.peak = self.start_size = size
+                for span in self.open:
+                    span.peak = max(span.peak, peak)
+                others = _running.difference(self.open)
+                self.overlap = bool(others)
+                for span in others:
+                    span.overlap = True
+                if not others:
+                    tracemalloc.reset_peak()
+                self.open.append(self)
+                _running.add(self)
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        record = {"name": self.name, "start": self.wall, "duration": duration}
+        if self.open is not None and self in self.open:
+            with _lock:
+                size, peak = tracemalloc.get_traced_memory()
+                for span in self.open:
+                    span.peak = max(span.peak, peak)
+                self.open.remove(self)
+                _running.discard(self)
+            record["alloc_net"] = size - self.start_size
+            record["alloc_peak"] = self.peak - self.start_size
+            if self.overlap:
+                record["alloc_overlap"] = True
+        if exc[0] is not None:
+            record["error"] = exc[0].__name__
+        record.update(self.fields)
+        _write(record)
+        return False
+
+
+def span(name, **fields):
+    """Times a block and writes it as a record.
+
+    Args:
+        name (str): The name of the span
+        **fields: Values written with the record
+
+    Returns:
+        A context manager.
+    """
+    if not enabled:
+        return _NULL
+    return _Span(name, fields)
+
+
+def traced(name):
+    """Decorator which runs every call of a function in a span."""
+
+    def decorate(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return f(*args, **kwargs)
+            with _Span(name, {}):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def count(name, n=1):
+    """Adds `n` to a counter."""
+    if enabled:
+        counters[name] += n
+
+
+_setting = os.environ.get("SIR_MODEL_TRACE", "").strip().lower()
+if _setting and _setting not in ("0", "false", "off", "no"):
+    enable(alloc=_setting == "alloc", path=os.environ.get("SIR_MODEL_TRACE_FILE"))
+atexit.register(disable)
@@ -1,112 +1,754 @@
+import bisect
+import copy
+import pickle as pkl
 import numpy as np
 import utils
 from dataclasses import dataclass
+from utils import instrument
+from utils.history import DelayBuffer
 
 
 @dataclass
 class solution:
     t: np.ndarray
     y: np.ndarray
+    n_steps: int = None
+    dense_output: object = None
+    t_events: dict = None
+    y_events: dict = None
+    checkpoint: object = None
+    # The names of the rows of `y`, for the solvers of other compartments
+    # than susceptible, infectious and recovered
+    compartments: tuple = None
 
 
-def solve_SIR(time_range, y0, with_multiwave, t_3, **args):
-    f = utils.models.SIR
-    dt = 1
-    time_points = np.arange(time_range[0], time_range[1], dt)
-    (S, I, R) = (np.zeros(shape=(len(time_points))) for _ in range(3))
-    S[0] = y0[0]
-    I[0] = y0[1]
-    R[0] = y0[2]
+@dataclass
+class checkpoint:
+    """State needed to continue an integration from where it stopped.
 
-    args["R_prev"] = 0
-    for t in range(len(time_points) - 1):
+    Attributes:
+        t (float): The time of the state
+        y (tuple): The susceptible, infectious and recovered populations
+        history: The delay history of the multiwave term, a `DelayBuffer` for
+            the fixed step solvers or a list of (start, dense output) segments
+            for the "RK45" method
+        step (int): Index of `t` on the fixed step grid
+        t0 (float): Start of the fixed step grid
+        dt (float): Step of the fixed step grid
+        exhausted (bool): whether the vaccinations stopped because the
+            susceptible population ran out
+        terminated (bool): whether a terminal event stopped the run
+    """
 
-        dt2 = dt / 2
-        prev_y = np.array([S[t], I[t], R[t]])
-        if with_multiwave is True and t >= t_3:
-            args["R_prev"] = R[t - t_3]
-
-            k1 = np.array(f(t, prev_y, **args))
-            k2 = np.array(f(t + dt2, prev_y + dt2 * k1, **args))
-            k3 = np.array(f(t + dt2, prev_y + dt2 * k2, **args))
-            k4 = np.array(f(t + dt, prev_y + dt * k3, **args))
-            new_y = np.maximum(prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0)
-            S[t + 1] = new_y[0]
-            I[t + 1] = new_y[1]
-            R[t + 1] = new_y[2]
+    t: float
+    y: tuple
+    history: object = None
+    step: int = None
+    t0: float = None
+    dt: float = None
+    exhausted: bool = False
+    terminated: bool = False
 
-        else:
-            k1 = np.array(f(t, prev_y, **args))
-            k2 = np.array(f(t + dt2, prev_y + dt2 * k1, **args))
-            k3 = np.array(f(t + dt2, prev_y + dt2 * k2, **args))
-            k4 = np.array(f(t + dt, prev_y + dt * k3, **args))
-            new_y = np.maximum(prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0)
-            S[t + 1] = new_y[0]
-            I[t + 1] = new_y[1]
-            R[t + 1] = new_y[2]
-
-    sol = solution(np.array(time_points), np.array([S, I, R]))
+
+def save_checkpoint(cp, path):
+    """Saves a checkpoint so an interrupted run can be continued later."""
+    with open(path, "wb") as f:
+        pkl.dump(cp, f, protocol=pkl.HIGHEST_PROTOCOL)
+
+
+def load_checkpoint(path):
+    """Loads a checkpoint saved by `save_checkpoint`."""
+    with open(path, "rb") as f:
+        return pkl.load(f)
+
+
+def join(first, *rest):
+    """Joins a solution with the solutions continued from its checkpoint.
+
+    Args:
+        first (solution): The earlier solution
+        *rest (solution): The solutions continued from the checkpoint of the
+            previous one, in order
+
+    Returns:
+        solution: The solution over all the time ranges.
+    """
+    parts = [first, *rest]
+    t, y = [first.t], [first.y]
+    for prev, part in zip(parts, parts[1:]):
+        skip = 1 if len(prev.t) and len(part.t) and part.t[0] == prev.t[-1] else 0
+        t.append(part.t[skip:])
+        y.append(part.y[:, skip:])
+    n_steps = [part.n_steps for part in parts]
+    sol = solution(
+        np.concatenate(t),
+        np.concatenate(y, axis=1),
+        None if None in n_steps else sum(n_steps),
+        parts[-1].dense_output,
+        checkpoint=parts[-1].checkpoint,
+    )
+    for name in ("t_events", "y_events"):
+        events = [getattr(part, name) for part in parts]
+        if None not in events:
+            setattr(
+                sol,
+                name,
+                {k: np.concatenate([e[k] for e in events]) for k in events[0]},
+            )
     return sol
 
 
-def solve_SIR_with_vaccination(time_range, y0, t_1, t_2, with_multiwave, t_3, **args):
-    f = utils.models.SIR_with_vaccination
-    dt = 0.05
-    time_points = np.arange(time_range[0], time_range[1], dt)
-    (S, I, R) = (np.zeros(shape=(len(time_points))) for _ in range(3))
-    S[0] = y0[0]
-    I[0] = y0[1]
-    R[0] = y0[2]
+def stream(solver, time_range, *args, chunk_days=10, checkpoint=None, **kwargs):
+    """Solves in chunks of `chunk_days` days and yields each chunk as soon as
+    it is solved.
 
-    population = np.sum(y0)
+    Every chunk continues the previous one from its checkpoint and starts at
+    the last point of the previous chunk, so `join` of the chunks gives the
+    solution of a single call of `solver`. The stream ends early after a
+    chunk cut short by a terminal event.
 
-    args["R_prev"] = 0
-    args["population"] = population
-    vac_rate = args["vac_rate"]
-    for t in range(len(time_points) - 1):
-        curr_t = time_points[t]
+    Args:
+        solver (function): `solve_SIR` or `solve_SIR_with_vaccination`
+        time_range (tuple): The start and end of the simulation
+        *args: The other positional arguments of the solver
+        chunk_days (float): The length of the chunks
+        checkpoint (checkpoint): continues the run that returned it instead
+            of starting at the beginning of `time_range`
+        **kwargs: The keyword arguments of the solver
 
-        dt2 = dt / 2
-        prev_y = np.array([S[t], I[t], R[t]])
+    Yields:
+        solution: The chunks of the solution.
+    """
+    start, end = time_range
+    stop = start if checkpoint is None else checkpoint.t
+    while stop < end:
+        stop = min(stop + chunk_days, end)
+        part = solver((start, stop), *args, checkpoint=checkpoint, **kwargs)
+        yield part
+        checkpoint = part.checkpoint
+        if checkpoint.terminated:
+            return
 
-        if t_1 <= curr_t < t_2 + 1:
-            args["vac_rate"] = vac_rate
-        else:
-            args["vac_rate"] = 0
 
-        if with_multiwave and curr_t >= t_3:
-            args["R_prev"] = R[t - t_3]
+def truncate(sol, end):
+    """Returns the part of a solution that a run ending at `end` would give.
 
-            k1 = np.array(f(curr_t, prev_y, **args))
-            k2 = np.array(f(curr_t + dt2, prev_y + dt2 * k1, **args))
-            k3 = np.array(f(curr_t + dt2, prev_y + dt2 * k2, **args))
-            k4 = np.array(f(curr_t + dt, prev_y + dt * k3, **args))
-            S[t + 1], I[t + 1], R[t + 1] = np.maximum(
-                prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0
+    Args:
+        sol (solution): The solution of a longer run
+        end (float): The end of the shorter time range
+
+    Returns:
+        solution: The solution up to `end`, without a checkpoint.
+    """
+    cp = sol.checkpoint
+    if cp is not None and cp.dt is not None:
+        n = len(np.arange(cp.t0, end, cp.dt))
+    else:
+        n = int(np.searchsorted(sol.t, end))
+    # A range shorter than one step still gives its start (see `_time_grid`)
+    n = max(n, 1)
+    truncated = solution(sol.t[:n], sol.y[:, :n], sol.n_steps, sol.dense_output)
+    # The shorter run stops at its last time point, so it locates no events
+    # between that point and `end`
+    last = sol.t[n - 1]
+    for name in ("t_events", "y_events"):
+        events = getattr(sol, name)
+        if events is not None:
+            setattr(
+                truncated,
+                name,
+                {k: v[sol.t_events[k] <= last] for k, v in events.items()},
             )
-            if S[t + 1] >= population:
-                S[t + 1] = population
-            elif I[t + 1] >= population:
-                I[t + 1] = population
-            elif R[t + 1] >= population:
-                R[t + 1] = population
+    return truncated
+
+
+class _EventDetector:
+    """Locates the zero crossings of event functions between fixed steps.
+
+    A crossing is bracketed by the signs of the event at both ends of a step
+    and then bisected on the cubic Hermite interpolant of the step.
+    """
+
+    def __init__(self, events, t, y):
+        self.events = events
+        self.g = [event(t, y) for event in events]
+        self.t_events = {event.__name__: [] for event in events}
+        self.y_events = {event.__name__: [] for event in events}
+        self.terminated = False
+
+    def step(self, t0, y0, f0, t1, y1, rhs):
+        """Checks one step for crossings.
+
+        Args:
+            t0, t1 (float): Start and end of the step.
+            y0, y1 (tuple): The state at the start and the end of the step.
+            f0 (tuple): The derivative at the start of the step.
+            rhs (function): Returns the derivative for a time and a state.
+
+        Returns:
+            bool: True if a terminal event occurred in the step.
+        """
+        terminal = False
+        f1 = None
+        h = t1 - t0
+        for k, event in enumerate(self.events):
+            g0, g1 = self.g[k], event(t1, y1)
+            self.g[k] = g1
+            direction = getattr(event, "direction", 0)
+            rising = g0 < 0 <= g1 and direction >= 0
+            falling = g0 > 0 >= g1 and direction <= 0
+            if not (rising or falling):
+                continue
+            if f1 is None:
+                f1 = rhs(t1, y1)
+
+            def state(x):
+                h00 = (1 + 2 * x) * (1 - x) ** 2
+                h10 = x * (1 - x) ** 2
+                h01 = x**2 * (3 - 2 * x)
+                h11 = x**2 * (x - 1)
+                return tuple(
+                    h00 * a + h10 * h * fa + h01 * b + h11 * h * fb
+                    for a, fa, b, fb in zip(y0, f0, y1, f1)
+                )
+
+            lo, hi = 0.0, 1.0
+            for _ in range(50):
+                mid = (lo + hi) / 2
+                g_mid = event(t0 + mid * h, state(mid))
+                if g_mid != 0 and (g_mid > 0) == (g0 > 0):
+                    lo = mid
+                else:
+                    hi = mid
+            self.t_events[event.__name__].append(t0 + hi * h)
+            self.y_events[event.__name__].append(state(hi))
+            terminal = terminal or getattr(event, "terminal", False)
+        self.terminated = self.terminated or terminal
+        return terminal
+
+    def results(self):
+        """Returns the located event times and states as arrays."""
+        t_events = {name: np.array(t) for name, t in self.t_events.items()}
+        y_events = {
+            name: np.array(y, dtype=float).reshape(-1, 3)
+            for name, y in self.y_events.items()
+        }
+        return t_events, y_events
+
+
+@instrument.traced("solve_SIR")
+def solve_SIR(
+    time_range,
+    y0,
+    with_multiwave,
+    t_3,
+    events=None,
+    save_trajectory=True,
+    checkpoint=None,
+    **args,
+):
+    """Solves the SIR model.
+
+    Args:
+        events (list): Event functions (see `utils.events`) located during
+            the integration. A terminal event stops the integration after
+            the step in which it occurs.
+        save_trajectory (bool): if False only the final state is returned,
+            for callers interested in the events alone.
+        checkpoint (checkpoint): continues the run that returned this
+            checkpoint, called with the same arguments but a later end of
+            `time_range`; the solution starts at the checkpoint (see `join`).
+    """
+    f = utils.models.SIR_scalar
+    dt = 1
+    dt2 = dt / 2
+    dt6 = dt / 6.0
+    beta, gamma, a = float(args["beta"]), float(args["gamma"]), float(args["a"])
+    time_points = _time_grid(time_range, dt)
+    start, (s, i, r), history = _fixed_step_start(
+        checkpoint, y0, with_multiwave, t_3, dt, time_points[0]
+    )
+    n = len(time_points) - start if save_trajectory else 1
+    (S, I, R) = ([0.0] * n for _ in range(3))
+    S[0], I[0], R[0] = s, i, r
+    detector = _EventDetector(events, time_points[start], (s, i, r)) if events else None
+
+    R1 = R2 = R4 = 0
+    last = len(time_points) - 1
+    for t, curr_t in enumerate(time_points[start:-1].tolist(), start):
+        if history is not None:
+            R1 = history.at(curr_t - t_3)
+            R2 = history.at(curr_t + dt2 - t_3)
+            R4 = history.at(curr_t + dt - t_3)
+
+        prev = (s, i, r)
+        k1s, k1i, k1r = f(curr_t, s, i, r, beta, gamma, a, R1)
+        k2s, k2i, k2r = f(
+            curr_t + dt2,
+            s + dt2 * k1s,
+            i + dt2 * k1i,
+            r + dt2 * k1r,
+            beta,
+            gamma,
+            a,
+            R2,
+        )
+        k3s, k3i, k3r = f(
+            curr_t + dt2,
+            s + dt2 * k2s,
+            i + dt2 * k2i,
+            r + dt2 * k2r,
+            beta,
+            gamma,
+            a,
+            R2,
+        )
+        k4s, k4i, k4r = f(
+            curr_t + dt, s + dt * k3s, i + dt * k3i, r + dt * k3r, beta, gamma, a, R4
+        )
+        s = s + dt6 * (k1s + 2 * k2s + 2 * k3s + k4s)
+        i = i + dt6 * (k1i + 2 * k2i + 2 * k3i + k4i)
+        r = r + dt6 * (k1r + 2 * k2r + 2 * k3r + k4r)
+        s = s if s > 0 else 0.0
+        i = i if i > 0 else 0.0
+        r = r if r > 0 else 0.0
+        if save_trajectory:
+            S[t + 1 - start], I[t + 1 - start], R[t + 1 - start] = s, i, r
+        if history is not None:
+            history.push(r)
+
+        if detector is not None and detector.step(
+            curr_t,
+            prev,
+            (k1s, k1i, k1r),
+            curr_t + dt,
+            (s, i, r),
+            lambda t, y: f(t, *y, beta, gamma, a, R4),
+        ):
+            last = t + 1
+            break
+
+    return _fixed_step_solution(
+        time_points,
+        start,
+        (S, I, R),
+        (s, i, r),
+        last,
+        save_trajectory,
+        detector,
+        history,
+        dt,
+    )
+
+
+@instrument.traced("solve_SIR_with_vaccination")
+def solve_SIR_with_vaccination(
+    time_range,
+    y0,
+    t_1,
+    t_2,
+    with_multiwave,
+    t_3,
+    method="rk4",
+    rtol=1e-9,
+    atol=1e-9,
+    t_eval=None,
+    events=None,
+    save_trajectory=True,
+    checkpoint=None,
+    **args,
+):
+    """Solves the SIR model with vaccination.
 
+    Args:
+        method (str): "rk4" integrates with a fixed step of 0.05 days,
+            "RK45" with an adaptive Dormand-Prince integrator.
+        rtol (float): Relative tolerance of the "RK45" method.
+        atol (float): Absolute tolerance of the "RK45" method.
+        t_eval (array_like): Times at which the "RK45" solution is sampled
+            from its dense output, a daily grid by default.
+        events (list): Event functions (see `utils.events`) located during
+            the integration. A terminal event stops the integration, after
+            the step in which it occurs for the "rk4" method.
+        save_trajectory (bool): if False only the final state is returned,
+            for callers interested in the events alone.
+        checkpoint (checkpoint): continues the run that returned this
+            checkpoint, called with the same arguments but a later end of
+            `time_range`; the solution starts at the checkpoint (see `join`).
+    """
+    if method == "RK45":
+        return _solve_SIR_with_vaccination_adaptive(
+            time_range,
+            y0,
+            t_1,
+            t_2,
+            with_multiwave,
+            t_3,
+            rtol,
+            atol,
+            t_eval,
+            events,
+            save_trajectory,
+            checkpoint,
+            **args,
+        )
+    if method != "rk4":
+        raise ValueError(f"Unknown integration method: {method}")
+
+    f = utils.models.SIR_with_vaccination_scalar
+    dt = 0.05
+    dt2 = dt / 2
+    dt6 = dt / 6.0
+    beta, gamma, eff, a = (float(args[k]) for k in ("beta", "gamma", "eff", "a"))
+    time_points = _time_grid(time_range, dt)
+    start, (s, i, r), history = _fixed_step_start(
+        checkpoint, y0, with_multiwave, t_3, dt, time_points[0]
+    )
+    n = len(time_points) - start if save_trajectory else 1
+    (S, I, R) = ([0.0] * n for _ in range(3))
+    S[0], I[0], R[0] = s, i, r
+    detector = _EventDetector(events, time_points[start], (s, i, r)) if events else None
+
+    population = float(np.sum(y0))
+    exhausted = checkpoint is not None and checkpoint.exhausted
+
+    R1 = R2 = R4 = 0
+    last = len(time_points) - 1
+    for t, curr_t in enumerate(time_points[start:-1].tolist(), start):
+        if t_1 <= curr_t < t_2 + 1 and not exhausted:
+            vac_rate = float(args["vac_rate"])
         else:
-            k1 = np.array(f(curr_t, prev_y, **args))
-            k2 = np.array(f(curr_t + dt2, prev_y + dt2 * k1, **args))
-            k3 = np.array(f(curr_t + dt2, prev_y + dt2 * k2, **args))
-            k4 = np.array(f(curr_t + dt, prev_y + dt * k3, **args))
-            S[t + 1], I[t + 1], R[t + 1] = np.maximum(
-                prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0
+            vac_rate = 0
+
+        if history is not None:
+            R1 = history.at(curr_t - t_3)
+            R2 = history.at(curr_t + dt2 - t_3)
+            R4 = history.at(curr_t + dt - t_3)
+
+        prev = (s, i, r)
+        params = (beta, gamma, eff, vac_rate, a)
+        k1s, k1i, k1r = f(curr_t, s, i, r, *params, R1, population)
+        k2s, k2i, k2r = f(
+            curr_t + dt2,
+            s + dt2 * k1s,
+            i + dt2 * k1i,
+            r + dt2 * k1r,
+            *params,
+            R2,
+            population,
+        )
+        k3s, k3i, k3r = f(
+            curr_t + dt2,
+            s + dt2 * k2s,
+            i + dt2 * k2i,
+            r + dt2 * k2r,
+            *params,
+            R2,
+            population,
+        )
+        k4s, k4i, k4r = f(
+            curr_t + dt,
+            s + dt * k3s,
+            i + dt * k3i,
+            r + dt * k3r,
+            *params,
+            R4,
+            population,
+        )
+        s = s + dt6 * (k1s + 2 * k2s + 2 * k3s + k4s)
+        i = i + dt6 * (k1i + 2 * k2i + 2 * k3i + k4i)
+        r = r + dt6 * (k1r + 2 * k2r + 2 * k3r + k4r)
+        if vac_rate and s <= 0:
+            # The vaccinations stop when the susceptible population runs out,
+            # like in the "RK45" method: the step is taken again without them
+            # and the susceptibles are vaccinated until the time at which they
+            # ran out, interpolated linearly.
+            ran_out = prev[0] / (prev[0] - s) if prev[0] > 0 else 0.0
+            params = (beta, gamma, eff, 0, a)
+            s, i, r = _rk4_step(f, curr_t, prev, dt, params, R1, R2, R4, population)
+            vaccinated = min(max(s, 0.0), eff * vac_rate * dt * ran_out)
+            s, r = s - vaccinated, r + vaccinated
+            exhausted = True
+        s = s if s > 0 else 0.0
+        i = i if i > 0 else 0.0
+        r = r if r > 0 else 0.0
+        if s >= population:
+            s = population
+        elif i >= population:
+            i = population
+        elif r >= population:
+            r = population
+        if save_trajectory:
+            S[t + 1 - start], I[t + 1 - start], R[t + 1 - start] = s, i, r
+        if history is not None:
+            history.push(r)
+
+        if detector is not None and detector.step(
+            curr_t,
+            prev,
+            (k1s, k1i, k1r),
+            curr_t + dt,
+            (s, i, r),
+            lambda t, y: f(t, *y, *params, R4, population),
+        ):
+            last = t + 1
+            break
+
+    return _fixed_step_solution(
+        time_points,
+        start,
+        (S, I, R),
+        (s, i, r),
+        last,
+        save_trajectory,
+        detector,
+        history,
+        dt,
+        exhausted,
+    )
+
+
+def _rk4_step(f, t, y, dt, params, R1, R2, R4, population):
+    """Takes one RK4 step of a scalar vaccination model, like the loop of
+    `solve_SIR_with_vaccination` does inline."""
+    dt2 = dt / 2
+    k1 = f(t, *y, *params, R1, population)
+    k2 = f(t + dt2, *(v + dt2 * k for v, k in zip(y, k1)), *params, R2, population)
+    k3 = f(t + dt2, *(v + dt2 * k for v, k in zip(y, k2)), *params, R2, population)
+    k4 = f(t + dt, *(v + dt * k for v, k in zip(y, k3)), *params, R4, population)
+    return tuple(
+        v + dt / 6.0 * (a + 2 * b + 2 * c + d)
+        for v, a, b, c, d in zip(y, k1, k2, k3, k4)
+    )
+
+
+def _time_grid(time_range, dt):
+    """Returns the time points of a fixed step solver.
+
+    A range shorter than one step gives its start alone, so the solution is
+    the initial state rather than an error.
+    """
+    time_points = np.arange(time_range[0], time_range[1], dt)
+    if not len(time_points):
+        time_points = np.array([float(time_range[0])])
+    return time_points
+
+
+def _fixed_step_start(cp, y0, with_multiwave, t_3, dt, t0):
+    """Returns the first step, the state and the delay history of a fixed step
+    solver, either fresh or continued from a checkpoint."""
+    if cp is not None:
+        return cp.step, cp.y, copy.deepcopy(cp.history)
+    y = (float(y0[0]), float(y0[1]), float(y0[2]))
+    history = None
+    if with_multiwave:
+        history = DelayBuffer(t_3, dt, t0)
+        history.push(y[2])
+    return 0, y, history
+
+
+def _fixed_step_solution(
+    time_points,
+    start,
+    y,
+    y_last,
+    last,
+    save_trajectory,
+    detector,
+    history,
+    dt,
+    exhausted=False,
+):
+    """Builds the solution of a fixed step solver which stopped at `last`."""
+    instrument.count("rk4_steps", last - start)
+    if save_trajectory:
+        sol = solution(
+            np.array(time_points[start : last + 1]),
+            np.array(y)[:, : last + 1 - start],
+        )
+    else:
+        sol = solution(
+            np.array(time_points[last : last + 1]), np.array(y_last)[:, np.newaxis]
+        )
+    if detector is not None:
+        sol.t_events, sol.y_events = detector.results()
+    sol.checkpoint = checkpoint(
+        float(time_points[last]),
+        y_last,
+        history,
+        last,
+        float(time_points[0]),
+        dt,
+        exhausted=exhausted,
+        terminated=detector is not None and detector.terminated,
+    )
+    return sol
+
+
+def _breakpoints(time_range, t_1, t_2, with_multiwave, t_3):
+    """Splits the time range at every discontinuity of the vaccination model.
+
+    The vaccination switches on at t_1 and off at t_2 + 1, the immunity loss
+    switches on at t_3. With a positive immunity loss delay no segment is
+    longer than t_3, so the delayed state is always known from the segments
+    already integrated (method of steps).
+
+    Returns:
+        list: Increasing segment boundaries, including both ends of the range.
+    """
+    t_start, t_end = float(time_range[0]), float(time_range[1])
+    points = {t_start, t_end}
+    for point in (t_1, t_2 + 1, t_3) if with_multiwave else (t_1, t_2 + 1):
+        if t_start < point < t_end:
+            points.add(float(point))
+    points = sorted(points)
+    if not (with_multiwave and t_3 > 0):
+        return points
+
+    split = [t_start]
+    for end in points[1:]:
+        n = int(np.ceil((end - split[-1]) / t_3))
+        split.extend(np.linspace(split[-1], end, n + 1)[1:].tolist())
+    return split
+
+
+def _solve_SIR_with_vaccination_adaptive(
+    time_range,
+    y0,
+    t_1,
+    t_2,
+    with_multiwave,
+    t_3,
+    rtol,
+    atol,
+    t_eval,
+    events,
+    save_trajectory,
+    cp,
+    **args,
+):
+    """Solves the SIR model with vaccination using an adaptive Dormand-Prince
+    (RK45) integrator.
+
+    The integration is restarted exactly at the start and end of the
+    vaccinations, at the start of the immunity loss and whenever the
+    susceptible population runs out during vaccinations, so no step straddles
+    a discontinuity of the right-hand side. The delayed recovered population
+    of the multiwave term is interpolated from the dense output of the
+    segments already integrated.
+
+    Returns:
+        solution: The solution sampled at `t_eval` (a daily grid by default),
+            together with the number of accepted steps and the dense output.
+    """
+    from scipy.integrate import OdeSolution, solve_ivp
+
+    f = utils.models.SIR_with_vaccination_scalar
+    beta, gamma, eff, a = (float(args[k]) for k in ("beta", "gamma", "eff", "a"))
+    vac_rate = float(args["vac_rate"])
+    population = float(np.sum(y0))
+    t_start, t_end = float(time_range[0]), float(time_range[1])
+    t_begin = t_start if cp is None else cp.t
+    if t_eval is None:
+        t_eval = np.arange(t_start, t_end, 1)
+    t_eval = np.asarray(t_eval, dtype=float)
+    t_eval = t_eval[t_eval >= t_begin]
+
+    seg_starts, segments = [], []
+    if cp is not None and cp.history:
+        seg_starts, segments = (list(x) for x in zip(*cp.history))
+    R_start = float(y0[2])
+
+    def R_delayed(t, R):
+        if not with_multiwave:
+            return 0
+        if t_3 == 0:
+            return R
+        if t - t_3 < t_start:
+            return 0
+        k = bisect.bisect_right(seg_starts, t - t_3) - 1
+        return segments[k](t - t_3)[2] if k >= 0 else R_start
+
+    def susceptible_exhausted(t, y):
+        return y[0]
+
+    susceptible_exhausted.terminal = True
+    susceptible_exhausted.direction = -1
+
+    events = list(events or [])
+    t_events = {event.__name__: [] for event in events}
+    y_events = {event.__name__: [] for event in events}
+
+    ts, interpolants = [t_begin], []
+    n_steps = 0
+    y = np.asarray(y0 if cp is None else cp.y, dtype=float)
+    exhausted = cp is not None and cp.exhausted
+    stopped = False
+    bounds = _breakpoints((t_begin, t_end), t_1, t_2, with_multiwave, t_3)
+    for seg_start, seg_end in zip(bounds[:-1], bounds[1:]):
+        t = seg_start
+        while t < seg_end and not stopped:
+            exhausted = exhausted or y[0] <= 0
+            vaccinating = t_1 <= t < t_2 + 1 and vac_rate and not exhausted
+            rate = vac_rate if vaccinating else 0
+
+            def fun(t, y, rate=rate):
+                S, I, R = y
+                return f(
+                    t, S, I, R, beta, gamma, eff, rate, a, R_delayed(t, R), population
+                )
+
+            res = solve_ivp(
+                fun,
+                (t, seg_end),
+                y,
+                method="RK45",
+                rtol=rtol,
+                atol=atol,
+                dense_output=True,
+                events=events + [susceptible_exhausted] if vaccinating else events,
             )
-            if S[t + 1] >= population:
-                S[t + 1] = population
-            elif I[t + 1] >= population:
-                I[t + 1] = population
-            elif R[t + 1] >= population:
-                R[t + 1] = population
+            if not res.success:
+                raise RuntimeError(res.message)
+            for event, t_found, y_found in zip(events, res.t_events, res.y_events):
+                t_events[event.__name__].extend(t_found)
+                y_events[event.__name__].extend(y_found)
+                if getattr(event, "terminal", False) and t_found.size:
+                    stopped = True
+            n_steps += len(res.t) - 1
+            seg_starts.append(t)
+            segments.append(res.sol)
+            ts.extend(res.sol.ts[1:])
+            interpolants.extend(res.sol.interpolants)
+            t = res.t[-1]
+            y = res.y[:, -1].copy()
+            if res.status == 1 and not stopped:
+                exhausted = True
+                y[0] = 0
+
+    window = [
+        (start, segment)
+        for start, segment in zip(seg_starts, segments)
+        if with_multiwave and segment.t_max >= ts[-1] - t_3
+    ]
+    last = checkpoint(
+        ts[-1], tuple(y.tolist()), window, exhausted=exhausted, terminated=stopped
+    )
 
-    return solution(np.array(time_points), np.array([S, I, R]))
+    dense_output = OdeSolution(ts, interpolants)
+    if save_trajectory:
+        t_eval = t_eval[t_eval <= ts[-1]]
+    else:
+        t_eval = np.array([ts[-1]])
+    y = np.maximum(dense_output(t_eval), 0) if t_eval.size else np.empty((3, 0))
+    sol = solution(t_eval, y, n_steps, dense_output, checkpoint=last)
+    if events:
+        sol.t_events = {name: np.array(t) for name, t in t_events.items()}
+        sol.y_events = {
+            name: np.array(y, dtype=float).reshape(-1, 3)
+            for name, y in y_events.items()
+        }
+    return sol
 
 
 def find_max_and_argmax(x, y):
@@ -122,3 +764,572 @@ def find_max_and_argmax(x, y):
     max_y = np.max(y)
     max_x = x[np.argmax(y)]
     return max_x, max_y
+
+
+def find_infectious_peak(y, t, I):
+    """Finds the maximum of the infectious population.
+
+    Uses the peaks located by the solver (see `utils.events.infectious_peak`)
+    when they are available and falls back to searching the whole trajectory.
+
+    Args:
+        y (solution): The solution
+        t (np.ndarray): The time points of the solution
+        I (np.ndarray): The infectious population
+
+    Returns:
+        tuple: The time of the maximum and the maximum.
+    """
+    peaks = (y.t_events or {}).get("infectious_peak")
+    if peaks is None:
+        return find_max_and_argmax(t, I)
+    candidates = [(t[0], I[0]), (t[-1], I[-1])]
+    candidates += zip(peaks, y.y_events["infectious_peak"][:, 1])
+    return max(candidates, key=lambda candidate: candidate[1])
+
+
+def vaccinations_finished_day(sol, vac_rate, eff, t_1, t_2):
+    """Finds the day on which the daily vaccine supply first exceeded the
+    susceptible population during the vaccinations.
+
+    Uses the `utils.events.vaccine_supply_exhausted` events of the solution.
+
+    Args:
+        sol (solution): The solution of `solve_SIR_with_vaccination`
+        vac_rate (float): The number of vaccinations per day
+        eff (float): The vaccination efficiency
+        t_1 (float): The start of the vaccinations
+        t_2 (float): The end of the vaccinations
+
+    Returns:
+        int: The day of the simulation, counted like `sol.t` rather than
+            from t_1, or None if the supply never exceeded the susceptible
+            population.
+    """
+    exhausted = sol.t_events["vaccine_supply_exhausted"]
+    # The vaccinations run until the end of day t_2
+    exhausted = exhausted[(exhausted >= t_1) & (exhausted < t_2 + 1)]
+    start = min(np.searchsorted(sol.t, t_1), len(sol.t) - 1)
+    if sol.y[0, start] < vac_rate * eff and t_1 < sol.t[-1]:
+        exhausted = [t_1]
+    if len(exhausted):
+        return int(exhausted[0])
+    return None
+
+
+def _broadcast_members(y0, *params):
+    """Broadcasts the initial values and parameters of an ensemble.
+
+    Args:
+        y0 (array_like): Initial values of shape (3,) or (N, 3).
+        *params (array_like): Scalars or arrays of shape (N,).
+
+    Returns:
+        tuple: Initial values of shape (3, N) followed by the parameters as
+            arrays of shape (N,).
+    """
+    y0 = np.asarray(y0, dtype=float)
+    if y0.ndim == 1:
+        y0 = y0[np.newaxis, :]
+    params = [np.asarray(p) for p in params]
+    n = np.broadcast_shapes(y0.shape[:1], *(p.shape for p in params))[0]
+    y0 = np.broadcast_to(y0, (n, 3)).T.copy()
+    params = [np.broadcast_to(p, (n,)).copy() for p in params]
+    return (y0, *params)
+
+
+@instrument.traced("solve_SIR_ensemble")
+def solve_SIR_ensemble(time_range, y0, with_multiwave, t_3, beta, gamma, a):
+    """Solves the SIR model for N parameter sets at once.
+
+    Every member is integrated exactly like `solve_SIR` would integrate it,
+    but each RK4 stage is evaluated for the whole ensemble in one pass.
+
+    Args:
+        time_range (tuple): Start and end of the simulation.
+        y0 (array_like): Initial values of shape (3,) or (N, 3).
+        with_multiwave (bool or array_like): indicates if recovered people
+            lose immunity, per member or for all of them
+        t_3 (float or array_like): delay after which recovered people start
+            losing immunity, in days
+        beta (float or array_like): The infection rate
+        gamma (float or array_like): The recovery rate
+        a (float or array_like): proportion of recovered people who lose
+            immunity
+
+    Returns:
+        solution: Solution with `y` of shape (N, 3, T).
+    """
+    f = utils.models.SIR_ensemble
+    dt = 1
+    time_points = _time_grid(time_range, dt)
+    prev_y, with_multiwave, t_3, beta, gamma, a = _broadcast_members(
+        y0, with_multiwave, t_3, beta, gamma, a
+    )
+    with_multiwave = with_multiwave.astype(bool)
+
+    Y = np.zeros(shape=(len(time_points), 3, prev_y.shape[1]))
+    Y[0] = prev_y
+    history = None
+    if with_multiwave.any():
+        history = DelayBuffer(t_3, dt, time_points[0], prev_y.shape[1])
+        history.push(Y[0, 2])
+
+    args = {"beta": beta, "gamma": gamma, "a": a}
+    R1 = R2 = R4 = np.zeros_like(beta)
+    for t in range(len(time_points) - 1):
+        curr_t = time_points[t]
+
+        dt2 = dt / 2
+        prev_y = Y[t]
+        if history is not None:
+            R1 = np.where(with_multiwave, history.at(curr_t - t_3), 0)
+            R2 = np.where(with_multiwave, history.at(curr_t + dt2 - t_3), 0)
+            R4 = np.where(with_multiwave, history.at(curr_t + dt - t_3), 0)
+
+        k1 = f(curr_t, prev_y, R_prev=R1, **args)
+        k2 = f(curr_t + dt2, prev_y + dt2 * k1, R_prev=R2, **args)
+        k3 = f(curr_t + dt2, prev_y + dt2 * k2, R_prev=R2, **args)
+        k4 = f(curr_t + dt, prev_y + dt * k3, R_prev=R4, **args)
+        Y[t + 1] = np.maximum(prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0)
+        if history is not None:
+            history.push(Y[t + 1, 2])
+
+    return solution(np.array(time_points), Y.transpose(2, 1, 0))
+
+
+@instrument.traced("solve_SIR_with_vaccination_ensemble")
+def solve_SIR_with_vaccination_ensemble(
+    time_range, y0, t_1, t_2, with_multiwave, t_3, beta, gamma, eff, vac_rate, a
+):
+    """Solves the SIR model with vaccination for N parameter sets at once.
+
+    Every member is integrated exactly like `solve_SIR_with_vaccination`
+    would integrate it, but each RK4 stage is evaluated for the whole
+    ensemble in one pass.
+
+    Args:
+        time_range (tuple): Start and end of the simulation.
+        y0 (array_like): Initial values of shape (3,) or (N, 3).
+        t_1 (float or array_like): Start of the vaccinations
+        t_2 (float or array_like): End of the vaccinations
+        with_multiwave (bool or array_like): indicates if recovered people
+            lose immunity, per member or for all of them
+        t_3 (float or array_like): delay after which recovered people start
+            losing immunity, in days
+        beta (float or array_like): The infection rate
+        gamma (float or array_like): The recovery rate
+        eff (float or array_like): The vaccination efficiency
+        vac_rate (float or array_like): The number of vaccinations per day
+        a (float or array_like): proportion of recovered people who lose
+            immunity
+
+    Returns:
+        solution: Solution with `y` of shape (N, 3, T).
+    """
+    f = utils.models.SIR_with_vaccination_ensemble
+    dt = 0.05
+    time_points = _time_grid(time_range, dt)
+    (
+        prev_y,
+        t_1,
+        t_2,
+        with_multiwave,
+        t_3,
+        beta,
+        gamma,
+        eff,
+        vac_rate,
+        a,
+    ) = _broadcast_members(
+        y0, t_1, t_2, with_multiwave, t_3, beta, gamma, eff, vac_rate, a
+    )
+    with_multiwave = with_multiwave.astype(bool)
+
+    Y = np.zeros(shape=(len(time_points), 3, prev_y.shape[1]))
+    Y[0] = prev_y
+    history = None
+    if with_multiwave.any():
+        history = DelayBuffer(t_3, dt, time_points[0], prev_y.shape[1])
+        history.push(Y[0, 2])
+
+    population = np.sum(prev_y, axis=0)
+
+    args = {
+        "beta": beta,
+        "gamma": gamma,
+        "eff": eff,
+        "a": a,
+        "population": population,
+    }
+    exhausted = np.zeros(prev_y.shape[1], dtype=bool)
+    R1 = R2 = R4 = np.zeros_like(beta)
+
+    def step(curr_t, prev_y):
+        k1 = f(curr_t, prev_y, R_prev=R1, **args)
+        k2 = f(curr_t + dt2, prev_y + dt2 * k1, R_prev=R2, **args)
+        k3 = f(curr_t + dt2, prev_y + dt2 * k2, R_prev=R2, **args)
+        k4 = f(curr_t + dt, prev_y + dt * k3, R_prev=R4, **args)
+        return prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4)
+
+    for t in range(len(time_points) - 1):
+        curr_t = time_points[t]
+
+        dt2 = dt / 2
+        prev_y = Y[t]
+
+        vaccinating = (t_1 <= curr_t) & (curr_t < t_2 + 1) & ~exhausted
+        args["vac_rate"] = np.where(vaccinating, vac_rate, 0)
+
+        if history is not None:
+            R1 = np.where(with_multiwave, history.at(curr_t - t_3), 0)
+            R2 = np.where(with_multiwave, history.at(curr_t + dt2 - t_3), 0)
+            R4 = np.where(with_multiwave, history.at(curr_t + dt - t_3), 0)
+
+        S, I, R = step(curr_t, prev_y)
+        ran_out = (args["vac_rate"] != 0) & (S <= 0)
+        if ran_out.any():
+            # The step is taken again without vaccinations for the members
+            # whose susceptibles ran out, as in `solve_SIR_with_vaccination`.
+            fraction = np.divide(
+                prev_y[0],
+                prev_y[0] - S,
+                out=np.zeros_like(S),
+                where=ran_out & (prev_y[0] > 0),
+            )
+            supply = eff * args["vac_rate"] * dt * fraction
+            args["vac_rate"] = np.where(ran_out, 0, args["vac_rate"])
+            S, I, R = step(curr_t, prev_y)
+            vaccinated = np.where(ran_out, np.minimum(np.maximum(S, 0), supply), 0)
+            S, R = S - vaccinated, R + vaccinated
+            exhausted |= ran_out
+        S, I, R = np.maximum((S, I, R), 0)
+
+        S_full = S >= population
+        I_full = ~S_full & (I >= population)
+        R_full = ~S_full & ~I_full & (R >= population)
+        Y[t + 1, 0] = np.where(S_full, population, S)
+        Y[t + 1, 1] = np.where(I_full, population, I)
+        Y[t + 1, 2] = np.where(R_full, population, R)
+        if history is not None:
+            history.push(Y[t + 1, 2])
+
+    return solution(np.array(time_points), Y.transpose(2, 1, 0))
+
+
+def _mobility_matrix(mobility, n):
+    """Checks a mobility matrix and returns where the residents spend the day.
+
+    Returns:
+        tuple: The fractions of the residents of every region spent in every
+            region, staying at home on the diagonal, and their transpose, both
+            CSR.
+    """
+    from scipy import sparse
+
+    mobility = sparse.csr_matrix(mobility, dtype=float)
+    if mobility.shape != (n, n):
+        raise ValueError(
+            f"The mobility matrix has shape {mobility.shape}, expected {(n, n)}"
+        )
+    mobility = sparse.csr_matrix(mobility - sparse.diags(mobility.diagonal()))
+    mobility.eliminate_zeros()
+    if mobility.nnz and mobility.data.min() < 0:
+        raise ValueError("The mobility fractions must not be negative")
+    stay = 1 - np.asarray(mobility.sum(axis=1)).ravel()
+    if np.any(stay < -1e-12):
+        raise ValueError("More than all the residents of a region commute")
+    mobility = sparse.csr_matrix(mobility + sparse.diags(np.maximum(stay, 0)))
+    return mobility, mobility.T.tocsr()
+
+
+@instrument.traced("solve_SIR_metapopulation")
+def solve_SIR_metapopulation(
+    time_range,
+    y0,
+    mobility,
+    beta,
+    gamma,
+    t_1=0,
+    t_2=-1,
+    eff=0,
+    vac_rate=0,
+    with_multiwave=False,
+    t_3=0,
+    a=0,
+    dt=0.25,
+):
+    """Solves the SIR model with vaccination for N regions coupled by commuting.
+
+    `mobility[i, j]` is the fraction of the residents of region i who spend
+    the day in region j; the rest stay at home and the diagonal is ignored.
+    Infections happen where people are during the day: a region holds the
+    infectious residents who stay and the infectious commuters, and their
+    contacts infect its susceptible residents who stay and the susceptible
+    commuters who come in at the rate `beta` of the region. Everyone is
+    counted in the region they live in.
+
+    Every region has its own infection and recovery rates, vaccination
+    schedule and immunity loss. The regions are integrated together with
+    RK4: each stage is a handful of array operations over all the regions
+    and two products with the sparse mobility matrix, so the cost grows with
+    the number of regions and commuting links. Without mobility and with a
+    step of 0.05 days every region is integrated like
+    `solve_SIR_with_vaccination_ensemble` would integrate it.
+
+    Args:
+        time_range (tuple): Start and end of the simulation.
+        y0 (array_like): Initial values of shape (3,) or (N, 3).
+        mobility (array_like or scipy.sparse matrix): The commuting
+            fractions, of shape (N, N), converted to CSR
+        beta (float or array_like): The infection rate
+        gamma (float or array_like): The recovery rate
+        t_1 (float or array_like): Start of the vaccinations
+        t_2 (float or array_like): End of the vaccinations
+        eff (float or array_like): The vaccination efficiency
+        vac_rate (float or array_like): The number of vaccinations per day
+        with_multiwave (bool or array_like): indicates if recovered people
+            lose immunity, per region or for all of them
+        t_3 (float or array_like): delay after which recovered people start
+            losing immunity, in days
+        a (float or array_like): proportion of recovered people who lose
+            immunity
+        dt (float): The step of the integration, which must divide a day;
+            the default keeps within about 0.03% of the population of a
+            step of 0.01 days
+
+    Returns:
+        solution: Solution with `y` of shape (N, 3, T), sampled daily.
+    """
+    f = utils.models.SIR_metapopulation
+    n_regions = np.shape(mobility)[0]
+    y0 = np.asarray(y0, dtype=float)
+    if y0.ndim == 1:
+        y0 = np.broadcast_to(y0, (n_regions, 3))
+    (
+        prev_y,
+        t_1,
+        t_2,
+        with_multiwave,
+        t_3,
+        beta,
+        gamma,
+        eff,
+        vac_rate,
+        a,
+    ) = _broadcast_members(
+        y0, t_1, t_2, with_multiwave, t_3, beta, gamma, eff, vac_rate, a
+    )
+    with_multiwave = with_multiwave.astype(bool)
+    mobility, inflow = _mobility_matrix(mobility, prev_y.shape[1])
+
+    steps_per_day = int(round(1 / dt))
+    if steps_per_day < 1 or not np.isclose(steps_per_day * dt, 1):
+        raise ValueError(f"The step {dt} does not divide a day")
+    days = _time_grid(time_range, 1.0)
+    time_points = days[0] + np.arange((len(days) - 1) * steps_per_day + 1) * dt
+
+    Y = np.zeros(shape=(len(days), 3, prev_y.shape[1]))
+    Y[0] = prev_y
+    history = None
+    if with_multiwave.any():
+        history = DelayBuffer(t_3, dt, time_points[0], prev_y.shape[1])
+        history.push(prev_y[2])
+
+    population = np.sum(prev_y, axis=0)
+
+    args = {
+        "beta": beta,
+        "gamma": gamma,
+        "eff": eff,
+        "a": a,
+        "population": population,
+        "mobility": mobility,
+        "inflow": inflow,
+    }
+    R1 = R2 = R4 = np.zeros_like(beta)
+    dt2 = dt / 2
+    for t in range(len(time_points) - 1):
+        curr_t = time_points[t]
+
+        args["vac_rate"] = np.where((t_1 <= curr_t) & (curr_t < t_2 + 1), vac_rate, 0)
+
+        if history is not None:
+            R1 = np.where(with_multiwave, history.at(curr_t - t_3), 0)
+            R2 = np.where(with_multiwave, history.at(curr_t + dt2 - t_3), 0)
+            R4 = np.where(with_multiwave, history.at(curr_t + dt - t_3), 0)
+
+        k1 = f(curr_t, prev_y, R_prev=R1, **args)
+        k2 = f(curr_t + dt2, prev_y + dt2 * k1, R_prev=R2, **args)
+        k3 = f(curr_t + dt2, prev_y + dt2 * k2, R_prev=R2, **args)
+        k4 = f(curr_t + dt, prev_y + dt * k3, R_prev=R4, **args)
+        S, I, R = np.maximum(prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0)
+
+        S_full = S >= population
+        I_full = ~S_full & (I >= population)
+        R_full = ~S_full & ~I_full & (R >= population)
+        prev_y = np.stack(
+            [
+                np.where(S_full, population, S),
+                np.where(I_full, population, I),
+                np.where(R_full, population, R),
+            ]
+        )
+        if (t + 1) % steps_per_day == 0:
+            Y[(t + 1) // steps_per_day] = prev_y
+        if history is not None:
+            history.push(prev_y[2])
+
+    return solution(days, Y.transpose(2, 1, 0), n_steps=len(time_points) - 1)
+
+
+@instrument.traced("solve_SIR_age_structured")
+def solve_SIR_age_structured(
+    time_range,
+    y0,
+    contacts,
+    beta,
+    gamma,
+    susceptibility=1,
+    sigma=None,
+    t_1=0,
+    t_2=-1,
+    eff=0,
+    vac_rate=0,
+    with_multiwave=False,
+    t_3=0,
+    a=0,
+):
+    """Solves the SIR or SEIR model with vaccination for K age groups.
+
+    `contacts[i, j]` is the mean number of people of group j whom a person
+    of group i meets per day. A susceptible person of group i is infected at
+    the rate
+
+        beta * susceptibility[i] * sum_j contacts[i, j] * I[j] / N[j]
+
+    where N[j] is the size of group j, so `beta` is the probability that a
+    contact with an infectious person transmits the infection. The force of
+    infection of all the groups is one product with the contact matrix per
+    RK4 stage, so a step costs K^2 operations and no group is handled on
+    its own. The steps, the vaccinations and the immunity loss are those of
+    `solve_SIR_with_vaccination`, with the schedule, the vaccination rate
+    and the efficiency given per group to prioritise some of them.
+
+    Args:
+        time_range (tuple): Start and end of the simulation.
+        y0 (array_like): Initial values of shape (K, 3), or (K, 4) with the
+            exposed population second for the SEIR model
+        contacts (array_like): The contact matrix, of shape (K, K)
+        beta (float): The probability of transmission per contact
+        gamma (float or array_like): The recovery rate
+        susceptibility (float or array_like): The relative susceptibility
+        sigma (float or array_like): The rate at which exposed people become
+            infectious, for the SEIR model
+        t_1 (float or array_like): Start of the vaccinations
+        t_2 (float or array_like): End of the vaccinations
+        eff (float or array_like): The vaccination efficiency
+        vac_rate (float or array_like): The number of vaccinations per day
+        with_multiwave (bool or array_like): indicates if recovered people
+            lose immunity, per group or for all of them
+        t_3 (float or array_like): delay after which recovered people start
+            losing immunity, in days
+        a (float or array_like): proportion of recovered people who lose
+            immunity
+
+    Returns:
+        solution: Solution with `y` of shape (K, 3, T), or (K, 4, T) for the
+            SEIR model; `y.sum(axis=0)` is the whole population.
+    """
+    contacts = np.asarray(contacts, dtype=float)
+    y0 = np.asarray(y0, dtype=float)
+    k = len(contacts)
+    compartments = 3 if sigma is None else 4
+    if contacts.shape != (k, k):
+        raise ValueError(f"The contact matrix has shape {contacts.shape}")
+    if np.any(contacts < 0):
+        raise ValueError("The contacts must not be negative")
+    if y0.shape != (k, compartments):
+        raise ValueError(
+            f"The initial values have shape {y0.shape}, expected {(k, compartments)}"
+        )
+    (
+        t_1,
+        t_2,
+        with_multiwave,
+        t_3,
+        gamma,
+        susceptibility,
+        eff,
+        vac_rate,
+        a,
+    ) = (
+        np.broadcast_to(np.asarray(p, dtype=float), (k,)).copy()
+        for p in (
+            t_1,
+            t_2,
+            with_multiwave,
+            t_3,
+            gamma,
+            susceptibility,
+            eff,
+            vac_rate,
+            a,
+        )
+    )
+    with_multiwave = with_multiwave.astype(bool)
+
+    dt = 0.05
+    time_points = _time_grid(time_range, dt)
+    prev_y = y0.T.copy()
+    population = np.sum(prev_y, axis=0)
+    args = {
+        "beta": float(beta) * susceptibility,
+        "gamma": gamma,
+        "eff": eff,
+        "a": a,
+        "population": population,
+        "mixing": contacts
+        / np.where(population > 0, population, np.inf)[np.newaxis, :],
+    }
+    if sigma is None:
+        f = utils.models.SIR_age
+    else:
+        f = utils.models.SEIR_age
+        args["sigma"] = np.broadcast_to(np.asarray(sigma, dtype=float), (k,))
+
+    Y = np.zeros(shape=(len(time_points), compartments, k))
+    Y[0] = prev_y
+    history = None
+    if with_multiwave.any():
+        history = DelayBuffer(t_3, dt, time_points[0], k)
+        history.push(Y[0, -1])
+
+    R1 = R2 = R4 = np.zeros(k)
+    dt2 = dt / 2
+    for t in range(len(time_points) - 1):
+        curr_t = time_points[t]
+        prev_y = Y[t]
+
+        args["vac_rate"] = np.where((t_1 <= curr_t) & (curr_t < t_2 + 1), vac_rate, 0)
+
+        if history is not None:
+            R1 = np.where(with_multiwave, history.at(curr_t - t_3), 0)
+            R2 = np.where(with_multiwave, history.at(curr_t + dt2 - t_3), 0)
+            R4 = np.where(with_multiwave, history.at(curr_t + dt - t_3), 0)
+
+        k1 = f(curr_t, prev_y, R_prev=R1, **args)
+        k2 = f(curr_t + dt2, prev_y + dt2 * k1, R_prev=R2, **args)
+        k3 = f(curr_t + dt2, prev_y + dt2 * k2, R_prev=R2, **args)
+        k4 = f(curr_t + dt, prev_y + dt * k3, R_prev=R4, **args)
+        Y[t + 1] = np.clip(
+            prev_y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0, population
+        )
+        if history is not None:
+            history.push(Y[t + 1, -1])
+
+    return solution(
+        np.array(time_points),
+        Y.transpose(2, 1, 0),
+        compartments=("S", "I", "R") if sigma is None else ("S", "E", "I", "R"),
+    )
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def SIR(t, y, beta, gamma, a, R_prev):
     S, I, R = y
     _S = -beta * S * I
@@ -23,3 +26,102 @@ def SIR_with_vaccination(t, y, beta, gamma, eff, vac_rate, a, R_prev, population
         _R = population - R
 
     return [_S, _I, _R]
+
+
+def SIR_scalar(t, S, I, R, beta, gamma, a, R_prev):
+    _S = -beta * S * I
+    _R = gamma * I
+    _I = beta * S * I - _R
+    diff = a * R_prev
+    if R - diff < 0:
+        diff = 0
+    return _S + diff, _I, _R - diff
+
+
+def SIR_with_vaccination_scalar(
+    t, S, I, R, beta, gamma, eff, vac_rate, a, R_prev, population
+):
+    diff_m = a * R_prev
+    diff_v = eff * vac_rate
+
+    _S = -beta * S * I + diff_m - diff_v
+    _I = beta * S * I - gamma * I
+    _R = gamma * I - diff_m + diff_v
+
+    if R >= population:
+        _R = population - R
+
+    return _S, _I, _R
+
+
+def SIR_ensemble(t, y, beta, gamma, a, R_prev):
+    S, I, R = y
+    _S = -beta * S * I
+    _R = gamma * I
+    _I = beta * S * I - _R
+    diff = a * R_prev
+    diff = np.where(R - diff < 0, 0, diff)
+    return np.stack([_S + diff, _I, _R - diff])
+
+
+def SIR_with_vaccination_ensemble(
+    t, y, beta, gamma, eff, vac_rate, a, R_prev, population
+):
+    S, I, R = y
+    diff_m = a * R_prev
+    diff_v = eff * vac_rate
+
+    _S = -beta * S * I + diff_m - diff_v
+    _I = beta * S * I - gamma * I
+    _R = gamma * I - diff_m + diff_v
+    _R = np.where(R >= population, population - R, _R)
+
+    return np.stack([_S, _I, _R])
+
+
+def SIR_metapopulation(
+    t, y, beta, gamma, eff, vac_rate, a, R_prev, population, mobility, inflow
+):
+    S, I, R = y
+    # The infectious people present in every region during the day, weighted
+    # by its infection rate, infect the susceptible people present there
+    pressure = beta * (inflow @ I)
+    infections = S * (mobility @ pressure)
+    diff_m = a * R_prev
+    diff_v = eff * vac_rate
+
+    _S = -infections + diff_m - diff_v
+    _I = infections - gamma * I
+    _R = gamma * I - diff_m + diff_v
+    _R = np.where(R >= population, population - R, _R)
+
+    return np.stack([_S, _I, _R])
+
+
+def SIR_age(t, y, beta, gamma, eff, vac_rate, a, R_prev, population, mixing):
+    S, I, R = y
+    infections = beta * S * (mixing @ I)
+    diff_m = a * R_prev
+    diff_v = eff * vac_rate
+
+    _S = -infections + diff_m - diff_v
+    _I = infections - gamma * I
+    _R = gamma * I - diff_m + diff_v
+    _R = np.where(R >= population, population - R, _R)
+
+    return np.stack([_S, _I, _R])
+
+
+def SEIR_age(t, y, beta, sigma, gamma, eff, vac_rate, a, R_prev, population, mixing):
+    S, E, I, R = y
+    infections = beta * S * (mixing @ I)
+    diff_m = a * R_prev
+    diff_v = eff * vac_rate
+
+    _S = -infections + diff_m - diff_v
+    _E = infections - sigma * E
+    _I = sigma * E - gamma * I
+    _R = gamma * I - diff_m + diff_v
+    _R = np.where(R >= population, population - R, _R)
+
+    return np.stack([_S, _E, _I, _R])
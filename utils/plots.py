@@ -1,6 +1,9 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from .mathematics import find_max_and_argmax
+from matplotlib.figure import Figure
+from . import instrument
+from .decimate import ViewDecimator
+from .mathematics import find_infectious_peak
 import pickle as pkl
 
 
@@ -22,82 +25,255 @@ colors = [
 line_styles = ["-", "--", "-.", ":"]
 
 
-def plot_SIR(y, t, beta, gamma, already_plotted=False) -> plt.Figure:
-    plt.style.use("fivethirtyeight")
-    plt.rcParams.update({"font.size": 10})
-    np.set_printoptions(suppress=True)
-
-    S, I, R = y.y[0, :], y.y[1, :], y.y[2, :]
-    max_x, max_y = find_max_and_argmax(t, I)
-    r_0_text = "$R_0 = " + str(round(beta * S[0] / gamma, 3)) + "$"
-    max_infectious_text = (
-        "$I_{\\mathrm{max}}(t) = "
-        + str(int(round(max_y, 0)))
-        + "\\;\\mathrm{at}\\;\\mathtt{t="
-        + str(int(round(max_x, 0)))
-        + "}$"
-    )
-    r_tmax_text = (
-        "$R\\left({t_\\mathrm{max}}\\right) = " + str(int(round(R[-1], 0))) + "$"
-    )
-
-    fig, ax = None, None
-    plot_num = 0
-
-    if already_plotted:
-        try:
-            with open(".fig.pkl", "rb") as f:
-                fig, plot_num = pkl.load(f)
-                plt.subplots_adjust(top=1, bottom=0, left=0, right=1)
-                ax = fig.axes[0]
-                if plot_num == 4:
-                    plot_num = 0
-        except (FileNotFoundError, OSError):
-            fig = plt.figure()
-            plt.subplots_adjust(top=1, bottom=0, left=0, right=1)
-            ax = fig.add_subplot(111)
-            plt.text(
-                0.05,
-                0.96,
-                "© M. Urban, J. Jodłowska, J. Balbus, K. Kubica",
-                fontsize=10,
-                transform=plt.gcf().transFigure,
-            )
-            ax.ticklabel_format(axis="y", useOffset=False, style="Plain")
-            ax.set_xlabel("Time [days]")
-            ax.set_ylabel("Number of people")
-
-    else:
-        fig = plt.figure()
-        plt.subplots_adjust(top=1, bottom=0.01, left=0.01, right=1)
-        ax = fig.add_subplot(111)
-        plt.text(
+class OverlayFigure:
+    """Figure on which consecutive runs of the model are overlaid.
+
+    The live figure and its lines stay in memory. Each of the four line
+    styles has one set of lines: the first four runs create them and every
+    later run replaces the data of the oldest run with `set_data`, so the
+    cost of drawing the figure does not grow over a session. The lines show
+    the runs decimated to the pixels of the current view, and are decimated
+    again on zoom. `save` and `restore` keep an overlay across sessions.
+    """
+
+    def __init__(self):
+        plt.style.use("fivethirtyeight")
+        plt.rcParams.update({"font.size": 10})
+        np.set_printoptions(suppress=True)
+
+        self.fig = Figure(figsize=(10, 8))
+        self.fig.subplots_adjust(top=1, bottom=0.01, left=0.01, right=1)
+        self.ax = self.fig.add_subplot(111)
+        self.fig.text(
             0.05,
             0.98,
             "© M. Urban, J. Jodłowska, J. Balbus, K. Kubica",
             fontsize=10,
-            transform=plt.gcf().transFigure,
+            transform=self.fig.transFigure,
+        )
+        self.ax.ticklabel_format(axis="y", useOffset=False, style="Plain")
+        self.ax.set_xlabel("Time [days]")
+        self.ax.set_ylabel("Number of people")
+        self.decimator = ViewDecimator(self.ax)
+        self.runs = []
+        self.fills = {}
+        self.count = 0
+
+    @instrument.traced("plot.add")
+    def add(self, y, t, beta, gamma):
+        """Plots a run on top of the previous ones.
+
+        Args:
+            y (solution): The solution
+            t (np.ndarray): The time points of the solution
+            beta (float): The infection rate
+            gamma (float): The recovery rate
+
+        Returns:
+            matplotlib.figure.Figure: The figure.
+        """
+        S, I, R = y.y[0, :], y.y[1, :], y.y[2, :]
+        max_x, max_y = find_infectious_peak(y, t, I)
+        r_0_text = "$R_0 = " + str(round(beta * S[0] / gamma, 3)) + "$"
+        max_infectious_text = (
+            "$I_{\\mathrm{max}}(t) = "
+            + str(int(round(max_y, 0)))
+            + "\\;\\mathrm{at}\\;\\mathtt{t="
+            + str(int(round(max_x, 0)))
+            + "}$"
         )
-        ax.ticklabel_format(axis="y", useOffset=False, style="Plain")
-        ax.set_xlabel("Time [days]")
-        ax.set_ylabel("Number of people")
+        r_tmax_text = (
+            "$R\\left({t_\\mathrm{max}}\\right) = " + str(int(round(R[-1], 0))) + "$"
+        )
+
+        plot_num = self.count % len(line_styles)
+        self.count += 1
+        for fill in self.fills.pop(plot_num, []):
+            fill.remove()
+        labels = ["Susceptible", "Infectious", "Recovered"]
+        labels += [r_0_text, max_infectious_text, r_tmax_text]
+        data = [(t, S), (t, I), (t, R), ([0], [0]), ([0], [0]), ([0], [0])]
+
+        ax = self.ax
+        lines = self._lines(plot_num)
+        for line, (x, y_data) in zip(lines[:3], data):
+            self.decimator.set_data(line, x, y_data)
+        for line, (x, y_data) in zip(lines[3:], data[3:]):
+            line.set_data(x, y_data)
+        for line, label in zip(lines, labels):
+            line.set_label(label)
+            line.set_visible(True)
+            line.set_animated(False)
+
+        ax.relim(visible_only=True)
+        for fills in self.fills.values():
+            for fill in fills:
+                ax.update_datalim(fill.get_datalim(ax.transData))
+        ax.autoscale()
+        shown = self.runs[: min(self.count, len(self.runs))]
+        with instrument.span("plot.legend", runs=len(shown)):
+            ax.legend(
+                handles=[line for lines in shown for line in lines],
+                handlelength=4,
+                framealpha=1,
+            )
+        with instrument.span("plot.layout"):
+            self.fig.tight_layout()
+        return self.fig
+
+    def add_bands(self, bands, beta, gamma):
+        """Plots the median of stochastic realisations with their bands.
+
+        The median is plotted like a run, and every symmetric pair of
+        percentiles around it is shaded in the colors of the run.
+
+        Args:
+            bands (percentile_bands): The percentiles of the realisations
+                (see `utils.stochastic.simulate`)
+            beta (float): The infection rate
+            gamma (float): The recovery rate
+
+        Returns:
+            matplotlib.figure.Figure: The figure.
+
+        Raises:
+            ValueError: If the percentiles lack the median or do not pair up
+                symmetrically around it, like (5, 25, 50, 75, 95).
+        """
+        percentiles = list(bands.percentiles)
+        pairs = [(p, 100 - p) for p in percentiles if p < 50]
+        if (
+            50 not in percentiles
+            or len(percentiles) != 2 * len(pairs) + 1
+            or any(upper not in percentiles for _, upper in pairs)
+        ):
+            raise ValueError(
+                f"The percentiles {tuple(percentiles)} must contain 50 and pair "
+                "up symmetrically around it."
+            )
+        plot_num = self.count % len(line_styles)
+        figure = self.add(bands.percentile(50), bands.t, beta, gamma)
+        fills = []
+        for lower, upper in pairs:
+            for k, line in enumerate(self.runs[plot_num][:3]):
+                fills.append(
+                    self.ax.fill_between(
+                        bands.t,
+                        bands.values[percentiles.index(lower), k],
+                        bands.values[percentiles.index(upper), k],
+                        color=line.get_color(),
+                        alpha=0.15,
+                        linewidth=0,
+                    )
+                )
+        self.fills[plot_num] = fills
+        return figure
+
+    def _lines(self, plot_num):
+        """Returns the lines of a line style, creating them on first use.
+
+        Every line style has one set of lines, which later runs in the same
+        style reuse, so the figure never holds more than four runs.
+        """
+        if plot_num < len(self.runs):
+            return self.runs[plot_num]
+        line_colors = [colors[plot_num], colors[plot_num + 4], colors[plot_num + 8]]
+        lines = []
+        for color in line_colors:
+            lines += self.ax.plot([], [], line_styles[plot_num], color=color)
+        for _ in range(3):
+            lines += self.ax.plot([], [], color="none")
+        self.runs.append(lines)
+        return lines
+
+    def begin_stream(self, time_range, population):
+        """Prepares the lines of the next run to be drawn while it is solved.
+
+        The limits of the axes are fixed to the time range and the population
+        so the streamed chunks can be blitted onto a static background. The
+        lines are animated, hence left out of regular draws, until `add`
+        plots the whole run.
+
+        Args:
+            time_range (tuple): The start and end of the simulation
+            population (float): The total population
+
+        Returns:
+            list: The susceptible, infectious and recovered lines.
+        """
+        lines = self._lines(self.count % len(line_styles))[:3]
+        for line in lines:
+            self.decimator.discard(line)
+            line.set_data([], [])
+            line.set_visible(True)
+            line.set_animated(True)
+        x_margin = 0.05 * (time_range[1] - time_range[0])
+        left, right = time_range[0] - x_margin, time_range[1] + x_margin
+        bottom, top = -0.05 * population, 1.05 * population
+        if self.count:
+            (x0, x1), (y0, y1) = self.ax.get_xlim(), self.ax.get_ylim()
+            left, right = min(left, x0), max(right, x1)
+            bottom, top = min(bottom, y0), max(top, y1)
+        self.ax.set_xlim(left, right)
+        self.ax.set_ylim(bottom, top)
+        return lines
+
+    def clear(self):
+        """Removes every run from the figure."""
+        for lines in self.runs:
+            for line in lines:
+                line.set_visible(False)
+        self.count = 0
+        for fills in self.fills.values():
+            for fill in fills:
+                fill.remove()
+        self.fills.clear()
+        if self.ax.get_legend() is not None:
+            self.ax.get_legend().remove()
+
+    def save(self, path):
+        """Pickles the overlay to `path`.
+
+        Args:
+            path (str): The file
+        """
+        with instrument.span("overlay.save"), open(path, "wb") as f:
+            pkl.dump(self, f, protocol=pkl.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def restore(path):
+        """Loads an overlay saved with `save`.
+
+        Args:
+            path (str): The file
+
+        Returns:
+            OverlayFigure: The overlay.
+        """
+        with instrument.span("overlay.restore"), open(path, "rb") as f:
+            overlay = pkl.load(f)
+        overlay.decimator.connect()
+        return overlay
+
 
-    line_colors = [colors[plot_num], colors[plot_num + 4], colors[plot_num + 8]]
-    line_style = line_styles[plot_num]
+overlay = None
 
-    fig.set_figwidth(10)
-    fig.set_figheight(8)
 
-    ax.plot(t, S, line_style, color=line_colors[0], label="Susceptible")
-    ax.plot(t, I, line_style, color=line_colors[1], label="Infectious")
-    ax.plot(t, R, line_style, color=line_colors[2], label="Recovered")
-    ax.plot(0, 0, color="none", label=r_0_text)
-    ax.plot(0, 0, color="none", label=max_infectious_text)
-    ax.plot(0, 0, color="none", label=r_tmax_text)
+def plot_SIR(y, t, beta, gamma, already_plotted=False) -> Figure:
+    """Plots a run on a new figure, or on top of the previous runs when
+    `already_plotted`, using the module's `overlay`.
 
-    ax.legend(handlelength=4, framealpha=1)
-    plt.tight_layout()
-    data_to_save = [fig, plot_num + 1]
-    pkl.dump(data_to_save, open(".fig.pkl", "wb"))
+    Args:
+        y (solution): The solution
+        t (np.ndarray): The time points of the solution
+        beta (float): The infection rate
+        gamma (float): The recovery rate
+        already_plotted (bool): whether to overlay the previous runs
 
-    return fig
+    Returns:
+        matplotlib.figure.Figure: The figure.
+    """
+    global overlay
+    if overlay is None or not already_plotted:
+        overlay = OverlayFigure()
+    return overlay.add(y, t, beta, gamma)
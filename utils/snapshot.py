@@ -0,0 +1,106 @@
+"""Raster snapshot of the startup figure.
+
+`model.pyw` shows the snapshot as soon as its window opens and builds the
+interactive figure in the background. A snapshot is keyed on the default
+parameters, the versions of NumPy and matplotlib and the code that solves,
+decimates and plots the scenario, so it is rendered again whenever any of
+them changes. Snapshots are kept in
+``SIR_MODEL_CACHE_DIR``, ``~/.cache/sir_model`` by default.
+
+The module avoids importing matplotlib so that it can run before the window
+appears.
+"""
+
+import hashlib
+import json
+import os
+from importlib import metadata
+
+FORMAT = 1
+
+# The modules whose code shapes the startup figure
+SOURCES = ("plots.py", "decimate.py", "mathematics.py", "models.py", "history.py")
+
+
+def _directory():
+    return os.environ.get("SIR_MODEL_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "sir_model"
+    )
+
+
+def snapshot_key(params):
+    """Creates the key of the snapshot of a scenario.
+
+    Args:
+        params (dict): The parameters of the scenario
+
+    Returns:
+        str: The key.
+    """
+    versions = {}
+    for package in ("numpy", "matplotlib"):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    sources = hashlib.sha256()
+    for name in SOURCES:
+        with open(os.path.join(os.path.dirname(__file__), name), "rb") as f:
+            sources.update(hashlib.sha256(f.read()).digest())
+    record = json.dumps([FORMAT, params, versions, sources.hexdigest()], sort_keys=True)
+    return hashlib.sha256(record.encode()).hexdigest()[:16]
+
+
+def load_snapshot(params):
+    """Finds the snapshot of a scenario.
+
+    Args:
+        params (dict): The parameters of the scenario
+
+    Returns:
+        dict: The "path" of the PNG and the "dpi" of the figure, or None if
+            there is no snapshot for these parameters.
+    """
+    base = os.path.join(_directory(), "startup-" + snapshot_key(params))
+    try:
+        with open(base + ".json") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(base + ".png"):
+        return None
+    return {"path": base + ".png", "dpi": info["dpi"]}
+
+
+def save_snapshot(fig, params):
+    """Renders the snapshot of a scenario.
+
+    Args:
+        fig (matplotlib.figure.Figure): The figure of the scenario, at the
+            size it is shown at
+        params (dict): The parameters of the scenario
+    """
+    os.makedirs(_directory(), exist_ok=True)
+    base = os.path.join(_directory(), "startup-" + snapshot_key(params))
+    # Written under temporary names and renamed, so an instance starting at
+    # the same time never reads a partial snapshot.
+    fig.savefig(base + ".tmp.png", dpi=fig.dpi, format="png")
+    os.replace(base + ".tmp.png", base + ".png")
+    with open(base + ".tmp.json", "w") as f:
+        json.dump({"dpi": fig.dpi}, f)
+    os.replace(base + ".tmp.json", base + ".json")
+
+
+def show_snapshot(canvas, path):
+    """Shows a snapshot on a Tk canvas until the canvas is cleared.
+
+    Args:
+        canvas (tk.Canvas): The canvas
+        path (str): The PNG of the snapshot
+    """
+    import tkinter as tk
+
+    image = tk.PhotoImage(file=path, master=canvas)
+    canvas.create_image(0, 0, image=image, anchor="nw", tags="snapshot")
+    # Tk does not keep a reference to the image.
+    canvas.snapshot = image
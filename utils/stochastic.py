@@ -0,0 +1,262 @@
+"""Stochastic SIR models, for fade-out probabilities and prediction bands.
+
+The populations are whole people and every infection, recovery, loss of
+immunity and vaccination is a random event, with the rates of the
+deterministic models in `utils.models`:
+
+- infection, S -> I, at rate beta * S * I
+- recovery, I -> R, at rate gamma * I
+- loss of immunity, R -> S, at rate a * R(t - t_3) with multiwave
+- vaccination, S -> R, at rate eff * vac_rate from t_1 until t_2 + 1 while
+  anyone is susceptible
+
+Two engines simulate the events:
+
+- "gillespie" draws every event exactly, one realisation at a time. The
+  delayed and switched rates are held for a day at a time, which is where
+  the deterministic models change them too. Its cost grows with the number
+  of events, so it suits small populations.
+- "tau" (tau-leaping) advances all the realisations of a shard together by
+  steps of `dt`, drawing the number of events of every step as binomial
+  (infections, recoveries) and Poisson (loss of immunity, vaccinations)
+  variables, so thousands of realisations cost a few array operations per
+  step.
+
+`simulate` splits the realisations into shards of a fixed size. Every shard
+has its own random stream spawned from the seed, so the results depend on
+the seed only, not on the number of worker processes. The shards run across
+cores and are summarised as they finish (see `utils.aggregate`), so the
+memory does not grow with the number of realisations. The result is a set
+of percentile bands which `utils.plots.OverlayFigure.add_bands` draws.
+
+Example:
+    >>> result = simulate((0, 150), [1e6, 1, 0], 2000, seed=1, beta=4e-7,
+    ...                   gamma=0.2)
+    >>> result.fade_out, result.percentile(50)
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from utils.aggregate import PERCENTILES, StreamingSummary, percentile_bands
+from utils.history import DelayBuffer
+from utils.mathematics import _time_grid
+
+
+def _params(
+    beta,
+    gamma,
+    a=0,
+    t_3=0,
+    with_multiwave=False,
+    t_1=0,
+    t_2=-1,
+    eff=0,
+    vac_rate=0,
+    vaccination=False,
+):
+    """Collects the parameters of a model run; vaccinations need `vaccination`."""
+    if not vaccination:
+        eff, vac_rate = 0, 0
+    return {
+        "beta": float(beta),
+        "gamma": float(gamma),
+        "a": float(a) if with_multiwave else 0.0,
+        "t_3": float(t_3),
+        "t_1": float(t_1),
+        "t_2": float(t_2),
+        "vac": float(eff) * float(vac_rate),
+    }
+
+
+def _gillespie(rng, days, y0, p):
+    """Simulates one realisation exactly.
+
+    Returns:
+        tuple: The populations of shape (3, T) and the number of infections.
+    """
+    S, I, R = (int(round(v)) for v in y0)
+    out = np.empty((3, len(days)), dtype=np.int64)
+    out[:, 0] = S, I, R
+    history = DelayBuffer(max(p["t_3"], 1), 1, days[0]) if p["a"] else None
+    if history is not None:
+        history.push(R)
+    infections = 0
+    beta, gamma = p["beta"], p["gamma"]
+    for k in range(1, len(days)):
+        day = days[k - 1]
+        loss = p["a"] * history.at(day - p["t_3"]) if history is not None else 0.0
+        vac = p["vac"] if p["t_1"] <= day < p["t_2"] + 1 else 0.0
+        t = day
+        while True:
+            r_inf = beta * S * I
+            r_rec = gamma * I
+            r_loss = loss if R > 0 else 0.0
+            r_vac = vac if S > 0 else 0.0
+            total = r_inf + r_rec + r_loss + r_vac
+            if total <= 0:
+                break
+            t += rng.exponential(1 / total)
+            if t >= days[k]:
+                break
+            u = rng.random() * total
+            if u < r_inf:
+                S, I = S - 1, I + 1
+                infections += 1
+            elif u < r_inf + r_rec:
+                I, R = I - 1, R + 1
+            elif u < r_inf + r_rec + r_loss:
+                R, S = R - 1, S + 1
+            else:
+                S, R = S - 1, R + 1
+        out[:, k] = S, I, R
+        if history is not None:
+            history.push(R)
+    return out, infections
+
+
+def _tau_leap(rng, days, y0, p, n, dt):
+    """Simulates `n` realisations together by tau-leaping.
+
+    Returns:
+        tuple: The populations of shape (n, 3, T) and the number of
+            infections of every realisation.
+    """
+    S, I, R = (np.full(n, int(round(v)), dtype=np.int64) for v in y0)
+    out = np.empty((n, 3, len(days)), dtype=np.int64)
+    out[:, :, 0] = np.stack([S, I, R], axis=1)
+    history = DelayBuffer(max(p["t_3"], 1), 1, days[0], n) if p["a"] else None
+    if history is not None:
+        history.push(R)
+    infections = np.zeros(n, dtype=np.int64)
+    steps = max(int(round(1 / dt)), 1)
+    dt = 1 / steps
+    p_rec = -np.expm1(-p["gamma"] * dt)
+    for k in range(1, len(days)):
+        day = days[k - 1]
+        loss = p["a"] * history.at(day - p["t_3"]) * dt if history is not None else 0
+        vac = p["vac"] * dt if p["t_1"] <= day < p["t_2"] + 1 else 0
+        for _ in range(steps):
+            new_inf = rng.binomial(S, -np.expm1(-p["beta"] * I * dt))
+            new_rec = rng.binomial(I, p_rec)
+            lost = np.minimum(rng.poisson(loss, n), R) if history is not None else 0
+            vaccinated = np.minimum(rng.poisson(vac, n), S - new_inf) if vac else 0
+            S = S - new_inf + lost - vaccinated
+            I = I + new_inf - new_rec
+            R = R + new_rec - lost + vaccinated
+            infections += new_inf
+        out[:, 0, k], out[:, 1, k], out[:, 2, k] = S, I, R
+        if history is not None:
+            history.push(R)
+    return out, infections
+
+
+def _run_shard(task):
+    """Simulates one shard of realisations with its own random stream."""
+    method, seed, n, days, y0, p, dt = task
+    rng = np.random.default_rng(seed)
+    if method == "tau":
+        return _tau_leap(rng, days, y0, p, n, dt)
+    runs = [_gillespie(rng, days, y0, p) for _ in range(n)]
+    return np.stack([y for y, _ in runs]), np.array([c for _, c in runs])
+
+
+def _shards(tasks, workers):
+    """Yields the results of the shards in order.
+
+    At most two shards per worker are in flight, so the results waiting to
+    be consumed stay bounded however many shards there are.
+    """
+    if workers == 1 or len(tasks) == 1:
+        yield from map(_run_shard, tasks)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        window = 2 * (workers or os.cpu_count() or 1)
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_run_shard, task))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def simulate(
+    time_range,
+    y0,
+    n_runs,
+    method="tau",
+    seed=None,
+    dt=0.05,
+    workers=1,
+    shard_size=None,
+    percentiles=PERCENTILES,
+    minor=0.01,
+    keep=False,
+    vaccination=False,
+    **params,
+):
+    """Simulates realisations of the stochastic SIR model.
+
+    Args:
+        time_range (tuple): Start and end of the simulation, in days
+        y0 (array_like): Initial susceptible, infectious and recovered
+        n_runs (int): The number of realisations
+        method (str): "tau" for tau-leaping, "gillespie" for exact events
+        seed (int or np.random.SeedSequence): Seed of the random streams
+        dt (float): The step of tau-leaping, in days
+        workers (int): Number of worker processes, None for all cores
+        shard_size (int): Realisations per random stream and task, 1000 for
+            tau-leaping and 10 for Gillespie by default
+        percentiles (tuple): The percentiles of the bands
+        minor (float): Fraction of the population infected below which an
+            outbreak which died out counts as a fade-out
+        keep (bool): whether to keep every realisation, for exact
+            percentiles; otherwise the shards are summarised as they finish
+            by a `StreamingSummary`, in constant memory
+        vaccination (bool): whether to vaccinate
+        **params: beta, gamma and, as for `solve_SIR` and
+            `solve_SIR_with_vaccination`, a, t_3, with_multiwave, t_1, t_2,
+            eff and vac_rate
+
+    Returns:
+        percentile_bands: The daily percentiles of the populations.
+    """
+    if method not in ("tau", "gillespie"):
+        raise ValueError(f"Unknown method {method!r}")
+    days = _time_grid(time_range, 1.0)
+    p = _params(vaccination=vaccination, **params)
+    shard_size = shard_size or (1000 if method == "tau" else 10)
+    sizes = [min(shard_size, n_runs - i) for i in range(0, n_runs, shard_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(method, s, n, days, y0, p, dt) for s, n in zip(seeds, sizes)]
+
+    population = float(np.sum(y0))
+    summary = StreamingSummary(days, population)
+    kept, faded = [], 0
+    for trajectories, infections in _shards(tasks, workers):
+        faded += int(
+            np.sum((trajectories[:, 1, -1] == 0) & (infections < minor * population))
+        )
+        if keep:
+            kept.append(trajectories)
+        else:
+            summary.update(trajectories)
+
+    percentiles = tuple(sorted(percentiles))
+    if not keep:
+        return summary.bands(percentiles, faded / n_runs, minor)
+    trajectories = np.concatenate(kept)
+    return percentile_bands(
+        days,
+        percentiles,
+        np.percentile(trajectories, percentiles, axis=0),
+        trajectories.mean(axis=0),
+        n_runs,
+        faded / n_runs,
+        minor,
+        trajectories,
+    )
@@ -0,0 +1,305 @@
+"""Columnar on-disk format for solutions and ensembles.
+
+A file holds the trajectories of N members (one for a single solution) over
+T shared time points, the parameters of every member and free-form metadata.
+It starts with a short JSON header which locates a set of raw, aligned
+arrays:
+
+- ``t``, the time points, always float64, shape (T,)
+- ``y``, the trajectories, float64 or float32, stored in chunks along time
+  of shape (n_chunks, compartments, N, chunk), so one compartment of every
+  member over a time window is contiguous and one member over all times is
+  a few strided reads per chunk
+- one float64 array of shape (N,) per parameter
+
+`open_columnar` memory-maps the arrays, so slicing a member or a compartment
+out of a large sweep reads only the chunks it touches.
+
+Example:
+    >>> f = open_columnar("sweep/trajectories.sir")
+    >>> f.compartment("I", members=slice(0, 10), times=slice(0, 500))
+    >>> f.member(42)
+"""
+
+import json
+
+import numpy as np
+
+import utils.mathematics as mat
+
+MAGIC = b"SIRCOL\x00\x01"
+ALIGN = 64
+COMPARTMENTS = ("S", "I", "R")
+
+
+def _align(n):
+    return -(-n // ALIGN) * ALIGN
+
+
+def _compartments(n):
+    """Names `n` compartments of a solution which does not name them."""
+    if n == len(COMPARTMENTS):
+        return COMPARTMENTS
+    return tuple(f"C{k}" for k in range(n))
+
+
+def create(
+    path,
+    t,
+    n_members,
+    params=None,
+    metadata=None,
+    dtype=np.float64,
+    chunk=4096,
+    compartments=COMPARTMENTS,
+):
+    """Creates an empty file for `n_members` trajectories over `t`.
+
+    The trajectories are filled in afterwards with `ColumnarFile.write`,
+    possibly by several processes writing different members.
+
+    Args:
+        path (str): The file
+        t (np.ndarray): The time points
+        n_members (int): The number of members
+        params (dict): Arrays of shape (n_members,) keyed by parameter name
+        metadata (dict): JSON serializable description of the run
+        dtype (np.dtype): float64 or float32, the type of the trajectories
+        chunk (int): The number of time points per chunk
+        compartments (tuple): The names of the compartments
+
+    Returns:
+        ColumnarFile: The file, open for writing.
+    """
+    t = np.asarray(t, dtype="<f8")
+    dtype = np.dtype(dtype).newbyteorder("<")
+    if dtype.kind != "f":
+        raise ValueError("Trajectories are stored as float32 or float64")
+    params = {k: np.asarray(v, dtype="<f8") for k, v in (params or {}).items()}
+    for name, values in params.items():
+        if values.shape != (n_members,):
+            raise ValueError(f"Parameter {name} must have one value per member")
+    chunk = max(1, min(int(chunk), len(t) or 1))
+    n_chunks = -(-len(t) // chunk)
+
+    arrays, offset = {}, 0
+    for name, dt, shape in [
+        ("t", "<f8", (len(t),)),
+        ("y", dtype.str, (n_chunks, len(compartments), n_members, chunk)),
+        *((f"param:{k}", "<f8", (n_members,)) for k in params),
+    ]:
+        arrays[name] = {"offset": offset, "dtype": dt, "shape": list(shape)}
+        offset = _align(offset + int(np.prod(shape)) * np.dtype(dt).itemsize)
+    header = json.dumps(
+        {
+            "n_members": n_members,
+            "n_times": len(t),
+            "chunk": chunk,
+            "compartments": list(compartments),
+            "arrays": arrays,
+            "metadata": metadata or {},
+        }
+    ).encode()
+    start = _align(len(MAGIC) + 8 + len(header))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC + len(header).to_bytes(8, "little") + header)
+        f.truncate(start + offset)
+    f = ColumnarFile(path, "r+")
+    f.t[:] = t
+    for name, values in params.items():
+        f.params[name][:] = values
+    return f
+
+
+class ColumnarFile:
+    """Memory-mapped view of a file written by `create`.
+
+    Attributes:
+        t (np.memmap): The time points
+        params (dict): The parameters of the members
+        metadata (dict): The description of the run
+        compartments (list): The names of the compartments
+        n_members (int): The number of members
+        n_times (int): The number of time points
+
+    Args:
+        path (str): The file
+        mode (str): "r" to read, "r+" to write trajectories
+    """
+
+    def __init__(self, path, mode="r"):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a columnar solution file")
+            size = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(size))
+        start = _align(len(MAGIC) + 8 + size)
+
+        def array(name):
+            spec = header["arrays"][name]
+            return np.memmap(
+                path,
+                dtype=spec["dtype"],
+                mode=mode,
+                offset=start + spec["offset"],
+                shape=tuple(spec["shape"]),
+            )
+
+        self.path = path
+        self.n_members = header["n_members"]
+        self.n_times = header["n_times"]
+        self.chunk = header["chunk"]
+        self.compartments = header["compartments"]
+        self.metadata = header["metadata"]
+        self.t = array("t")
+        self.data = array("y")
+        self.params = {
+            name.split(":", 1)[1]: array(name)
+            for name in header["arrays"]
+            if name.startswith("param:")
+        }
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    def write(self, start, y):
+        """Writes the trajectories of consecutive members.
+
+        Args:
+            start (int): The index of the first member
+            y (np.ndarray): The trajectories, of shape (n, compartments, T),
+                or (compartments, T) for one member
+        """
+        y = np.asarray(y)
+        if y.ndim == 2:
+            y = y[np.newaxis]
+        stop = start + len(y)
+        for k in range(self.data.shape[0]):
+            lo = k * self.chunk
+            hi = min(lo + self.chunk, self.n_times)
+            self.data[k, :, start:stop, : hi - lo] = y[:, :, lo:hi].transpose(1, 0, 2)
+
+    def flush(self):
+        """Writes the changes to the file."""
+        self.data.flush()
+
+    def _index(self, key, size):
+        if isinstance(key, (int, np.integer)):
+            return np.array([range(size)[key]]), True
+        return np.arange(size)[key], False
+
+    def read(self, members=slice(None), compartments=slice(None), times=slice(None)):
+        """Reads a part of the trajectories.
+
+        Integer selections drop their axis, like in NumPy indexing.
+
+        Args:
+            members (int, slice or array_like): The members
+            compartments (int, str, slice or array_like): The compartments,
+                by position or name
+            times (int, slice or array_like): The time points
+
+        Returns:
+            np.ndarray: The values, of shape (members, compartments, times).
+        """
+        if isinstance(compartments, str):
+            compartments = self.compartments.index(compartments)
+        elif not isinstance(compartments, (slice, int, np.integer)):
+            compartments = [
+                self.compartments.index(c) if isinstance(c, str) else c
+                for c in compartments
+            ]
+        m, drop_m = self._index(members, self.n_members)
+        c, drop_c = self._index(compartments, len(self.compartments))
+        i, drop_t = self._index(times, self.n_times)
+
+        chunks, offsets = np.divmod(i, self.chunk)
+        out = np.empty((len(c), len(m), len(i)), dtype=self.dtype)
+        # Consecutive time points of one chunk are read in one piece.
+        bounds = np.flatnonzero(np.diff(chunks)) + 1
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(i)]):
+            if lo == hi:
+                continue
+            block = self.data[chunks[lo]]
+            out[:, :, lo:hi] = block[np.ix_(c, m, offsets[lo:hi])]
+        out = out.transpose(1, 0, 2)
+        drop = tuple(axis for axis, d in enumerate((drop_m, drop_c, drop_t)) if d)
+        return out.squeeze(drop) if drop else out
+
+    def member(self, index, times=slice(None)):
+        """Reads the trajectory of one member as a solution.
+
+        Args:
+            index (int): The member
+            times (slice or array_like): The time points
+
+        Returns:
+            solution: The solution of the member.
+        """
+        return mat.solution(
+            np.asarray(self.t[times]),
+            self.read(index, slice(None), times),
+            compartments=tuple(self.compartments),
+        )
+
+    def compartment(self, name, members=slice(None), times=slice(None)):
+        """Reads one compartment of several members.
+
+        Args:
+            name (str): The compartment
+            members (int, slice or array_like): The members
+            times (int, slice or array_like): The time points
+
+        Returns:
+            np.ndarray: The values, of shape (members, times).
+        """
+        return self.read(members, name, times)
+
+
+def open_columnar(path):
+    """Opens a columnar file for reading.
+
+    Args:
+        path (str): The file
+
+    Returns:
+        ColumnarFile: The memory-mapped file.
+    """
+    return ColumnarFile(path)
+
+
+def save(
+    path,
+    sol,
+    params=None,
+    metadata=None,
+    dtype=np.float64,
+    chunk=4096,
+    compartments=None,
+):
+    """Saves a solution or an ensemble solution.
+
+    Args:
+        path (str): The file
+        sol (solution): A solution with `y` of shape (C, T), or an ensemble
+            solution with `y` of shape (N, C, T)
+        params (dict): Arrays of shape (N,) keyed by parameter name
+        metadata (dict): JSON serializable description of the run
+        dtype (np.dtype): float64 or float32, the type of the trajectories
+        chunk (int): The number of time points per chunk
+        compartments (tuple): The names of the C compartments, by default
+            `sol.compartments`; for a solution which does not name them,
+            `COMPARTMENTS` for three and C0, C1, ... otherwise
+    """
+    y = sol.y if sol.y.ndim == 3 else sol.y[np.newaxis]
+    if compartments is None:
+        compartments = sol.compartments or _compartments(y.shape[1])
+    if len(compartments) != y.shape[1]:
+        raise ValueError(
+            f"{len(compartments)} compartment names for {y.shape[1]} compartments"
+        )
+    f = create(path, sol.t, len(y), params, metadata, dtype, chunk, compartments)
+    f.write(0, y)
+    f.flush()
@@ -0,0 +1,225 @@
+"""Parameter sweeps of the SIR model with vaccination over a process pool.
+
+The grid spans the infection rate, the recovery time, the vaccination rate
+and the vaccination window. It is split into shards which the workers solve
+with the ensemble solver and write straight into the memory-mapped
+columnar file ``trajectories.sir`` (see `utils.storage`), so no trajectory is
+sent back to the parent process. The file also holds the parameters of every
+grid point and the fixed settings of the sweep. ``summary.csv`` next to it
+lists the parameters, the peak of the infectious population, the day of the
+peak and the final recovered population of every grid point.
+
+Example:
+    python -m utils.sweep --beta 2e-7:6e-7:41 --recovery-time 3:10:8 \\
+        --vaccination-rate 0:4e4:21 --vaccination-window 50-70,50-91 \\
+        --duration 150 --output sweep
+"""
+
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import utils.mathematics as mat
+import utils.storage as storage
+
+DT = 0.05
+STEPS_PER_DAY = int(round(1 / DT))
+
+
+def make_grid(beta, recovery_time, vac_rate, vac_window):
+    """Creates the cartesian product of the swept parameters.
+
+    Args:
+        beta (array_like): The infection rates
+        recovery_time (array_like): The recovery times
+        vac_rate (array_like): The numbers of vaccinations per day
+        vac_window (list): (start, end) pairs of the vaccinations
+
+    Returns:
+        dict: Arrays of shape (N,) keyed by parameter name.
+    """
+    vac_window = np.asarray(vac_window, dtype=float).reshape(-1, 2)
+    b, rt, vr, w = np.meshgrid(
+        np.asarray(beta, dtype=float),
+        np.asarray(recovery_time, dtype=float),
+        np.asarray(vac_rate, dtype=float),
+        np.arange(len(vac_window)),
+        indexing="ij",
+    )
+    return {
+        "beta": b.ravel(),
+        "recovery_time": rt.ravel(),
+        "vaccination_rate": vr.ravel(),
+        "vaccination_start": vac_window[w.ravel(), 0],
+        "vaccination_end": vac_window[w.ravel(), 1],
+    }
+
+
+def _solve_shard(task):
+    """Solves one shard of the grid and writes it into the result files."""
+    path, start, stop, grid, settings = task
+    sol = mat.solve_SIR_with_vaccination_ensemble(
+        (0, settings["duration"]),
+        settings["y0"],
+        grid["vaccination_start"],
+        grid["vaccination_end"],
+        settings["with_multiwave"],
+        settings["t_3"],
+        grid["beta"],
+        1 / grid["recovery_time"],
+        settings["eff"],
+        grid["vaccination_rate"],
+        settings["a"],
+    )
+    peak = np.argmax(sol.y[:, 1, :], axis=1)
+    members = np.arange(stop - start)
+
+    block = storage.ColumnarFile(os.path.join(path, "trajectories.sir"), "r+")
+    block.write(start, sol.y[:, :, ::STEPS_PER_DAY])
+    block.flush()
+    summary = np.load(os.path.join(path, "summary.npy"), mmap_mode="r+")
+    summary[start:stop, 0] = sol.y[members, 1, peak]
+    summary[start:stop, 1] = sol.t[peak]
+    summary[start:stop, 2] = sol.y[:, 2, -1]
+    summary.flush()
+    return stop - start
+
+
+def run_sweep(
+    path,
+    grid,
+    duration,
+    y0=(1e6, 1, 0),
+    eff=0.9,
+    with_multiwave=False,
+    t_3=30,
+    a=0.01,
+    workers=None,
+    shard_size=256,
+    dtype=np.float32,
+):
+    """Solves every point of the grid and stores the results in `path`.
+
+    Args:
+        path (str): Output directory
+        grid (dict): Parameter arrays created by `make_grid`
+        duration (int): The duration of the simulation in days
+        y0 (tuple): The initial susceptible, infectious and recovered
+        eff (float): The vaccination efficiency
+        with_multiwave (bool): indicates if recovered people lose immunity
+        t_3 (float): delay after which recovered people start losing immunity
+        a (float): proportion of recovered people who lose immunity
+        workers (int): Number of worker processes, all cores by default
+        shard_size (int): Number of grid points solved per task
+        dtype (np.dtype): Type of the stored trajectories
+
+    Returns:
+        storage.ColumnarFile: The daily trajectories of the N grid points.
+    """
+    os.makedirs(path, exist_ok=True)
+    n = len(grid["beta"])
+    t = np.arange(0, duration, DT)[::STEPS_PER_DAY]
+    settings = {
+        "duration": duration,
+        "y0": [float(v) for v in y0],
+        "eff": eff,
+        "with_multiwave": with_multiwave,
+        "t_3": t_3,
+        "a": a,
+    }
+    storage.create(
+        os.path.join(path, "trajectories.sir"), t, n, grid, settings, dtype
+    ).flush()
+    np.lib.format.open_memmap(
+        os.path.join(path, "summary.npy"), "w+", np.float64, (n, 3)
+    ).flush()
+    tasks = (
+        (
+            path,
+            start,
+            min(start + shard_size, n),
+            {k: v[start : start + shard_size] for k, v in grid.items()},
+            settings,
+        )
+        for start in range(0, n, shard_size)
+    )
+    with ProcessPoolExecutor(workers) as pool:
+        for _ in pool.map(_solve_shard, tasks):
+            pass
+
+    summary = np.load(os.path.join(path, "summary.npy"))
+    with open(os.path.join(path, "summary.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([*grid, "peak_infectious", "peak_day", "final_recovered"])
+        writer.writerows(zip(*(grid[k].tolist() for k in grid), *summary.T.tolist()))
+    return storage.open_columnar(os.path.join(path, "trajectories.sir"))
+
+
+def parse_values(spec):
+    """Parses "a,b,c" as a list of values and "start:stop:num" as a linspace.
+
+    Args:
+        spec (str): The values
+
+    Returns:
+        np.ndarray: The parsed values.
+    """
+    if ":" in spec:
+        start, stop, num = spec.split(":")
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(value) for value in spec.split(",")])
+
+
+def parse_windows(spec):
+    """Parses "start-end,start-end" as a list of vaccination windows."""
+    return [
+        tuple(float(day) for day in window.split("-")) for window in spec.split(",")
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Sweep the SIR model with vaccination over a parameter grid."
+    )
+    parser.add_argument("--beta", type=parse_values, default="4e-7")
+    parser.add_argument("--recovery-time", type=parse_values, default="5")
+    parser.add_argument("--vaccination-rate", type=parse_values, default="20000")
+    parser.add_argument("--vaccination-window", type=parse_windows, default="50-70")
+    parser.add_argument("--vaccination-eff", type=float, default=0.9)
+    parser.add_argument("--susceptible", type=float, default=1e6)
+    parser.add_argument("--infectious", type=float, default=1)
+    parser.add_argument("--recovered", type=float, default=0)
+    parser.add_argument("--duration", type=int, default=150)
+    parser.add_argument("--multiwave", action="store_true")
+    parser.add_argument("--sw-a", type=float, default=0.01)
+    parser.add_argument("--sw-start", type=float, default=30)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=256)
+    parser.add_argument("--float64", action="store_true")
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args(argv)
+
+    grid = make_grid(
+        args.beta, args.recovery_time, args.vaccination_rate, args.vaccination_window
+    )
+    block = run_sweep(
+        args.output,
+        grid,
+        args.duration,
+        (args.susceptible, args.infectious, args.recovered),
+        args.vaccination_eff,
+        args.multiwave,
+        args.sw_start,
+        args.sw_a,
+        args.workers,
+        args.shard_size,
+        np.float64 if args.float64 else np.float32,
+    )
+    print(f"Solved {block.n_members} scenarios into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
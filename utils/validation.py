@@ -40,3 +40,93 @@ def validate_pos_float_under_one(value, param=None):
     if value < 0 or value > 1:
         raise ValueError(msg)
     return True
+
+
+SCENARIO_DEFAULTS = {
+    "susceptible": "1000000",
+    "infectious": "1",
+    "recovered": "0",
+    "duration": "150",
+    "beta": "4e-7",
+    "recovery_time": "5",
+    "sw_a": "0.01",
+    "sw_start": "30",
+    "vaccination_rate": "20000",
+    "vaccination_eff": "0.9",
+    "vaccination_start": "50",
+    "vaccination_end": "70",
+    "with_multiwave": False,
+    "with_vaccinations": False,
+}
+
+
+def _flag(value, param):
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ("1", "true", "yes", "on"):
+        return True
+    if str(value).strip().lower() in ("", "0", "false", "no", "off"):
+        return False
+    raise ValueError(f"Please make sure that '{param}' is true or false.")
+
+
+def validate_scenario(values):
+    """Validates a scenario given by the fields of the GUI and converts it.
+
+    Missing or empty fields take the defaults of the GUI. An "id" field is
+    passed through unchanged.
+
+    Args:
+        values (dict): The fields of the scenario
+
+    Returns:
+        dict: The scenario with every field converted to its type.
+
+    Raises:
+        ValueError: If a field is unknown or invalid.
+    """
+    unknown = set(values) - set(SCENARIO_DEFAULTS) - {"id"}
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}.")
+    values = {
+        **SCENARIO_DEFAULTS,
+        **{k: v for k, v in values.items() if v is not None and v != ""},
+    }
+
+    validate_positive_float_input(values["susceptible"], "susceptible")
+    validate_positive_float_input(values["infectious"], "infectious")
+    validate_positive_float_input(values["recovered"], "recovered")
+    validate_positive_float_input(values["beta"], "beta")
+    validate_positive_int_input(values["recovery_time"], "recovery time")
+    validate_positive_int_input(values["duration"], "duration")
+    validate_pos_float_under_one(values["sw_a"], "a")
+    validate_positive_int_input(values["sw_start"], "immunity loss start")
+    validate_positive_float_input(values["vaccination_rate"], "vaccination rate")
+    validate_pos_float_under_one(values["vaccination_eff"], "vaccination eff")
+    validate_positive_int_input(values["vaccination_start"], "vaccination start")
+    validate_positive_int_input(values["vaccination_end"], "vaccination end")
+    for field, name in (("recovery_time", "recovery time"), ("duration", "duration")):
+        if int(values[field]) == 0:
+            raise ValueError(
+                f"Please make sure that '{name}' is a positive, whole number."
+            )
+
+    scenario = {
+        "susceptible": int(float(values["susceptible"])),
+        "infectious": int(float(values["infectious"])),
+        "recovered": int(float(values["recovered"])),
+        "duration": int(values["duration"]),
+        "beta": float(values["beta"]),
+        "recovery_time": int(values["recovery_time"]),
+        "sw_a": float(values["sw_a"]),
+        "sw_start": int(values["sw_start"]),
+        "vaccination_rate": int(float(values["vaccination_rate"])),
+        "vaccination_eff": float(values["vaccination_eff"]),
+        "vaccination_start": int(values["vaccination_start"]),
+        "vaccination_end": int(values["vaccination_end"]),
+        "with_multiwave": _flag(values["with_multiwave"], "with_multiwave"),
+        "with_vaccinations": _flag(values["with_vaccinations"], "with_vaccinations"),
+    }
+    if "id" in values:
+        scenario["id"] = values["id"]
+    return scenario
@@ -0,0 +1,143 @@
+"""Background solves for the GUI.
+
+The solves requested from the GUI run on a worker thread, one at a time, and
+report back through ``window.write_event_value`` so the Tk event loop never
+blocks. Every request gets a new generation number: submitting a request
+cancels the one in flight, which stops at the next chunk of its integration,
+and the GUI ignores the events of any generation but the latest.
+
+The worker posts ``(generation, kind, payload)`` under its event key, where
+``kind`` is "progress" with the completed fraction and the chunk of the
+solution solved last, "done" with the result of the job or "error" with the
+exception it raised.
+"""
+
+import threading
+
+import utils.mathematics as mat
+
+CHUNK_DAYS = 10
+
+
+class Cancelled(Exception):
+    """Raised inside a job superseded by a newer one."""
+
+
+class Job:
+    """Handle given to a running job to report progress and check whether it
+    was cancelled.
+
+    Args:
+        worker (Worker): The worker running the job
+        generation (int): The generation of the job
+    """
+
+    def __init__(self, worker, generation):
+        self.worker = worker
+        self.generation = generation
+        self.cancelled = threading.Event()
+
+    def check(self):
+        """Raises `Cancelled` if a newer job superseded this one."""
+        if self.cancelled.is_set():
+            raise Cancelled
+
+    def report(self, fraction, part=None):
+        """Posts the completed fraction of the job and the chunk of the
+        solution solved last to the window."""
+        self.check()
+        self.worker.post(self.generation, "progress", (fraction, part))
+
+
+class Worker:
+    """Runs the latest submitted job on a background thread.
+
+    Args:
+        window (sg.Window): The window receiving the events
+        key (str): The key of the events
+    """
+
+    def __init__(self, window, key="-WORKER-"):
+        self.window = window
+        self.key = key
+        self.generation = 0
+        self.job = None
+        self.lock = threading.Lock()
+        self.running = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """Cancels the job in flight and starts `fn(*args, job=job, **kwargs)`.
+
+        Returns:
+            int: The generation of the new job.
+        """
+        with self.lock:
+            if self.job is not None:
+                self.job.cancelled.set()
+            self.generation += 1
+            self.job = Job(self, self.generation)
+            job = self.job
+        threading.Thread(
+            target=self._run, args=(job, fn, args, kwargs), daemon=True
+        ).start()
+        return job.generation
+
+    def cancel(self):
+        """Cancels the job in flight, if any."""
+        with self.lock:
+            if self.job is not None:
+                self.job.cancelled.set()
+                self.job = None
+            self.generation += 1
+
+    def is_current(self, generation):
+        """Whether the events of `generation` are still wanted."""
+        return generation == self.generation
+
+    def post(self, generation, kind, payload=None):
+        self.window.write_event_value(self.key, (generation, kind, payload))
+
+    def _run(self, job, fn, args, kwargs):
+        # Jobs run one at a time so the solution cache is never used
+        # concurrently; a superseded job gives up the lock at its next chunk.
+        with self.running:
+            try:
+                job.check()
+                result = fn(*args, job=job, **kwargs)
+                job.check()
+            except Cancelled:
+                return
+            except Exception as e:
+                self.post(job.generation, "error", e)
+                return
+            self.post(job.generation, "done", result)
+
+
+def solve_in_chunks(job, solver, time_range, *args, **kwargs):
+    """Solves with a cached solver in chunks of `CHUNK_DAYS` days.
+
+    Each chunk continues the previous one from its checkpoint (see
+    `utils.cache`), so the chunks cost as much as a single solve while the
+    job posts them as they are solved and can be cancelled between them.
+    Solves which cannot be continued run in one piece. The chunks are joined
+    here rather than looked up in the cache again, which would solve the
+    whole range once more when the solution does not fit the cache.
+
+    Args:
+        job (Job): The running job
+        solver (function): A solver wrapped by `utils.cache.cached`
+        time_range (tuple): The start and end of the simulation
+        *args: The other positional arguments of the solver
+        **kwargs: The keyword arguments of the solver
+
+    Returns:
+        solution: The solution over the whole time range.
+    """
+    start, end = time_range
+    if end <= start:
+        return solver(time_range, *args, **kwargs)
+    parts = []
+    for part in solver.stream(time_range, *args, chunk_days=CHUNK_DAYS, **kwargs):
+        job.report((part.t[-1] - start) / (end - start), part)
+        parts.append(part)
+    return parts[0] if len(parts) == 1 else mat.join(*parts)